@@ -0,0 +1 @@
+"""Benchmarks del servicio: fakes de WooCommerce y SIRETT, datos sembrados y corredores."""
@@ -0,0 +1,58 @@
+"""Catálogos sintéticos deterministas compartidos por los fakes y la siembra de BD.
+
+Todos los generadores parten del mismo catálogo base (SKU, nombre, precio,
+stock, familia, marca, imagen) para una semilla y tamaño dados, de modo que la
+tienda WooCommerce falsa, la bodega SOAP falsa y la BD sembrada coinciden
+salvo en la fracción de diferencias pedida.
+"""
+import random
+
+FAMILIES = 40
+BRANDS = 25
+
+
+def sku_for(i: int) -> str:
+    return f"BENCH{i:06d}"
+
+
+def catalog(size: int, seed: int = 42) -> list:
+    """Catálogo base de `size` productos."""
+    rng = random.Random(seed)
+    items = []
+    for i in range(size):
+        fam = rng.randrange(FAMILIES)
+        items.append({
+            "sku": sku_for(i),
+            "nombre": f"Producto de prueba {i}",
+            "precio": round(rng.uniform(1, 500), 2),
+            "stock": rng.randrange(1, 200),
+            "familia_id": fam + 1,
+            "familia": f"Familia {fam + 1}",
+            "marca": f"Marca {rng.randrange(BRANDS) + 1}",
+            "image": f"{sku_for(i)}.jpg",
+        })
+    return items
+
+
+def drifted(items: list, drift: float, seed: int = 42) -> list:
+    """Copia del catálogo con stock, precio o imagen cambiados en la fracción `drift`."""
+    rng = random.Random(seed + 1)
+    out = []
+    for item in items:
+        item = dict(item)
+        if rng.random() < drift:
+            what = rng.randrange(3)
+            if what == 0:
+                item["stock"] = item["stock"] + rng.randrange(1, 20)
+            elif what == 1:
+                item["precio"] = round(item["precio"] * 1.1, 2)
+            else:
+                item["image"] = f"{item['sku']}-v2.jpg"
+        out.append(item)
+    return out
+
+
+def split_missing(items: list, missing: float):
+    """Separa la cola del catálogo que no existe en WooCommerce: (presentes, faltantes)."""
+    cut = len(items) - int(len(items) * missing)
+    return items[:cut], items[cut:]
@@ -0,0 +1,152 @@
+"""Bodega SIRETT falsa (WSDL + SOAP 1.1) para benchmarks.
+
+Expone las operaciones wsp_request_bodega_all_items y
+wsc_request_bodega_all_items con el mismo formato de ítems que consume la API
+(codigo, descripcion, precio, stock, familia, marca, image_url), de modo que
+el costo de zeep (carga del WSDL, parseo y serialize_object) queda dentro de
+la medición. getDataClient apunta aquí con SIRETT_WSDL_URL, por ejemplo
+"http://127.0.0.1:8801/{host}/webservice.php?wsdl".
+"""
+import asyncio
+from collections import Counter
+from xml.sax.saxutils import escape
+from fastapi import FastAPI, Request, Response
+from benchmarks import data
+
+NS = "urn:sirett"
+
+_ITEM_FIELDS = (
+    ("codigo", "xsd:string"),
+    ("descripcion", "xsd:string"),
+    ("precio", "xsd:string"),
+    ("stock", "xsd:int"),
+    ("familia_id", "xsd:int"),
+    ("familia", "xsd:string"),
+    ("marca", "xsd:string"),
+    ("image_url", "xsd:string"),
+)
+
+_OPERATIONS = {
+    "wsp_request_bodega_all_items": "ws_pid",
+    "wsc_request_bodega_all_items": "ws_cid",
+}
+
+
+def _wsdl(location: str) -> str:
+    item = "".join(f'<xsd:element name="{n}" type="{t}" minOccurs="0"/>' for n, t in _ITEM_FIELDS)
+    elements, messages, port_ops, binding_ops = [], [], [], []
+    for op, id_field in _OPERATIONS.items():
+        elements.append(
+            f'<xsd:element name="{op}"><xsd:complexType><xsd:sequence>'
+            f'<xsd:element name="{id_field}" type="xsd:int"/>'
+            f'<xsd:element name="ws_passwd" type="xsd:string"/>'
+            f'<xsd:element name="bid" type="xsd:int"/>'
+            f'</xsd:sequence></xsd:complexType></xsd:element>'
+            f'<xsd:element name="{op}Response" type="tns:ItemsResponse"/>'
+        )
+        messages.append(
+            f'<message name="{op}In"><part name="parameters" element="tns:{op}"/></message>'
+            f'<message name="{op}Out"><part name="parameters" element="tns:{op}Response"/></message>'
+        )
+        port_ops.append(
+            f'<operation name="{op}"><input message="tns:{op}In"/><output message="tns:{op}Out"/></operation>'
+        )
+        binding_ops.append(
+            f'<operation name="{op}"><soap:operation soapAction="{NS}#{op}"/>'
+            f'<input><soap:body use="literal"/></input><output><soap:body use="literal"/></output></operation>'
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<definitions name="Sirett" targetNamespace="{NS}" xmlns:tns="{NS}" '
+        'xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/" '
+        'xmlns="http://schemas.xmlsoap.org/wsdl/">'
+        f'<types><xsd:schema targetNamespace="{NS}" elementFormDefault="unqualified">'
+        f'<xsd:complexType name="Item"><xsd:sequence>{item}</xsd:sequence></xsd:complexType>'
+        '<xsd:complexType name="ItemsResponse"><xsd:sequence>'
+        '<xsd:element name="status" type="xsd:string"/>'
+        '<xsd:element name="data" type="tns:Item" minOccurs="0" maxOccurs="unbounded"/>'
+        '</xsd:sequence></xsd:complexType>'
+        f'{"".join(elements)}</xsd:schema></types>'
+        f'{"".join(messages)}'
+        f'<portType name="SirettPort">{"".join(port_ops)}</portType>'
+        '<binding name="SirettBinding" type="tns:SirettPort">'
+        '<soap:binding style="document" transport="http://schemas.xmlsoap.org/soap/http"/>'
+        f'{"".join(binding_ops)}</binding>'
+        '<service name="SirettService"><port name="SirettPort" binding="tns:SirettBinding">'
+        f'<soap:address location="{escape(location)}"/></port></service>'
+        '</definitions>'
+    )
+
+
+class FakeBodega:
+    def __init__(self):
+        self.reset(0)
+
+    def reset(self, size: int, seed: int = 42, drift: float = 0.0, latency: float = 0.0):
+        self.latency = latency
+        self.requests = Counter()
+        self.items = data.drifted(data.catalog(size, seed), drift, seed)
+        self._body_cache = {}
+
+    def body(self, op: str, list_id: int) -> str:
+        key = (op, list_id if op == "wsc_request_bodega_all_items" else None)
+        cached = self._body_cache.get(key)
+        if cached is not None:
+            return cached
+        # Cada lista de precios (ws_cid) aplica su propio factor sobre el precio base
+        factor = 1.0 if key[1] is None else 1 + (list_id % 7) / 100
+        parts = []
+        for it in self.items:
+            parts.append(
+                "<data>"
+                f"<codigo>{escape(it['sku'])}</codigo>"
+                f"<descripcion>{escape(it['nombre'])}</descripcion>"
+                f"<precio>{round(it['precio'] * factor, 2)}</precio>"
+                f"<stock>{it['stock']}</stock>"
+                f"<familia_id>{it['familia_id']}</familia_id>"
+                f"<familia>{escape(it['familia'])}</familia>"
+                f"<marca>{escape(it['marca'])}</marca>"
+                f"<image_url>img/{escape(it['image'])}</image_url>"
+                "</data>"
+            )
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:tns="{NS}">'
+            f"<soap:Body><tns:{op}Response><status>ok</status>{''.join(parts)}</tns:{op}Response>"
+            "</soap:Body></soap:Envelope>"
+        )
+        self._body_cache[key] = body
+        return body
+
+
+bodega = FakeBodega()
+app = FastAPI(title="Fake SIRETT")
+
+
+@app.get("/{host}/webservice.php")
+async def wsdl(host: str, request: Request):
+    bodega.requests["wsdl"] += 1
+    location = str(request.url.replace(query=""))
+    return Response(_wsdl(location), media_type="text/xml")
+
+
+@app.post("/{host}/webservice.php")
+async def call(host: str, request: Request):
+    action = request.headers.get("soapaction", "").strip('"')
+    op = action.rsplit("#", 1)[-1]
+    if op not in _OPERATIONS:
+        return Response("Operación desconocida", status_code=500)
+    bodega.requests[op] += 1
+    raw = (await request.body()).decode()
+    list_id = 0
+    marker = f"<{_OPERATIONS[op]}>"
+    if marker in raw:
+        list_id = int(raw.split(marker, 1)[1].split("<", 1)[0])
+    if bodega.latency:
+        await asyncio.sleep(bodega.latency)
+    return Response(bodega.body(op, list_id), media_type="text/xml")
+
+
+@app.get("/__stats")
+async def stats():
+    return {"requests": dict(bodega.requests), "items": len(bodega.items)}
@@ -0,0 +1,207 @@
+"""Servidor WooCommerce REST falso para benchmarks.
+
+Implementa lo que usa wooCalls.WooCommerceAPI y services.images: listado
+paginado de productos (con X-WP-Total / X-WP-TotalPages y filtro por SKU),
+alta, actualización y lote de productos, categorías con búsqueda, subida de
+medios e imágenes servidas bajo /images. Se puede configurar latencia por
+petición y una tasa de errores 503, y cuenta las peticiones por endpoint.
+"""
+import time
+import random
+import asyncio
+import itertools
+from collections import Counter
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from benchmarks import data
+
+PREFIX = "/wp-json/wc/v3"
+
+
+class FakeStore:
+    def __init__(self):
+        self.base_url = ""
+        self.reset(0)
+
+    def reset(self, size: int, seed: int = 42, missing: float = 0.0, latency: float = 0.0,
+              jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = Counter()
+        self.products = {}
+        self.by_sku = {}
+        self.categories = {}
+        self._ids = itertools.count(1)
+        self._media_ids = itertools.count(100000)
+        present, _missing = data.split_missing(data.catalog(size, seed), missing)
+        now = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
+        for item in present:
+            cat_id = self.category_id(item["familia"])
+            product = {
+                "id": next(self._ids),
+                "sku": item["sku"],
+                "name": item["nombre"],
+                "regular_price": str(item["precio"]),
+                "stock_quantity": item["stock"],
+                "manage_stock": True,
+                "status": "publish",
+                "categories": [{"id": cat_id, "name": item["familia"]}],
+                "images": [self._image(item["image"])],
+                "date_modified_gmt": now,
+            }
+            self.products[product["id"]] = product
+            self.by_sku[product["sku"]] = product
+
+    def category_id(self, name: str, parent: int = 0) -> int:
+        entry = self.categories.get(name)
+        if entry is None:
+            entry = self.categories[name] = {"id": next(self._ids), "name": name, "parent": parent}
+        return entry["id"]
+
+    def _image(self, name: str, src: str = None) -> dict:
+        return {"id": next(self._media_ids), "src": src or f"{self.base_url}/images/{name}", "name": name}
+
+    def _apply(self, product: dict, payload: dict):
+        for key in ("sku", "name", "regular_price", "stock_quantity", "manage_stock", "status", "type"):
+            if key in payload:
+                product[key] = payload[key]
+        if "categories" in payload:
+            by_id = {c["id"]: c for c in self.categories.values()}
+            product["categories"] = [
+                {"id": c.get("id"), "name": by_id.get(c.get("id"), {}).get("name", "")}
+                for c in payload["categories"]
+            ]
+        if "images" in payload:
+            product["images"] = [
+                {"id": img["id"], "src": f"{self.base_url}/images/media-{img['id']}", "name": f"media-{img['id']}"}
+                if "id" in img and "src" not in img
+                else self._image(img.get("name") or img["src"].rsplit("/", 1)[-1], img.get("src"))
+                for img in payload["images"]
+            ]
+        product["date_modified_gmt"] = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
+
+    def create(self, payload: dict) -> dict:
+        product = {"id": next(self._ids), "categories": [], "images": []}
+        self._apply(product, payload)
+        self.products[product["id"]] = product
+        if product.get("sku"):
+            self.by_sku[product["sku"]] = product
+        return product
+
+    def update(self, product_id: int, payload: dict):
+        product = self.products.get(product_id)
+        if product is None:
+            return None
+        self._apply(product, payload)
+        return product
+
+
+store = FakeStore()
+app = FastAPI(title="Fake WooCommerce")
+
+
+def _endpoint(path: str) -> str:
+    parts = [("{id}" if p.isdigit() else p) for p in path.split("/")]
+    return "/".join(parts)
+
+
+@app.middleware("http")
+async def simulate(request: Request, call_next):
+    path = request.url.path
+    if path.startswith("/__"):
+        return await call_next(request)
+    store.requests[f"{request.method} {_endpoint(path)}"] += 1
+    if store.latency or store.jitter:
+        await asyncio.sleep(store.latency + store.rng.uniform(0, store.jitter))
+    if store.error_rate and path.startswith("/wp-json") and store.rng.random() < store.error_rate:
+        return JSONResponse({"code": "simulated_error", "message": "Error simulado"}, status_code=503)
+    return await call_next(request)
+
+
+@app.get(PREFIX + "/products")
+async def list_products(response: Response, page: int = 1, per_page: int = 10, sku: str = None,
+                        modified_after: str = None, category: int = None, stock_status: str = None):
+    if sku is not None:
+        product = store.by_sku.get(sku)
+        return [product] if product else []
+    items = list(store.products.values())
+    if modified_after:
+        items = [p for p in items if p.get("date_modified_gmt", "") > modified_after]
+    if category is not None:
+        items = [p for p in items if any(c.get("id") == category for c in p.get("categories", []))]
+    if stock_status == "instock":
+        items = [p for p in items if (p.get("stock_quantity") or 0) > 0]
+    per_page = max(1, min(per_page, 100))
+    total = len(items)
+    response.headers["X-WP-Total"] = str(total)
+    response.headers["X-WP-TotalPages"] = str(max(1, -(-total // per_page)))
+    start = (page - 1) * per_page
+    return items[start:start + per_page]
+
+
+@app.post(PREFIX + "/products", status_code=201)
+async def create_product(request: Request):
+    payload = await request.json()
+    if payload.get("sku") and payload["sku"] in store.by_sku:
+        return JSONResponse({"code": "product_invalid_sku", "message": "SKU duplicado"}, status_code=400)
+    return store.create(payload)
+
+
+@app.put(PREFIX + "/products/{product_id}")
+async def update_product(product_id: int, request: Request):
+    product = store.update(product_id, await request.json())
+    if product is None:
+        return JSONResponse({"code": "woocommerce_rest_product_invalid_id"}, status_code=404)
+    return product
+
+
+@app.post(PREFIX + "/products/batch")
+async def batch(request: Request):
+    payload = await request.json()
+    result = {"create": [], "update": [], "delete": []}
+    for item in payload.get("create", []):
+        result["create"].append(store.create(item))
+    for item in payload.get("update", []):
+        product = store.update(item.get("id"), item)
+        result["update"].append(product or {"id": item.get("id"), "error": {"code": "invalid_id"}})
+    for product_id in payload.get("delete", []):
+        result["delete"].append(store.products.pop(product_id, {"id": product_id}))
+    return result
+
+
+@app.get(PREFIX + "/products/categories")
+async def list_categories(search: str = None):
+    cats = list(store.categories.values())
+    if search:
+        needle = search.lower()
+        cats = [c for c in cats if needle in c["name"].lower()]
+    return cats[:10]
+
+
+@app.post(PREFIX + "/products/categories", status_code=201)
+async def create_category(request: Request):
+    payload = await request.json()
+    cat_id = store.category_id(payload["name"], payload.get("parent", 0))
+    return store.categories[payload["name"]] | {"id": cat_id}
+
+
+@app.post("/wp-json/wp/v2/media", status_code=201)
+async def upload_media(request: Request):
+    await request.body()
+    media_id = next(store._media_ids)
+    return {"id": media_id, "source_url": f"{store.base_url}/images/media-{media_id}"}
+
+
+_PIXEL = bytes.fromhex("ffd8ffe000104a46494600010100000100010000ffd9")
+
+
+@app.api_route("/images/{name}", methods=["GET", "HEAD"])
+async def image(name: str):
+    return Response(_PIXEL, media_type="image/jpeg")
+
+
+@app.get("/__stats")
+async def stats():
+    return {"requests": dict(store.requests), "products": len(store.products), "categories": len(store.categories)}
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""Prueba de carga HTTP de los endpoints de lectura contra fakes locales.
+
+Lanza clientes concurrentes contra /health, /items/{client}, /inventory/{client}
+y /soap/{client}/bodega_items con una mezcla configurable y reporta, por
+endpoint y en total, throughput, latencias p50/p95/p99, tasa de errores y el
+lag del event loop de la API (utils.loop_lag).
+
+Modos:
+  - inprocess (por defecto): la app corre en el mismo loop que el generador
+    (httpx.ASGITransport); el lag se lee directamente del monitor.
+  - uvicorn: la API corre como subproceso `uvicorn main:app` (--workers), y el
+    lag se calcula con los buckets de event_loop_lag_seconds de /metrics (con
+    varios workers refleja solo el que responde a /metrics).
+
+Por defecto el generador es de lazo cerrado (cada cliente espera su
+respuesta); con --rate pasa a lazo abierto a ese total de peticiones por
+segundo, y la latencia se mide desde el instante en que la petición debía
+salir, de modo que la espera por falta de clientes libres también cuenta.
+
+Uso:
+    python -m benchmarks.load --concurrency 32 --duration 30
+    python -m benchmarks.load --mode uvicorn --workers 2 --mix health=1,items=1 --rate 50
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+from benchmarks.e2e import API_CLIENT, SOAP_CLIENT, _serve, _configure_env, _free_port
+
+ENDPOINTS = {
+    "health": "/health",
+    "items": f"/items/{API_CLIENT}",
+    "inventory": f"/inventory/{API_CLIENT}",
+    "bodega_items": f"/soap/{SOAP_CLIENT}/bodega_items",
+}
+DEFAULT_MIX = "health=4,items=2,bodega_items=2,inventory=1"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de los endpoints de lectura")
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="Workers de uvicorn (modo uvicorn)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clientes concurrentes")
+    parser.add_argument("--duration", type=float, default=20.0, help="Duración de la medición (s)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Calentamiento descartado (s)")
+    parser.add_argument("--rate", type=float, help="Peticiones por segundo en lazo abierto (por defecto lazo cerrado)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Pesos por endpoint ({', '.join(ENDPOINTS)})")
+    parser.add_argument("--size", type=int, default=200, help="Tamaño del catálogo de los fakes")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latencia por petición a WooCommerce (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latencia aleatoria adicional máxima (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 503 de WooCommerce")
+    parser.add_argument("--soap-latency", type=float, default=0.0, help="Latencia por llamada SOAP (s)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Timeout por petición (s)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--provider", choices=("soap", "db"), default="soap",
+                        help="Fuente local de /items (db requiere --db-url)")
+    parser.add_argument("--db-url", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="BD MySQL de benchmark (env BENCH_DATABASE_URL)")
+    parser.add_argument("--output", help="Ruta donde guardar los resultados en JSON")
+    args = parser.parse_args(argv)
+    args.image_check = False
+    return args
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Endpoint desconocido en --mix: {name}")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise SystemExit("--mix no tiene pesos positivos")
+    return mix
+
+
+async def _send(api, name: str, intended: float, samples: list):
+    try:
+        resp = await api.get(ENDPOINTS[name])
+        status = resp.status_code
+    except Exception as e:
+        status = type(e).__name__
+    samples.append((name, time.perf_counter() - intended, status))
+
+
+async def _closed_loop(api, mix: dict, args, seconds: float, rng: random.Random) -> list:
+    samples = []
+    names, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + seconds
+
+    async def client():
+        while time.perf_counter() < deadline:
+            await _send(api, rng.choices(names, weights)[0], time.perf_counter(), samples)
+
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    return samples
+
+
+async def _open_loop(api, mix: dict, args, seconds: float, rng: random.Random) -> list:
+    samples = []
+    names, weights = list(mix), list(mix.values())
+    slots = asyncio.Semaphore(args.concurrency)
+    interval = 1 / args.rate
+    start = time.perf_counter()
+    tasks = []
+
+    async def fire(name, intended):
+        async with slots:
+            await _send(api, name, intended, samples)
+
+    i = 0
+    while True:
+        intended = start + i * interval
+        if intended - start >= seconds:
+            break
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(fire(rng.choices(names, weights)[0], intended)))
+        i += 1
+    await asyncio.gather(*tasks)
+    return samples
+
+
+def summarize(samples: list, seconds: float) -> dict:
+    from utils.loop_lag import summarize as pcts
+    groups = {}
+    for name, latency, status in samples:
+        groups.setdefault(name, []).append((latency, status))
+    groups["total"] = [(latency, status) for _, latency, status in samples]
+    out = {}
+    for name, rows in groups.items():
+        statuses = Counter(str(s) for _, s in rows)
+        errors = sum(n for s, n in statuses.items() if not (s.isdigit() and int(s) < 400))
+        out[name] = {
+            "requests": len(rows),
+            "rps": round(len(rows) / seconds, 2) if seconds else None,
+            "errors": errors,
+            "errorRate": round(errors / len(rows), 4) if rows else 0.0,
+            "statuses": dict(statuses),
+            "latency": pcts(latency for latency, _ in rows),
+        }
+    return out
+
+
+_BUCKET_RE = re.compile(r'^event_loop_lag_seconds_bucket\{le="([^"]+)"\} (\S+)$', re.M)
+_COUNT_RE = re.compile(r"^event_loop_lag_seconds_count (\S+)$", re.M)
+
+
+async def _scrape_lag(api) -> dict:
+    text = (await api.get("/metrics")).text
+    buckets = {le: float(v) for le, v in _BUCKET_RE.findall(text)}
+    count = _COUNT_RE.search(text)
+    return {"buckets": buckets, "count": float(count.group(1)) if count else 0.0}
+
+
+def _lag_from_buckets(before: dict, after: dict) -> dict:
+    """Percentiles aproximados (cota superior del bucket) del lag entre dos lecturas de /metrics."""
+    count = after["count"] - before["count"]
+    result = {"count": int(count), "approx": "bucket upper bound"}
+    if count <= 0:
+        return result | {"p50": None, "p95": None, "p99": None}
+    bounds = sorted(after["buckets"], key=lambda le: float(le))
+    for q in (0.50, 0.95, 0.99):
+        for le in bounds:
+            if after["buckets"][le] - before["buckets"].get(le, 0.0) >= q * count:
+                result[f"p{int(q * 100)}"] = float(le)
+                break
+    return result
+
+
+async def _run(api, args, mix: dict, lag_reader) -> dict:
+    from utils import loop_lag
+    rng = random.Random(args.seed)
+    drive = _open_loop if args.rate else _closed_loop
+    if args.warmup > 0:
+        await drive(api, mix, args, args.warmup, rng)
+    # El generador también corre en un loop: su lag dice si el cliente fue el cuello de botella
+    client_lag = loop_lag.LoopLagMonitor(0.05)
+    client_lag.start()
+    before = await lag_reader.begin()
+    start = time.perf_counter()
+    samples = await drive(api, mix, args, args.duration, rng)
+    seconds = time.perf_counter() - start
+    lag = await lag_reader.end(before)
+    await client_lag.stop()
+    return {
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "rate": args.rate,
+        "seconds": round(seconds, 3),
+        "endpoints": summarize(samples, seconds),
+        "loopLag": lag,
+        "clientLoopLag": client_lag.stats(),
+    }
+
+
+class _MonitorLag:
+    """Lag del loop de la app en el mismo proceso."""
+
+    async def begin(self):
+        from utils import loop_lag
+        loop_lag.monitor.reset()
+
+    async def end(self, _before):
+        from utils import loop_lag
+        return loop_lag.monitor.stats()
+
+
+class _MetricsLag:
+    """Lag del loop de la app en otro proceso, a partir de /metrics."""
+
+    def __init__(self, api):
+        self.api = api
+
+    async def begin(self):
+        return await _scrape_lag(self.api)
+
+    async def end(self, before):
+        return _lag_from_buckets(before, await _scrape_lag(self.api))
+
+
+async def _inprocess(args, mix: dict) -> dict:
+    import httpx
+    import main as api_module
+    from dbConn import engine
+    engine.sync_engine.echo = False
+    app = api_module.app
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with app.router.lifespan_context(app):
+        # Excepciones no manejadas como 500, igual que detrás de uvicorn
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api",
+                                     timeout=args.timeout, limits=limits) as api:
+            return await _run(api, args, mix, _MonitorLag())
+
+
+def _start_uvicorn(args) -> tuple:
+    port = _free_port()
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(args.workers), "--no-access-log", "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=os.environ.copy())
+    return proc, f"http://127.0.0.1:{port}"
+
+
+async def _wait_ready(api, proc, seconds: float = 30):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn terminó con código {proc.returncode}")
+        try:
+            if (await api.get("/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("La API no respondió a /health a tiempo")
+
+
+async def _uvicorn(args, mix: dict) -> dict:
+    import httpx
+    proc, url = _start_uvicorn(args)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as api:
+            await _wait_ready(api, proc)
+            return await _run(api, args, mix, _MetricsLag(api))
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def _ms(value) -> str:
+    return f"{value * 1e3:.1f}" if value is not None else "-"
+
+
+def _print_report(result: dict):
+    header = f"{'endpoint':<14}{'req':>8}{'req/s':>9}{'errores':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'máx ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in result["endpoints"].items():
+        lat = r["latency"]
+        print(
+            f"{name:<14}{r['requests']:>8}{r['rps']:>9}{r['errorRate']:>9.1%}"
+            f"{_ms(lat['p50']):>9}{_ms(lat['p95']):>9}{_ms(lat['p99']):>9}{_ms(lat['max']):>9}"
+        )
+    lag, client = result["loopLag"], result["clientLoopLag"]
+    print(f"\nLag del event loop de la API: p50 {_ms(lag.get('p50'))} ms, p95 {_ms(lag.get('p95'))} ms, "
+          f"p99 {_ms(lag.get('p99'))} ms, máx {_ms(lag.get('max'))} ms ({lag.get('count', 0)} muestras)")
+    print(f"Lag del generador: p99 {_ms(client['p99'])} ms, máx {_ms(client['max'])} ms")
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    mix = parse_mix(args.mix)
+    if args.provider == "db" and not args.db_url:
+        raise SystemExit("--provider db requiere --db-url / BENCH_DATABASE_URL")
+    from benchmarks import fake_woo, fake_soap
+    woo_url = _serve(fake_woo.app)
+    fake_woo.store.base_url = woo_url
+    soap_url = _serve(fake_soap.app)
+    fake_woo.store.reset(args.size, args.seed, 0.0, args.latency, args.jitter, args.error_rate)
+    fake_soap.bodega.reset(args.size, args.seed, 0.0, args.soap_latency)
+    if args.db_url:
+        from benchmarks import seed
+        asyncio.run(seed.seed(args.db_url, args.size, args.seed))
+    with tempfile.TemporaryDirectory(prefix="load-") as workdir:
+        _configure_env(args, woo_url, soap_url, workdir)
+        os.environ["LOG_FILE"] = ""
+        runner = _uvicorn if args.mode == "uvicorn" else _inprocess
+        result = asyncio.run(runner(args, mix))
+    result["mix"] = mix
+    result["size"] = args.size
+    _print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Resultados guardados en {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
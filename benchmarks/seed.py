@@ -0,0 +1,137 @@
+"""Esquema y siembra de una BD MySQL de benchmark.
+
+Crea las tablas que usa la API (productos, marcas, subfamilia, prodsChanges,
+listaprecio, preciodetalle) y versiones mínimas de los procedimientos
+obtener_datos_productos y getChangedProds con las mismas columnas de salida
+que los de producción. Borra y recrea todo: por seguridad solo acepta bases
+cuyo nombre contenga "bench".
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from benchmarks import data
+
+PROV_ID = 1
+
+_DDL = [
+    "DROP PROCEDURE IF EXISTS obtener_datos_productos",
+    "DROP PROCEDURE IF EXISTS getChangedProds",
+    "DROP TABLE IF EXISTS preciodetalle, listaprecio, prodsChanges, productos, subfamilia, marcas",
+    """CREATE TABLE marcas (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        descripcion VARCHAR(120) NOT NULL,
+        provId INT NOT NULL,
+        KEY (descripcion, provId)
+    )""",
+    """CREATE TABLE subfamilia (
+        famId INT NOT NULL,
+        descripcion VARCHAR(120) NOT NULL,
+        provId INT NOT NULL,
+        PRIMARY KEY (famId, provId)
+    )""",
+    """CREATE TABLE productos (
+        sku VARCHAR(64) PRIMARY KEY,
+        nombre VARCHAR(255) NOT NULL,
+        marcaId INT,
+        subfamId INT,
+        stock INT NOT NULL DEFAULT 0,
+        precio DECIMAL(12, 2) NOT NULL DEFAULT 0,
+        imageUrl VARCHAR(512),
+        provId INT NOT NULL,
+        KEY (provId)
+    )""",
+    """CREATE TABLE prodsChanges (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        sku VARCHAR(64) NOT NULL,
+        tipo VARCHAR(20) NOT NULL,
+        provId INT NOT NULL
+    )""",
+    """CREATE TABLE listaprecio (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        descrip VARCHAR(60) NOT NULL UNIQUE,
+        prov INT NOT NULL
+    )""",
+    """CREATE TABLE preciodetalle (
+        sku VARCHAR(64) NOT NULL,
+        precio DECIMAL(12, 2) NOT NULL,
+        listId INT NOT NULL,
+        PRIMARY KEY (listId, sku)
+    )""",
+    """CREATE PROCEDURE obtener_datos_productos(IN userId INT)
+    SELECT p.sku AS Sku, p.nombre AS Name, p.precio AS FinalPrice, p.stock AS Stock,
+           s.descripcion AS FamilySirett, NULL AS idFamWP, p.imageUrl AS Image
+    FROM productos p
+    LEFT JOIN subfamilia s ON s.famId = p.subfamId AND s.provId = p.provId""",
+    """CREATE PROCEDURE getChangedProds(IN userId INT)
+    SELECT c.sku AS Sku, p.nombre AS Name, CONCAT('Bench > ', s.descripcion) AS FamilyxExport,
+           p.imageUrl AS Image, p.stock AS Stock, 1 AS Sync, c.tipo AS Tipo, p.precio AS FinalPrice
+    FROM prodsChanges c
+    JOIN productos p ON p.sku = c.sku
+    LEFT JOIN subfamilia s ON s.famId = p.subfamId AND s.provId = p.provId
+    ORDER BY c.id""",
+]
+
+
+def check_url(url: str):
+    database = make_url(url).database or ""
+    if "bench" not in database.lower():
+        raise ValueError(f"La BD de benchmark debe llamarse *bench* (recibido '{database}'); se borran sus tablas")
+
+
+async def seed(url: str, size: int, seed: int = 42, missing: float = 0.05, changes: float = 0.1,
+               siret_host: str = "bench.sirett") -> dict:
+    """Recrea el esquema y siembra `size` productos; devuelve conteos de lo sembrado.
+
+    La BD guarda el catálogo base con las URLs de imagen en el formato de
+    soap-store (https://{siret_host}/img/...), así soap-store solo ve como
+    cambios las diferencias de la bodega. prodsChanges recibe la fracción
+    `changes` del catálogo como 'Actualizado' y los productos faltantes en la
+    tienda como 'Nuevo'.
+    """
+    check_url(url)
+    items = data.catalog(size, seed)
+    present, absent = data.split_missing(items, missing)
+    engine = create_async_engine(url)
+    try:
+        async with engine.begin() as conn:
+            for statement in _DDL:
+                await conn.execute(text(statement))
+            families = {(it["familia_id"], it["familia"]) for it in items}
+            await conn.execute(
+                text("INSERT INTO subfamilia (famId, descripcion, provId) VALUES (:f, :d, :p)"),
+                [{"f": f, "d": d, "p": PROV_ID} for f, d in sorted(families)],
+            )
+            brands = sorted({it["marca"] for it in items})
+            await conn.execute(
+                text("INSERT INTO marcas (descripcion, provId) VALUES (:d, :p)"),
+                [{"d": b, "p": PROV_ID} for b in brands],
+            )
+            brand_ids = {b: i + 1 for i, b in enumerate(brands)}
+            rows = [
+                {
+                    "s": it["sku"], "n": it["nombre"], "m": brand_ids[it["marca"]], "sf": it["familia_id"],
+                    "st": it["stock"], "pr": it["precio"], "iu": f"https://{siret_host}/img/{it['image']}",
+                    "p": PROV_ID,
+                }
+                for it in items
+            ]
+            for i in range(0, len(rows), 5000):
+                await conn.execute(
+                    text(
+                        "INSERT INTO productos (sku, nombre, marcaId, subfamId, stock, precio, imageUrl, provId)"
+                        " VALUES (:s, :n, :m, :sf, :st, :pr, :iu, :p)"
+                    ),
+                    rows[i:i + 5000],
+                )
+            step = max(1, int(1 / changes)) if changes > 0 else 0
+            updated = present[::step] if step else []
+            change_rows = [{"s": it["sku"], "t": "Actualizado", "p": PROV_ID} for it in updated]
+            change_rows += [{"s": it["sku"], "t": "Nuevo", "p": PROV_ID} for it in absent]
+            if change_rows:
+                await conn.execute(
+                    text("INSERT INTO prodsChanges (sku, tipo, provId) VALUES (:s, :t, :p)"),
+                    change_rows,
+                )
+    finally:
+        await engine.dispose()
+    return {"productos": len(rows), "prodsChanges": len(change_rows)}
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Daemon CDC: envía los cambios de prodsChanges a WooCommerce casi en tiempo real.
+
+Reemplaza las fases syncPersonal y de limpieza de sync_all.py (que puede
+seguir corriendo soap-store con --skip-sync --no-clear). Ver services/cdc.py.
+"""
+import sys
+import signal
+import asyncio
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services import cdc
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sincronización continua de prodsChanges")
+    parser.add_argument("--clients", help="Clientes separados por coma (default: todos los de syncPersonal)")
+    parser.add_argument("--interval", type=float, default=cdc.POLL_INTERVAL,
+                        help="Segundos entre consultas (env CDC_POLL_INTERVAL)")
+    parser.add_argument("--once", action="store_true", help="Procesar un solo micro-lote por cliente y salir")
+    return parser.parse_args(argv)
+
+
+async def _main(args) -> int:
+    from dbConn import engine
+    from wooCalls import close_clients
+    all_clients = cdc.sync_clients()
+    clients = [c.strip() for c in args.clients.split(",") if c.strip()] if args.clients else all_clients
+    if not clients:
+        print("No hay clientes con dbId en CLIENTS_API_JSON")
+        return 1
+    daemon = cdc.CdcDaemon(clients, all_clients=set(clients) >= set(all_clients))
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, daemon.stop)
+    try:
+        if args.once:
+            results = await daemon.run_once()
+            for r in results:
+                print(r)
+            return 1 if any("error" in r for r in results) else 0
+        await daemon.run(args.interval)
+        return 0
+    finally:
+        await close_clients()
+        await engine.dispose()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.exit(asyncio.run(_main(args)))
+
+
+if __name__ == '__main__':
+    main()
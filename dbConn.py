@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sess
 from sqlalchemy import text
 from dotenv import load_dotenv
 import os
+from utils.metrics import instrument_engine
 
 # Conexion DataBase
 load_dotenv()
@@ -16,6 +17,8 @@ engine = create_async_engine(
     echo=True,
 )
 AsyncSessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False)
+# Conteo y latencia por procedimiento/tabla para /metrics
+instrument_engine(engine.sync_engine)
   
 # Set a per-connection statement timeout to avoid long-hanging queries (PostgreSQL)
 from sqlalchemy import event
@@ -32,24 +35,36 @@ def set_statement_timeout(dbapi_connection, connection_record):
 
 #Consulta Inventario x Cliente
 
+def _map_prod_rows(rows) -> list:
+    """Filas de obtener_datos_productos al formato local de productos."""
+    return [
+        {
+            "sku": row.Sku,
+            "nombre": row.Name,
+            "precio": row.FinalPrice,
+            "stock": row.Stock,
+            "categoria": row.FamilySirett,
+            "categoriaWpId": row.idFamWP,
+            "image": row.Image,
+            "imageName": urlparse(row.Image).path.split("/")[-1]
+        }
+        for row in rows
+    ]
+
 async def getProds(userId: int):
     async with AsyncSessionLocal() as session:
         result = await session.execute(
             text("CALL obtener_datos_productos(:userId)"),
             {"userId": userId},
         )
-        rows = result.fetchall()
-        productos = [
-            {
-                "sku": row.Sku,
-                "nombre": row.Name,
-                "precio": row.FinalPrice,
-                "stock": row.Stock,
-                "categoria": row.FamilySirett,
-                "categoriaWpId": row.idFamWP,
-                "image": row.Image,
-                "imageName": urlparse(row.Image).path.split("/")[-1]
-            }
-            for row in rows
-        ]
-        return productos
+        return _map_prod_rows(result.fetchall())
+
+async def streamProds(userId: int, chunk: int = 1000):
+    """Como getProds, pero entrega los productos en bloques a medida que llegan (cursor del lado del servidor)."""
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(
+            text("CALL obtener_datos_productos(:userId)"),
+            {"userId": userId},
+        )
+        async for rows in result.partitions(chunk):
+            yield _map_prod_rows(rows)
@@ -1,9 +1,10 @@
 import json
+import time
 import asyncio
-import requests
-from zeep import Client as ZeepClient
-from zeep.transports import Transport
-from zeep.helpers import serialize_object
+import threading
+from utils.metrics import SOAP_REQUESTS, SOAP_LATENCY
+from utils import tracing, startup
+from services import cpu_pool
 
 
 # Cargar credenciales desde la variable de entorno CLIENTS_API_JSON
@@ -29,6 +30,132 @@ try:
 except json.JSONDecodeError:
     _soap_credentials = []
 
+# Plantilla de la URL del WSDL; {host} es el siretUrl del cliente (los benchmarks apuntan a un fake)
+SIRETT_WSDL_URL = os.getenv("SIRETT_WSDL_URL", "https://{host}:443/webservice.php?wsdl")
+
+# Segundos que se reutiliza un WSDL ya cargado antes de volver a descargarlo (0: cargarlo en cada llamada)
+SOAP_WSDL_TTL = float(os.getenv("SOAP_WSDL_TTL", "3600"))
+
+# URL del WSDL -> (cliente zeep, momento de carga)
+_wsdl_clients = {}
+_wsdl_locks = {}
+_wsdl_locks_guard = threading.Lock()
+
+def _wsdl_client(siret_url: str, timings: list):
+    """Cliente zeep con el WSDL del host ya cargado, reutilizado entre llamadas.
+
+    zeep (y con él lxml) y requests se importan aquí, con la primera llamada
+    SOAP: los workers que solo atienden clientes DB no los cargan.
+    """
+    # Construir URL del WSDL
+    wsdl_url = SIRETT_WSDL_URL.format(host=siret_url)
+    cached = _wsdl_clients.get(wsdl_url)
+    if cached is not None and time.monotonic() - cached[1] < SOAP_WSDL_TTL:
+        return cached[0]
+    with _wsdl_locks_guard:
+        lock = _wsdl_locks.setdefault(wsdl_url, threading.Lock())
+    # Un solo hilo descarga y parsea el WSDL de cada host; los demás esperan y lo reutilizan
+    with lock:
+        cached = _wsdl_clients.get(wsdl_url)
+        if cached is not None and time.monotonic() - cached[1] < SOAP_WSDL_TTL:
+            return cached[0]
+        zeep = startup.lazy_import("zeep")
+        transports = startup.lazy_import("zeep.transports")
+        requests = startup.lazy_import("requests")
+        # Crear sesión requests sin influir de proxies de entorno
+        session = requests.Session()
+        session.trust_env = False
+        # Cliente sincrónico Zeep con timeout (10s) para evitar colgado indefinido
+        transport = transports.Transport(session=session, timeout=10)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            with tracing.span("soap wsdl", cat="soap", host=siret_url):
+                client = zeep.Client(wsdl=wsdl_url, transport=transport)
+            status = None
+        finally:
+            timings.append(("wsdl", time.perf_counter() - start, status))
+        _wsdl_clients[wsdl_url] = (client, time.monotonic())
+        return client
+
+def _observe(siret_url: str, timings: list):
+    """Registra las mediciones (operación, segundos, estado) de una llamada; estado None solo cuenta latencia."""
+    for operation, seconds, status in timings:
+        SOAP_LATENCY.observe(seconds, host=siret_url, operation=operation)
+        if status is not None:
+            SOAP_REQUESTS.inc(host=siret_url, operation=operation, status=status)
+
+def preload_wsdl(siret_url: str):
+    """Carga el WSDL del host por adelantado (warm-up)."""
+    timings = []
+    try:
+        _wsdl_client(siret_url, timings)
+    finally:
+        _observe(siret_url, timings)
+
+def _soap_call(siret_url: str, operation: str, params: dict, timings: list):
+    client = _wsdl_client(siret_url, timings)
+    start = time.perf_counter()
+    status = "error"
+    try:
+        # Invocar operación con parámetros nombrados
+        with tracing.span(f"soap {operation}", cat="soap", host=siret_url):
+            response = getattr(client.service, operation)(**params)
+        status = "ok"
+    finally:
+        timings.append((operation, time.perf_counter() - start, status))
+    # Serializar objeto Zeep a tipos nativos Python
+    start = time.perf_counter()
+    with tracing.span("soap serialize", cat="soap"):
+        data = startup.lazy_import("zeep.helpers").serialize_object(response)
+    timings.append(("serialize", time.perf_counter() - start, None))
+    return data
+
+def _call_soap(siret_url: str, operation: str, **params):
+    """Carga el WSDL e invoca la operación, registrando métricas por host y operación."""
+    timings = []
+    try:
+        return _soap_call(siret_url, operation, params, timings)
+    finally:
+        _observe(siret_url, timings)
+
+def _pack_soap(value):
+    """Listas de ítems (dicts con las mismas claves) como Table para volver del proceso hijo."""
+    if isinstance(value, dict):
+        return {k: _pack_soap(v) for k, v in value.items()}
+    if isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+        keys = tuple(value[0])
+        if all(len(v) == len(keys) for v in value):
+            return cpu_pool.pack(value, keys)
+    return value
+
+def _unpack_soap(value):
+    if isinstance(value, cpu_pool.Table):
+        return cpu_pool.unpack(value)
+    if isinstance(value, dict):
+        return {k: _unpack_soap(v) for k, v in value.items()}
+    return value
+
+def _call_soap_packed(siret_url: str, operation: str, params: dict) -> tuple:
+    """Llamada completa en un proceso del pool: (datos compactos, mediciones, error).
+
+    El parseo de zeep y serialize_object de respuestas grandes corren en el
+    hijo; las métricas se devuelven para registrarlas en el proceso de la API.
+    """
+    timings = []
+    try:
+        data = _soap_call(siret_url, operation, params, timings)
+    except Exception as e:
+        return None, timings, str(e) or repr(e)
+    return _pack_soap(data), timings, None
+
+async def _call_soap_offloaded(siret_url: str, operation: str, error_prefix: str, **params):
+    data, timings, error = await cpu_pool.run("soap", _call_soap_packed, siret_url, operation, params)
+    _observe(siret_url, timings)
+    if error is not None:
+        raise RuntimeError(f"{error_prefix}: {error}")
+    return _unpack_soap(data)
+
 async def getSoapCredentials(cliente: str):
 
     """Obtener credenciales de un cliente SOAP desde la variable de entorno SOAP_CREDENTIALS_JSON."""
@@ -48,23 +175,14 @@ def _sync_request_bodega_all_items(
     """Consulta SOAP al servicio wsp_request_bodega_all_items.
     Devuelve el objeto serializado en diccionario."""
 
-    # Construir URL del WSDL
-    wsdl_url = f"https://{siret_url}:443/webservice.php?wsdl"
-    # Crear sesión requests sin influir de proxies de entorno
-    session = requests.Session()
-    session.trust_env = False
-    # Cliente sincrónico Zeep con timeout (10s) para evitar colgado indefinido
-    transport = Transport(session=session, timeout=10)
-    client = ZeepClient(wsdl=wsdl_url, transport=transport)
     try:
-        # Invocar operación con parámetros nombrados
-        response = client.service.wsp_request_bodega_all_items(
+        return _call_soap(
+            siret_url,
+            "wsp_request_bodega_all_items",
             ws_pid=ws_pid,
             ws_passwd=ws_passwd,
             bid=bid
         )
-        # Serializar objeto Zeep a tipos nativos Python
-        return serialize_object(response)
     except Exception as e:
         # Timeout u otro error de conexión SOAP
         raise RuntimeError(f"SOAP request failed: {e}")
@@ -79,23 +197,14 @@ def _sync_request_bodega_all_items_client(
     """Consulta SOAP al servicio wsp_request_bodega_all_items.
     Devuelve el objeto serializado en diccionario."""
 
-    # Construir URL del WSDL
-    wsdl_url = f"https://{siret_url}:443/webservice.php?wsdl"
-    # Crear sesión requests sin influir de proxies de entorno
-    session = requests.Session()
-    session.trust_env = False
-    # Cliente sincrónico Zeep con timeout (10s) para evitar colgado indefinido
-    transport = Transport(session=session, timeout=10)
-    client = ZeepClient(wsdl=wsdl_url, transport=transport)
     try:
-        # Invocar operación con parámetros nombrados
-        response = client.service.wsc_request_bodega_all_items(
+        return _call_soap(
+            siret_url,
+            "wsc_request_bodega_all_items",
             ws_cid=ws_cid,
             ws_passwd=ws_passwd,
             bid=bid
         )
-        # Serializar objeto Zeep a tipos nativos Python
-        return serialize_object(response)
     except Exception as e:
         # Timeout u otro error de conexión SOAP
         raise RuntimeError(f"SOAP client request failed: {e}")
@@ -106,8 +215,13 @@ async def wsp_request_bodega_all_items(
     ws_passwd: str,
     bid: int
 ) -> dict:
-    """Llamada asíncrona al servicio SOAP (bloquea en ThreadPool) y serializa la respuesta."""
+    """Llamada asíncrona al servicio SOAP (en el pool de procesos si está activo, si no en ThreadPool) y serializa la respuesta."""
 
+    if cpu_pool.offloaded():
+        return await _call_soap_offloaded(
+            siret_url, "wsp_request_bodega_all_items", "SOAP request failed",
+            ws_pid=ws_pid, ws_passwd=ws_passwd, bid=bid,
+        )
     return await asyncio.to_thread(
         _sync_request_bodega_all_items,
         siret_url,
@@ -122,8 +236,13 @@ async def wsc_request_bodega_all_items(
     ws_passwd: str,
     bid: int
 ) -> dict:
-    """Llamada asíncrona al servicio SOAP (bloquea en ThreadPool) y serializa la respuesta."""
+    """Llamada asíncrona al servicio SOAP (en el pool de procesos si está activo, si no en ThreadPool) y serializa la respuesta."""
 
+    if cpu_pool.offloaded():
+        return await _call_soap_offloaded(
+            siret_url, "wsc_request_bodega_all_items", "SOAP client request failed",
+            ws_cid=ws_cid, ws_passwd=ws_passwd, bid=bid,
+        )
     return await asyncio.to_thread(
         _sync_request_bodega_all_items_client,
         siret_url,
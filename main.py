@@ -1,55 +1,66 @@
+import os
 import time
-import json
-import datetime
+
+# Duración de las importaciones del módulo (las de SOAP se difieren, ver utils.startup)
+_import_start = time.perf_counter()
+
+import uuid
 import httpx
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
-from fastapi.responses import JSONResponse
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse, FileResponse, Response
 from sqlalchemy.exc import OperationalError
-from dbConn import getProds, AsyncSessionLocal
+from dbConn import getProds, streamProds, AsyncSessionLocal
 from getDataClient import getCredentials, wsp_request_bodega_all_items, getSoapCredentials, wsc_request_bodega_all_items
-from sqlalchemy import text
-from wooCalls import WooCommerceAPI
+from sqlalchemy import text, bindparam
+from wooCalls import WooCommerceAPI, close_clients
+from services.fingerprints import PushFingerprints
+from services.images import MediaLibrary
+from services import image_check, response_cache, catalog_query, ndjson
+from services.catalog_query import CatalogQuery
+from utils import metrics, tracing, profiling, memory, loop_lag, serialization, startup
+from utils.logs import get_logger
+from utils.metrics import SYNC_WRITES, SYNC_CATALOG_SIZE, SYNC_DIFF_SIZE
+from services import jobs, warmup, cpu_pool, catalog_diff, lanes, write_buffer, price_matrix, checkpoints
+from services.scheduler import scheduler
 from fastapi.middleware.cors import CORSMiddleware
 from schemas import (
+    Product,
     ItemsResponse,
     InventoryResponse,
     SoapResponse,
     MissingWPResponse,
     MessageResponse,
     PriceListResponse,
+    JobResponse,
+    JobAcceptedResponse,
+    ALLOWED_SOAP_FIELDS,
 )
 
-def log_call(request: Request, client: str):
-    prefix = request.url.path.lstrip('/')
-    parts = prefix.split('/', 1)
-    suffix = parts[1] if len(parts) > 1 else parts[0]
-    file_name = f"{suffix.replace('/', '_')}.log"
-    with open(file_name, 'a') as f:
-        f.write(f"{datetime.datetime.utcnow().isoformat()} - client: {client}\n")
-
-async def fetch_local_products(client: str):
-    """Devuelve lista de productos locales y el provider utilizado ('db' o nombre SOAP)."""
-
-    creds = await getCredentials(client)
-    if not creds:
-        raise HTTPException(status_code=404, detail="Cliente no encontrado")
-    provider = creds.get("provider", "db")
-    # Fuente DB
-    if provider == "db":
-        items = await getProds(creds.get("dbId"))
-        return items, provider
-    # Fuente SOAP
-    soap_creds = await getSoapCredentials(provider)
-    if not soap_creds:
-        raise HTTPException(status_code=404, detail=f"Proveedor SOAP '{provider}' no encontrado")
-    bid = soap_creds.get("bid", 0)
-    resp = await wsp_request_bodega_all_items(
-        siret_url=soap_creds["siretUrl"],
-        ws_pid=soap_creds["ws_pid"],
-        ws_passwd=soap_creds["ws_passwd"],
-        bid=bid
-    )
-    raw = resp.get("data", resp)
+startup.record_import("main", time.perf_counter() - _import_start)
+
+def _pushed_fields(data: dict, categoria=None) -> dict:
+    """Campos de un payload de creación que se registran como último valor enviado."""
+    fields = {k: data[k] for k in ("stock_quantity", "name", "images", "status") if k in data}
+    if categoria:
+        fields["categoria"] = categoria
+    return fields
+
+async def category_ids(wc: WooCommerceAPI, categoria: str) -> list:
+    """IDs de la jerarquía 'Padre > Hijo' en WooCommerce, creando las categorías que falten."""
+    cats = []
+    parent_cat = None
+    with tracing.span("categories", cat="stage", categoria=categoria):
+        for part in [c.strip() for c in categoria.split('>')]:
+            cid = await wc.get_or_create_category(part, parent_cat)
+            cats.append(cid)
+            parent_cat = cid
+    return cats
+
+def _map_soap_items(raw) -> list:
+    """Ítems SOAP de bodega (lista o ítem único) al formato local de productos."""
     items = []
     # Mapear campos SOAP a formato local
     if isinstance(raw, list):
@@ -75,10 +86,49 @@ async def fetch_local_products(client: str):
             "image": image_url,
             "imageName": image_name
         })
-    return items, provider
+    return items
 
+async def fetch_local_products(client: str):
+    """Devuelve lista de productos locales y el provider utilizado ('db' o nombre SOAP)."""
 
-app = FastAPI(root_path="/api")
+    creds = await getCredentials(client)
+    if not creds:
+        raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    provider = creds.get("provider", "db")
+    # Fuente DB
+    if provider == "db":
+        items = await getProds(creds.get("dbId"))
+        return items, provider
+    # Fuente SOAP
+    soap_creds = await getSoapCredentials(provider)
+    if not soap_creds:
+        raise HTTPException(status_code=404, detail=f"Proveedor SOAP '{provider}' no encontrado")
+    bid = soap_creds.get("bid", 0)
+    resp = await wsp_request_bodega_all_items(
+        siret_url=soap_creds["siretUrl"],
+        ws_pid=soap_creds["ws_pid"],
+        ws_passwd=soap_creds["ws_passwd"],
+        bid=bid
+    )
+    return _map_soap_items(resp.get("data", resp)), provider
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Conexiones a BD, WSDLs y tiendas (opcional, WARMUP_ON_STARTUP)
+    await warmup.start()
+    # Reanudar trabajos interrumpidos por un reinicio
+    await jobs.manager.start()
+    loop_lag.monitor.start()
+    yield
+    await loop_lag.monitor.stop()
+    await jobs.manager.stop()
+    await warmup.stop()
+    await close_clients()
+    cpu_pool.shutdown()
+
+
+app = FastAPI(root_path="/api", lifespan=lifespan)
 
 
 app.add_middleware(
@@ -89,6 +139,65 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+log = get_logger("api")
+access_log = get_logger("access")
+
+HTTP_REQUESTS = metrics.counter(
+    "http_requests_total", "Peticiones recibidas por la API", ("route", "method", "status"))
+HTTP_LATENCY = metrics.histogram(
+    "http_request_seconds", "Latencia de respuesta de la API", ("route", "method"))
+
+
+@app.middleware("http")
+async def access_middleware(request: Request, call_next):
+    """Métricas y log de acceso de cada petición."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        # Plantilla de ruta ('/items/{client}') para no generar una serie por cliente
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_LATENCY.observe(elapsed, route=path, method=request.method)
+        HTTP_REQUESTS.inc(route=path, method=request.method, status=str(status))
+        access_log.info(
+            f"{request.method} {request.url.path} {status}",
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "route": path,
+                "client": request.path_params.get("client"),
+                "status": status,
+                "elapsed": round(elapsed, 4),
+                "remote": request.client.host if request.client else None,
+            },
+        )
+
+
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    path = request.url.path
+    mode = profiling.request_mode(request.headers) or profiling.path_mode(path)
+    if not mode or path.startswith("/profiles"):
+        return await call_next(request)
+    profile_id = f"req-{uuid.uuid4().hex[:16]}"
+    async with profiling.profile(profile_id, mode, method=request.method, path=path) as prof:
+        response = await call_next(request)
+    if prof.profile_id:
+        response.headers["X-Profile-Id"] = prof.profile_id
+    return response
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
@@ -113,14 +222,32 @@ async def sqlalchemy_operational_error_handler(request: Request, exc: Operationa
     "/items/{client}",
     response_model=ItemsResponse,
     tags=["Products"],
+    responses=ndjson.OPENAPI,
 )
-async def productos(client: str, background_tasks: BackgroundTasks, request: Request):
+async def productos(client: str, background_tasks: BackgroundTasks, request: Request,
+                    query: CatalogQuery = Depends(catalog_query.from_params)):
     """
     Listar productos para un cliente WooCommerce según proveedor configurado.
     Provider 'db' usa la BD, otros usan SOAP definido en la variable de entorno SOAP_CREDENTIALS_JSON.
+    Con filtros o `limit` devuelve una página y `nextCursor`.
+    Con `Accept: application/x-ndjson` o `?format=ndjson` responde un producto por línea.
     """
-    log_call(request, client)
+    creds = await getCredentials(client)
+    if not creds:
+        raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    if ndjson.requested(request):
+        provider = creds.get("provider", "db")
+        summary = {"client": client, "provider": provider}
+        # Los ítems SOAP se emiten con los campos de bodega, sin el modelo Product
+        model = Product if provider == "db" else None
+        return await ndjson.respond(stream_items(creds, query, summary), summary, model)
+    return await response_cache.serve(
+        request, "items", client, lambda: load_items(client, query), ItemsResponse,
+        ttl=creds.get("cacheTtl"), stale=creds.get("cacheStale"), variant=query.variant,
+    )
 
+async def load_items(client: str, query: CatalogQuery = None) -> dict:
+    """Productos del cliente desde la BD o SOAP según su proveedor (sin caché)."""
     creds = await getCredentials(client)
     if not creds:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
@@ -133,13 +260,17 @@ async def productos(client: str, background_tasks: BackgroundTasks, request: Req
         if provider == "db":
             # Productos desde Base de Datos
             productos_list = await getProds(creds.get("dbId"))
+            next_cursor = None
+            if query and query.active:
+                productos_list, next_cursor = query.page(productos_list)
             elapsed = time.time() - start
             payload = {
                 "client": client,
                 "provider": provider,
                 "count": len(productos_list),
                 "elapsed": elapsed,
-                "productos": productos_list
+                "productos": productos_list,
+                "nextCursor": next_cursor,
             }
             return payload
 
@@ -157,20 +288,12 @@ async def productos(client: str, background_tasks: BackgroundTasks, request: Req
                 bid=bid
             )
             raw = resp.get("data", resp)
-            allowed = [
-                "codigo", "descripcion", "desc_corta", "familia_id", "familia",
-                "marca", "clase", "precio", "stock", "image_url",
-                "itemref_1", "privacidad"
-            ]
-            if isinstance(raw, list):
-                productos_list = [{k: item.get(k) for k in allowed} for item in raw]
-                count = len(productos_list)
-            elif isinstance(raw, dict):
-                productos_list = {k: raw.get(k) for k in allowed}
-                count = 1
-            else:
-                productos_list = raw
-                count = 0
+            next_cursor = None
+            if query and query.active and isinstance(raw, list):
+                # Filtrar antes de proyectar campos para no copiar lo que se descarta
+                raw, next_cursor = query.page(raw, catalog_query.SOAP_KEYS)
+            productos_list = _soap_fields(raw)
+            count = len(productos_list)
 
             elapsed = time.time() - start
             payload = {
@@ -179,24 +302,80 @@ async def productos(client: str, background_tasks: BackgroundTasks, request: Req
                 "bid": bid,
                 "count": count,
                 "elapsed": elapsed,
-                "productos": productos_list
+                "productos": productos_list,
+                "nextCursor": next_cursor,
             }
             return payload
 
+    except HTTPException:
+        raise
     except Exception as e:
         elapsed = time.time() - start
         error_message = str(e) or repr(e)
-        print(f"Error en productos endpoint para {client}: {error_message}")
+        log.error("Error en productos endpoint", extra={"client": client, "error": error_message})
         raise HTTPException(status_code=502, detail={"error": error_message, "provider": provider})
 
+async def stream_items(creds: dict, query: CatalogQuery, summary: dict):
+    """Productos del cliente en bloques para NDJSON: la BD por cursor, SOAP en una sola respuesta."""
+    provider = creds.get("provider", "db")
+    if provider == "db":
+        if query.active:
+            productos_list, summary["nextCursor"] = query.page(await getProds(creds.get("dbId")))
+            yield productos_list
+            return
+        async for chunk in streamProds(creds.get("dbId")):
+            yield chunk
+        return
+
+    soap_creds = await getSoapCredentials(provider)
+    if not soap_creds:
+        raise HTTPException(status_code=404, detail=f"Proveedor SOAP '{provider}' no encontrado")
+    summary["bid"] = bid = soap_creds.get("bid", 0)
+    resp = await wsp_request_bodega_all_items(
+        siret_url=soap_creds["siretUrl"],
+        ws_pid=soap_creds["ws_pid"],
+        ws_passwd=soap_creds["ws_passwd"],
+        bid=bid
+    )
+    raw = resp.get("data", resp)
+    if query.active and isinstance(raw, list):
+        raw, summary["nextCursor"] = query.page(raw, catalog_query.SOAP_KEYS)
+    yield _soap_fields(raw)
+
+def _soap_fields(raw) -> list:
+    """Ítems de bodega con solo los campos expuestos por la API, como lista."""
+    if isinstance(raw, dict):
+        raw = [raw]
+    if not isinstance(raw, list):
+        return []
+    return [{k: item.get(k) for k in ALLOWED_SOAP_FIELDS} for item in raw]
+
 @app.get(
     "/inventory/{client}",
     response_model=InventoryResponse,
     tags=["Inventory"],
+    responses=ndjson.OPENAPI,
 )
-async def list_wp_products(client: str, background_tasks: BackgroundTasks, request: Request):
-    """Listar todos los productos del inventario en WooCommerce para un cliente dado."""
-    log_call(request, client)
+async def list_wp_products(client: str, background_tasks: BackgroundTasks, request: Request,
+                           query: CatalogQuery = Depends(catalog_query.from_params)):
+    """
+    Listar todos los productos del inventario en WooCommerce para un cliente dado.
+    Con filtros o `limit` devuelve una página y `nextCursor`; los filtros van en la consulta a WooCommerce.
+    Con `Accept: application/x-ndjson` o `?format=ndjson` responde un producto por línea, página a página.
+    """
+    creds = await getCredentials(client)
+    if not creds:
+        raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    if ndjson.requested(request):
+        summary = {"client": client, "dbId": creds.get("dbId")}
+        return await ndjson.respond(stream_inventory(creds, query, summary), summary, Product)
+    return await response_cache.serve(
+        request, "inventory", client, lambda: load_inventory(client, query), InventoryResponse,
+        ttl=creds.get("cacheTtl"), stale=creds.get("cacheStale"), variant=query.variant,
+    )
+
+async def load_inventory(client: str, query: CatalogQuery = None) -> dict:
+    """Inventario completo del cliente en WooCommerce (sin caché)."""
     creds = await getCredentials(client)
     if not creds:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
@@ -204,36 +383,64 @@ async def list_wp_products(client: str, background_tasks: BackgroundTasks, reque
     wc = WooCommerceAPI(creds["url"], creds["ck"], creds["cs"])
     try:
         start = time.time()
-        products = await wc.get_all_products()
+        next_cursor = None
+        if query and query.active:
+            products, next_cursor = await query.woo_page(wc)
+        else:
+            products = await wc.get_all_products()
         elapsed = time.time() - start
         payload = {
             "client": client,
             "dbId": creds.get("dbId"),
             "count": len(products),
             "elapsed": elapsed,
-            "productos": products
+            "productos": products,
+            "nextCursor": next_cursor,
         }
         # no WhatsApp notification on successful response
         return payload
     except Exception as e:
         elapsed = time.time() - start  # si no la tienes aún
-        print(f"Error en inventory endpoint para {client}: {e}")
+        log.error("Error en inventory endpoint", extra={"client": client, "error": str(e)})
         raise HTTPException(status_code=502, detail=str(e) or repr(e))
 
+async def stream_inventory(creds: dict, query: CatalogQuery, summary: dict):
+    """Inventario de WooCommerce en bloques para NDJSON, a medida que llega cada página."""
+    wc = WooCommerceAPI(creds["url"], creds["ck"], creds["cs"])
+    if query.active:
+        products, summary["nextCursor"] = await query.woo_page(wc)
+        yield products
+        return
+    async for page in wc.iter_product_pages():
+        yield page
+
+async def stream_bodega(creds: dict, summary: dict):
+    response = await wsp_request_bodega_all_items(
+        siret_url=creds["siretUrl"],
+        ws_pid=creds["ws_pid"],
+        ws_passwd=creds["ws_passwd"],
+        bid=summary["bid"]
+    )
+    yield _soap_fields(response.get("data", response))
+
 ### SOAP multi-cliente: consulta bodega
 @app.get(
     "/soap/{client}/bodega_items",
     response_model=SoapResponse,
     tags=["SOAP"],
+    responses=ndjson.OPENAPI,
 )
 async def soap_bodega_items(client: str, background_tasks: BackgroundTasks, request: Request):
     """
     Consulta todos los ítems de bodega vía SOAP para un cliente configurado en la variable de entorno SOAP_CREDENTIALS_JSON.
+    Con `Accept: application/x-ndjson` o `?format=ndjson` responde un ítem por línea.
     """
-    log_call(request, client)
     creds = await getSoapCredentials(client)
     if not creds:
         raise HTTPException(status_code=404, detail="Cliente SOAP no encontrado")
+    if ndjson.requested(request):
+        summary = {"client": client, "bid": creds.get("bid", 0)}
+        return await ndjson.respond(stream_bodega(creds, summary), summary)
 
     try:
         # Usar bid definido en configuración SOAP (env SOAP_CREDENTIALS_JSON)
@@ -247,18 +454,12 @@ async def soap_bodega_items(client: str, background_tasks: BackgroundTasks, requ
         )
         # Extraer 'data' y filtrar solo campos estándar
         raw = response.get("data", response)
-        # Definir campos a exponer en la API
-        allowed = [
-            "codigo", "descripcion", "desc_corta", "familia_id", "familia",
-            "marca", "clase", "precio", "stock", "image_url",
-            "itemref_1", "privacidad"
-        ]
-        # Filtrar registros y contar
+        # Filtrar registros y contar (un solo ítem conserva la forma de objeto)
         if isinstance(raw, list):
-            filtered = [{k: item.get(k) for k in allowed} for item in raw]
+            filtered = _soap_fields(raw)
             count = len(filtered)
         elif isinstance(raw, dict):
-            filtered = {k: raw.get(k) for k in allowed}
+            filtered = {k: raw.get(k) for k in ALLOWED_SOAP_FIELDS}
             count = 1
         else:
             filtered = raw
@@ -272,30 +473,51 @@ async def soap_bodega_items(client: str, background_tasks: BackgroundTasks, requ
             "data": filtered
         }
         # no WhatsApp notification on successful response
-        return payload
+        # Datos ya filtrados: sin revalidar con SoapResponse (el esquema OpenAPI no cambia)
+        return Response(serialization.render(SoapResponse, payload), media_type="application/json")
     except RuntimeError as e:
         # SOAP request error or timeout
         error_message = str(e)
-        print(f"SOAP timeout/error en soap_bodega_items para {client}: {error_message}")
+        log.error("SOAP timeout/error en soap_bodega_items", extra={"client": client, "error": error_message})
         raise HTTPException(status_code=502, detail=error_message)
     except HTTPException:
         raise
     except Exception as e:
         # Other errors
         error_message = str(e) or repr(e)
-        print(f"Error en soap_bodega_items para {client}: {error_message}")
+        log.error("Error en soap_bodega_items", extra={"client": client, "error": error_message})
         raise HTTPException(status_code=500, detail=error_message)
 
+async def submit_job(kind: str, client: str, message: str, request: Request = None):
+    """Encola un trabajo persistente para el cliente y devuelve su ID."""
+    creds = await getCredentials(client)
+    if not creds:
+        raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    params = None
+    profile_mode = profiling.request_mode(request.headers) if request is not None else None
+    if profile_mode:
+        # Se perfila el trabajo (perfil con su jobId), no la petición que lo encola
+        profiling.discard_current()
+        params = {"profile": profile_mode}
+    job, created = await jobs.manager.submit(kind, client, params)
+    if not created:
+        message = f"Ya existe un trabajo activo para {client}"
+    return {
+        "message": message,
+        "jobId": job["id"],
+        "status": job["status"],
+        "deduplicated": not created,
+    }
+
 @app.post(
     "/sync/{client}",
-    response_model=MessageResponse,
+    response_model=JobAcceptedResponse,
+    status_code=202,
     tags=["Sync"],
 )
-async def sync_remote(client: str, background_tasks: BackgroundTasks, request: Request):
+async def sync_remote(client: str, request: Request):
     """Inicia sincronización en segundo plano."""
-    log_call(request, client)
-    background_tasks.add_task(run_sync_remote, client)
-    return {"message": f"Sincronización iniciada para {client}"}
+    return await submit_job("sync", client, f"Sincronización iniciada para {client}", request)
 
 async def run_sync_remote(client: str):
     start = time.time()
@@ -304,120 +526,179 @@ async def run_sync_remote(client: str):
         return
 
     wc = WooCommerceAPI(creds["url"], creds["ck"], creds["cs"])
+    fps = await PushFingerprints(client).load()
+    media = await MediaLibrary(client, wc, creds).load()
     changes_log = []  # <-- aquí guardaremos cambios
     changes_count = 0
 
     try:
-        wp_products = await wc.get_all_products()
-        local_products, provider = await fetch_local_products(client)
-
-        # Map WooCommerce products by SKU, including image info for sync
-        remote_map = {}
-        for p in wp_products:
-            sku = p.get("sku")
-            if not sku:
-                continue
-            imagen = p.get("imagen") or {}
-            remote_map[sku] = {
-                "id": p.get("id"),
-                "sku": sku,
-                "nombre": p.get("nombre") or "",
-                "precio": float(p.get("precio") or 0),
-                "stock": int(p.get("stock") or 0),
-                "image": imagen.get("src"),
-                "imageName": imagen.get("name")
-            }
-
-        # Map local products by SKU, including image info
-        local_map = {}
-        for p in local_products:
-            sku = p.get("sku")
-            if not sku:
-                continue
-            local_map[sku] = {
-                "nombre": p.get("nombre"),
-                "precio": p.get("precio"),
-                "stock": p.get("stock"),
-                "image": p.get("image"),
-                "imageName": p.get("imageName")
-            }
-
-        shared_skus = set(remote_map) & set(local_map)
-        for sku in sorted(shared_skus):
-            local = local_map[sku]
-            remote = remote_map[sku]
-            changes = {}
-            # Sync stock if differs
-            if int(local.get("stock") or 0) != int(remote.get("stock") or 0):
-                changes["stock_quantity"] = int(local.get("stock") or 0)
-            # Sync image if name differs
-            local_image_name = local.get("imageName")
-            remote_image_name = remote.get("imageName")
-            if local_image_name != "no image" and local_image_name != remote_image_name:
-                local_image_src = local.get("image")
-                changes["images"] = [{"src": local_image_src, "name": local_image_name}]
+        with jobs.stage("fetch_remote"):
+            wp_pages = await wc.get_all_pages_raw()
+        with jobs.stage("fetch_local"):
+            local_products, provider = await fetch_local_products(client)
+        # Parseo y diff fuera del event loop si el pool de procesos está activo
+        with jobs.stage("diff"):
+            plan = await cpu_pool.run(
+                "sync_plan", catalog_diff.sync_plan, wp_pages, catalog_diff.local_input(local_products),
+                items=len(local_products),
+            )
+        del wp_pages, local_products
+        shared_count = plan["shared"]
+
+        # Verificar antes las imágenes que se van a enviar; las rotas se omiten
+        with jobs.stage("image_check"):
+            dead_images = await image_check.dead_urls(
+                changes["images"][0]["src"] for _, _, _, changes in plan["changes"]
+                if "images" in changes and not media.known_id(changes["images"][0]["src"])
+            )
+        jobs.set_total(shared_count)
+        # Los SKUs sin cambios cuentan como procesados de una vez
+        await jobs.advance(shared_count - len(plan["changes"]))
+        for sku, remote_id, nombre, changes in plan["changes"]:
+            await jobs.advance()
+            images = changes.get("images")
+            # WordPress renombra los archivos al importarlos; no reenviar la misma imagen
+            if images and (images[0]["src"] in dead_images or fps.is_current(sku, "images", images)):
+                del changes["images"]
 
             if changes:
                 try:
                     # Use the WooCommerce product ID to perform the update
-                    await wc.update_product(remote["id"], changes)
+                    await media.update_product(remote_id, changes)
+                    await fps.record(sku, changes)
                     changes_count += 1
+                    SYNC_WRITES.inc(client=client, kind="sync", op="update", result="ok")
                     changes_log.append({
                         "sku": sku,
-                        "nombre": local.get("nombre"),
+                        "nombre": nombre,
                         "cambios": changes
                     })
                 except Exception as e:
-                    print(f"Error actualizando SKU {sku}: {e}")
+                    await fps.forget_if_gone(sku, e)
+                    SYNC_WRITES.inc(client=client, kind="sync", op="update", result="error")
+                    log.warning(
+                        "Error actualizando SKU",
+                        extra={"client": client, "sku": sku, "error": str(e), "sample": f"sync.update_error.{client}"},
+                    )
 
-        print(f"Sincronización completada para {client}: {changes_count} cambios aplicados.")
-        print("Detalle de cambios:")
-        for log in changes_log:
-            print(log)
+        SYNC_CATALOG_SIZE.observe(shared_count, kind="sync")
+        SYNC_DIFF_SIZE.observe(changes_count, kind="sync")
+        log.info("Sincronización completada", extra={"client": client, "changes": changes_count})
+        for change in changes_log:
+            log.debug("Cambio aplicado", extra={"client": client, "change": change, "sample": f"sync.change.{client}"})
+        return {
+            "client": client,
+            "changes_count": changes_count,
+            "elapsed": time.time() - start,
+            "changes": changes_log,
+        }
 
     except Exception as e:
         elapsed = time.time() - start
         error_msg = str(e)
-        print(f"Error sincronizando {client}: {error_msg}")
+        log.error("Error sincronizando", extra={"client": client, "error": error_msg})
+        raise
+    finally:
+        await fps.flush()
+        await media.flush()
+        if fps.writes:
+            response_cache.invalidate(client, "inventory")
+
 @app.post("/syncPersonal/{client}")
 async def sync_personal(client: str, request: Request):
     """Ejecuta sincronización personal en primer plano y devuelve el resumen."""
-    log_call(request, client)
-    # Ejecutar sincronización personal y devolver resultados
-    result = await run_sync_personal(client)
+    # Ejecutar sincronización personal (con turno del planificador) y devolver resultados
+    trace_id = f"sync_personal-{client}-{int(time.time() * 1000)}"
+    async with tracing.record(trace_id, f"sync_personal {client}", kind="sync_personal", client=client) as trace:
+        result = await scheduler.run(client, "sync_personal", run_sync_personal, client, foreground=True)
+    if isinstance(result, dict) and trace is not None:
+        result["traceId"] = trace_id
     return result
 
+async def fetch_changed_rows(creds: dict) -> list:
+    """Filas de getChangedProds (cambios de prodsChanges con los datos del producto) del cliente."""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            text("CALL getChangedProds(:userId)"),
+            {"userId": creds["dbId"]},
+        )
+        return result.fetchall()
+
+@memory.tracked("sync_personal")
 async def run_sync_personal(client: str):
-    start = time.time()
     creds = await getCredentials(client)
     if not creds:
         return
+    # No se consulta el inventario remoto; se procesarán directamente los cambios del procedimiento
+    # Fetch changed products from personal table
+    with jobs.stage("fetch_changes"):
+        try:
+            rows = await fetch_changed_rows(creds)
+        except Exception as e:
+            log.error("Error en syncPersonal", extra={"client": client, "error": str(e)})
+            raise
+    # Si una corrida anterior se cortó (reinicio, timeout), se retoma desde su checkpoint
+    checkpoint = await checkpoints.Checkpoint("sync_personal", client).load()
+    completed = False
+    try:
+        result = await push_changed_rows(client, creds, rows, checkpoint=checkpoint)
+        completed = True
+        return result
+    finally:
+        if completed:
+            await checkpoint.clear()
+        else:
+            await checkpoint.save()
+
+async def push_changed_rows(client: str, creds: dict, rows: list, checkpoint=None) -> dict:
+    """Envía a WooCommerce las filas de getChangedProds (lógica de syncPersonal).
 
+    Los errores de un SKU se registran y no detienen el resto; sus SKUs quedan
+    en "failed" del resumen (el daemon CDC no confirma esas filas). Con
+    `checkpoint`, los SKUs ya enviados por un intento anterior a partir de la
+    misma fila se omiten y cada SKU terminado queda registrado.
+    """
+    start = time.time()
     wc = WooCommerceAPI(creds["url"], creds["ck"], creds["cs"])
+    fps = await PushFingerprints(client).load()
+    media = await MediaLibrary(client, wc, creds).load()
     changes_log = []
     changes_count = 0
+    failed = set()
 
     try:
-        # No se consulta el inventario remoto; se procesarán directamente los cambios del procedimiento
-
-        # Fetch changed products from personal table
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                text("CALL getChangedProds(:userId)"),
-                {"userId": creds["dbId"]},
+        # Verificar de una vez las imágenes candidatas; las rotas se tratan como 'no image'
+        with jobs.stage("image_check"):
+            dead_images = await image_check.dead_urls(
+                url for url in (
+                    getattr(row, 'Image', None) or getattr(row, 'image', None) for row in rows
+                )
+                if url and url.lower() != "no image" and not media.known_id(url)
             )
-            rows = result.fetchall()
+
+        # Categorías resueltas en esta corrida: los workers de carril no repiten búsquedas ni crean duplicadas
+        category_tasks = {}
+
+        def resolve_categories(categoria: str):
+            task = category_tasks.get(categoria)
+            if task is None:
+                task = category_tasks[categoria] = asyncio.ensure_future(category_ids(wc, categoria))
+            return task
 
         # Avoid processing duplicate SKUs
         processed_skus = set()
+        work = []
+        jobs.set_total(len(rows))
         for row in rows:
             # Extract SKU (case-insensitive)
             sku = getattr(row, 'Sku', None) or getattr(row, 'SKU', None) or getattr(row, 'sku', None)
             if not sku or sku in processed_skus:
                 continue
             processed_skus.add(sku)
+            row_fp = checkpoints.row_fingerprint(row) if checkpoint is not None else None
+            if checkpoint is not None and checkpoint.is_done(sku, row_fp):
+                continue
             # Map new column names: Sku, Name, FamilyxExport, Image, Stock, Sync, Tipo, FinalPrice
-            sku = getattr(row, 'Sku', None) or getattr(row, 'SKU', None) or getattr(row, 'sku', None)
             nombre = getattr(row, 'Name', None) or getattr(row, 'NAME', None) or getattr(row, 'nombre', None)
             stock = int(
                 getattr(row, 'Stock', None)
@@ -433,6 +714,8 @@ async def run_sync_personal(client: str):
                 getattr(row, 'Image', None)
                 or getattr(row, 'image', None)
             )
+            if image_url in dead_images:
+                image_url = None
             # Sync flag: if 2 then hide product
             sync_flag = (
                 getattr(row, 'Sync', None)
@@ -444,45 +727,23 @@ async def run_sync_personal(client: str):
                 or getattr(row, 'TIPO', None)
                 or getattr(row, 'tipo', None)
             )
+            price = (
+                getattr(row, 'FinalPrice', None)
+                or getattr(row, 'finalprice', None)
+                or getattr(row, 'Finalprice', None)
+                or 0
+            )
+            item = {
+                "sku": sku, "tipo": tipo, "nombre": nombre, "stock": stock, "price": price,
+                "categoria": categoria, "image_url": image_url, "sync_flag": sync_flag, "row_fp": row_fp,
+            }
 
             if tipo == "Nuevo":
                 # Create new product only if price and stock positive
-                price = (
-                    getattr(row, 'FinalPrice', None)
-                    or getattr(row, 'finalprice', None)
-                    or getattr(row, 'Finalprice', None)
-                    or 0
-                )
                 if price <= 0 or stock <= 0:
                     continue
-                # Determine categories hierarchy
-                cats = []
-                parent_cat = None
-                if categoria:
-                    for part in [c.strip() for c in categoria.split('>')]:
-                        cid = await wc.get_or_create_category(part, parent_cat)
-                        cats.append(cid)
-                        parent_cat = cid
-                # Prepare creation payload
-                data = {
-                    "sku": sku,
-                    "name": nombre,
-                    "type": "simple",
-                    "status": "draft" if str(sync_flag) == "2" else "publish",
-                    "regular_price": str(price),
-                    "stock_quantity": stock
-                }
-                if cats:
-                    data["categories"] = [{"id": cid} for cid in cats]
-                # Skip image if 'no image'
-                if image_url and image_url.lower() != "no image":
-                    data["images"] = [{"src": image_url, "name": image_url.split("/")[-1]}]
-                try:
-                    await wc.create_product(data)
-                    changes_log.append({"sku": sku, "tipo": tipo, "datos": data})
-                    changes_count += 1
-                except Exception as e:
-                    print(f"Error creando SKU {sku}: {e}")
+                item["create"] = True
+                work.append(("heavy", item))
 
             elif tipo == "Actualizado":
                 # Actualizar producto existente por SKU
@@ -496,88 +757,143 @@ async def run_sync_personal(client: str):
                 if image_url and image_url.lower() != "no image":
                     image_name = image_url.split("/")[-1]
                     changes["images"] = [{"src": image_url, "name": image_name}]
-                if changes:
-                    try:
-                        # Intentar obtener ID real del producto por SKU
-                        async with httpx.AsyncClient(timeout=wc.timeout) as http_client:
-                            resp = await http_client.get(
-                                f"{wc.base_url}/wp-json/wc/v3/products",
-                                auth=wc.auth,
-                                params={"sku": sku}
-                            )
-                            resp.raise_for_status()
-                            found = resp.json() or []
-                        # Sync categories if product exists
-                        if found and categoria:
-                            # Build local category ids hierarchy
-                            parts = [c.strip() for c in categoria.split('>')]
-                            parent_cat = None
-                            local_cats = []
-                            for part in parts:
-                                cid = await wc.get_or_create_category(part, parent_cat)
-                                local_cats.append(cid)
-                                parent_cat = cid
-                            # Compare with remote categories
-                            remote_ids = [c.get("id") for c in found[0].get("categories", [])]
-                            if set(local_cats) != set(remote_ids):
-                                changes["categories"] = [{"id": cid} for cid in local_cats]
-                        # Set hidden status if sync==2
-                        if str(sync_flag) == "2":
-                            changes["status"] = "draft"
-                        if not found:
-                            # Si no existe, crear producto desde actualización
-                            # Fallback creation for update: same rules as Nuevo
-                            price = (
-                                getattr(row, 'FinalPrice', None)
-                                or getattr(row, 'finalprice', None)
-                                or getattr(row, 'Finalprice', None)
-                                or 0
-                            )
-                            if price <= 0 or stock <= 0:
-                                continue
-                            # Determine categories hierarchy
-                            cats = []
-                            parent_cat = None
-                            if categoria:
-                                for part in [c.strip() for c in categoria.split('>')]:
-                                    cid = await wc.get_or_create_category(part, parent_cat)
-                                    cats.append(cid)
-                                    parent_cat = cid
-                            data_new = {
-                                "sku": sku,
-                                "name": nombre,
-                                "type": "simple",
-                                "status": "draft" if str(sync_flag) == "2" else "publish",
-                                "regular_price": str(price),
-                                "stock_quantity": stock
-                            }
-                            if cats:
-                                data_new["categories"] = [{"id": cid} for cid in cats]
-                            # Skip image if 'no image'
-                            if image_url and image_url.lower() != "no image":
-                                data_new["images"] = [{"src": image_url, "name": image_url.split("/")[-1]}]
-                            try:
-                                await wc.create_product(data_new)
-                                changes_log.append({"sku": sku, "tipo": tipo, "creado_desde_update": True, "datos": data_new})
-                                changes_count += 1
-                            except Exception as e:
-                                print(f"Error creando SKU {sku} en fallback de update: {e}")
-                            continue
-                        # Si existe, actualizar usando su ID
-                        product_id = found[0].get("id")
-                        await wc.update_product(product_id, changes)
-                        changes_log.append({"sku": sku, "tipo": tipo, "cambios": changes})
-                        changes_count += 1
-                    except Exception as e:
-                        print(f"Error actualizando SKU {sku}: {e}")
+                # Set hidden status if sync==2
+                if str(sync_flag) == "2":
+                    changes["status"] = "draft"
+                # Enviar solo lo que cambió desde el último push exitoso
+                changes = fps.changed(sku, changes)
+                category_changed = bool(categoria) and not fps.is_current(sku, "categoria", categoria)
+                if not changes and not category_changed:
+                    fps.skip_request()
+                    continue
+                item["lanes"] = lanes.split(changes)
+                if category_changed:
+                    item["lanes"].setdefault("heavy", {})
+                item["category_changed"] = category_changed
+                work.append((lanes.next_lane(item["lanes"]), item))
+        # Lo omitido cuenta como hecho; cada SKU enviado avanza el progreso al terminar su último carril
+        await jobs.advance(len(rows) - len(work))
+
+        async def create(item: dict):
+            # Determine categories hierarchy
+            categoria = item["categoria"]
+            cats = await resolve_categories(categoria) if categoria else []
+            # Prepare creation payload
+            data = {
+                "sku": item["sku"],
+                "name": item["nombre"],
+                "type": "simple",
+                "status": "draft" if str(item["sync_flag"]) == "2" else "publish",
+                "regular_price": str(item["price"]),
+                "stock_quantity": item["stock"]
+            }
+            if cats:
+                data["categories"] = [{"id": cid} for cid in cats]
+            # Skip image if 'no image'
+            image_url = item["image_url"]
+            if image_url and image_url.lower() != "no image":
+                data["images"] = [{"src": image_url, "name": image_url.split("/")[-1]}]
+            product = await media.create_product(data)
+            await fps.record(item["sku"], _pushed_fields(data, categoria))
+            if checkpoint is not None:
+                await checkpoint.done(item["sku"], item["row_fp"], product.get("id"))
+            entry = {"sku": item["sku"], "tipo": item["tipo"], "datos": data}
+            if item["tipo"] != "Nuevo":
+                entry["creado_desde_update"] = True
+            return entry
+
+        async def step(lane: str, item: dict):
+            nonlocal changes_count
+            sku = item["sku"]
+            if item.get("create"):
+                changes_log.append(await create(item))
+                changes_count += 1
+                SYNC_WRITES.inc(client=client, kind="sync_personal", op="create", result="ok")
+                return None
+            if "found" not in item:
+                # Intentar obtener ID real del producto por SKU (en el primer carril del SKU)
+                item["found"] = await wc.find_by_sku(sku)
+                if not item["found"]:
+                    # El producto ya no existe en la tienda: sus huellas no valen
+                    await fps.forget(sku)
+                    # Si no existe, crear producto desde actualización (same rules as Nuevo), en el carril pesado
+                    if item["price"] <= 0 or item["stock"] <= 0:
+                        return None
+                    item["create"] = True
+                    return "heavy" if lane != "heavy" else await step(lane, item)
+            found = item["found"]
+            fields = dict(item["lanes"][lane])
+            pushed = dict(fields)
+            if lane == "heavy" and item["category_changed"]:
+                # Sync categories: compare local hierarchy with remote categories
+                local_cats = await resolve_categories(item["categoria"])
+                remote_ids = [c.get("id") for c in found[0].get("categories", [])]
+                if set(local_cats) != set(remote_ids):
+                    fields["categories"] = [{"id": cid} for cid in local_cats]
+                pushed["categoria"] = item["categoria"]
+            if fields:
+                # Si existe, actualizar usando su ID
+                try:
+                    await media.update_product(found[0].get("id"), fields)
+                except Exception as e:
+                    await fps.forget_if_gone(sku, e)
+                    raise
+                item.setdefault("sent", {}).update(fields)
+                SYNC_WRITES.inc(client=client, kind="sync_personal", op="update", result="ok")
+            await fps.record(sku, pushed)
+            nxt = lanes.next_lane(item["lanes"], lane)
+            if nxt is None and checkpoint is not None:
+                await checkpoint.done(sku, item["row_fp"])
+            if nxt is None and item.get("sent"):
+                changes_log.append({"sku": sku, "tipo": item["tipo"], "cambios": item["sent"]})
+                changes_count += 1
+            return nxt
+
+        def on_error(lane: str, item: dict, e: Exception):
+            sku = item["sku"]
+            failed.add(sku)
+            op = "create" if item.get("create") else "update"
+            SYNC_WRITES.inc(client=client, kind="sync_personal", op=op, result="error")
+            if item["tipo"] == "Nuevo":
+                message = "Error creando SKU"
+            elif op == "create":
+                message = "Error creando SKU en fallback de update"
+            else:
+                message = "Error actualizando SKU"
+            log.warning(
+                message,
+                extra={"client": client, "sku": sku, "lane": lane, "error": str(e),
+                       "sample": f"sync_personal.{op}_error.{client}"},
+            )
+
+        with jobs.stage("push"):
+            await lanes.run(work, step, on_error)
+        SYNC_CATALOG_SIZE.observe(len(rows), kind="sync_personal")
+        SYNC_DIFF_SIZE.observe(changes_count, kind="sync_personal")
         # Devolver resumen de cambios
-        return {"client": client, "changes_count": changes_count, "changes": changes_log}
+        summary = {
+            "client": client,
+            "changes_count": changes_count,
+            "skipped_unchanged": fps.skipped_requests,
+            "dead_images": len(dead_images),
+            "failed": sorted(failed),
+            "changes": changes_log,
+        }
+        if checkpoint is not None:
+            summary["resumed"] = checkpoint.resumed
+            summary["skipped_checkpoint"] = checkpoint.skipped
+        return summary
 
     except Exception as e:
         elapsed = time.time() - start
-        print(f"Error en syncPersonal {client}: {e}")
+        log.error("Error en syncPersonal", extra={"client": client, "error": str(e)})
         # Propagar error para que FastAPI lo maneje
         raise
+    finally:
+        await fps.flush()
+        await media.flush()
+        if fps.writes:
+            response_cache.invalidate(client, "inventory")
 
 @app.post(
     "/clearProdsChange",
@@ -586,25 +902,26 @@ async def run_sync_personal(client: str):
 )
 async def clear_prods_change(request: Request):
     """Vacía la tabla prodsChange."""
-    log_call(request, "clearProdsChange")
     try:
-        async with AsyncSessionLocal() as session:
-            async with session.begin():
-                await session.execute(text("TRUNCATE TABLE prodsChanges"))
+        await run_clear_prods_change()
         return {"message": "Tabla prodsChange vaciada"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def run_clear_prods_change():
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            await session.execute(text("TRUNCATE TABLE prodsChanges"))
+
 @app.get(
     "/compare/{client}",
-    response_model=MessageResponse,
+    response_model=JobAcceptedResponse,
+    status_code=202,
     tags=["Sync"],
 )
-async def compare_inventories(client: str, background_tasks: BackgroundTasks, request: Request):
+async def compare_inventories(client: str, request: Request):
     """Inicia comparación de inventarios en background."""
-    log_call(request, client)
-    background_tasks.add_task(run_compare_inventories, client)
-    return {"message": f"Comparación de inventarios iniciada para {client}"}
+    return await submit_job("compare", client, f"Comparación de inventarios iniciada para {client}", request)
 
 async def run_compare_inventories(client: str):
     start = time.time()
@@ -613,77 +930,83 @@ async def run_compare_inventories(client: str):
         return
 
     wc = WooCommerceAPI(creds["url"], creds["ck"], creds["cs"])
+    fps = await PushFingerprints(client).load()
+    media = await MediaLibrary(client, wc, creds).load()
     try:
-        wp_products = await wc.get_all_products()
-        local_products, provider = await fetch_local_products(client)
-
-        # Map WooCommerce products by SKU, include ID and image info for comparison or sync
-        remote_map = {}
-        for p in wp_products:
-            sku = p.get("sku")
-            if not sku:
-                continue
-            imagen = p.get("imagen") or {}
-            remote_map[sku] = {
-                "id": p.get("id"),
-                "nombre": p.get("nombre") or "",
-                "precio": float(p.get("precio") or 0),
-                "stock": int(p.get("stock") or 0),
-                "image": imagen.get("src"),
-                "imageName": imagen.get("name")
-            }
-
-        # Map local products by SKU, include image info for comparison
-        local_map = {}
-        for p in local_products:
-            sku = p.get("sku")
-            if not sku:
-                continue
-            local_map[sku] = {
-                "nombre": p.get("nombre"),
-                "precio": p.get("precio"),
-                "stock": p.get("stock"),
-                "image": p.get("image"),
-                "imageName": p.get("imageName")
-            }
+        with jobs.stage("fetch_remote"):
+            wp_pages = await wc.get_all_pages_raw()
+        with jobs.stage("fetch_local"):
+            local_products, provider = await fetch_local_products(client)
+        with jobs.stage("diff"):
+            plan = await cpu_pool.run(
+                "compare_plan", catalog_diff.compare_plan, wp_pages, catalog_diff.local_input(local_products),
+                items=len(local_products),
+            )
+        del wp_pages, local_products
+        shared_count = plan["shared"]
 
-        shared_skus = set(remote_map.keys()) & set(local_map.keys())
         differences = []
+        images_pushed = 0
+        with jobs.stage("image_check"):
+            dead_images = await image_check.dead_urls(
+                local_image for _, _, local_image, field_diffs in plan["diffs"]
+                if "image" in field_diffs and not media.known_id(local_image)
+            )
 
-        for sku in sorted(shared_skus):
-            local = local_map[sku]
-            remote = remote_map[sku]
-            field_diffs = {}
-            # compare stock
-            local_stock = int(local.get("stock") or 0)
-            remote_stock = int(remote.get("stock") or 0)
-            if local_stock != remote_stock:
-                field_diffs["stock"] = {"local": local_stock, "remote": remote_stock}
-            # compare image names: if mismatch or remote missing, report and insert image
-            local_img = local.get("imageName")
-            remote_img = remote.get("imageName")
-            if local_img != remote_img and local_img != "no image":
-                field_diffs["image"] = {"local": local_img, "remote": remote_img}
-                if local_img:
+        jobs.set_total(shared_count)
+        await jobs.advance(shared_count - len(plan["diffs"]))
+        for sku, remote_id, local_image, field_diffs in plan["diffs"]:
+            await jobs.advance()
+            # if image names mismatch or remote is missing, report and insert image
+            if "image" in field_diffs:
+                local_img = field_diffs["image"]["local"]
+                images = [{"src": local_image, "name": local_img}]
+                if local_image in dead_images:
+                    field_diffs["image"]["dead"] = True
+                elif local_img and not fps.is_current(sku, "images", images):
                     try:
-                        await wc.update_product(remote["id"], {"images": [{"src": local.get("image"), "name": local_img}]})
-                        print(f"[{client}] Imagen insertada para SKU {sku}: {local_img}")
+                        await media.update_product(remote_id, {"images": images})
+                        await fps.record(sku, {"images": images})
+                        images_pushed += 1
+                        SYNC_WRITES.inc(client=client, kind="compare", op="update", result="ok")
+                        log.info(
+                            "Imagen insertada",
+                            extra={"client": client, "sku": sku, "image": local_img, "sample": f"compare.image.{client}"},
+                        )
                     except Exception as e:
-                        print(f"[{client}] Error insertando imagen para SKU {sku}: {e}")
-            # record if any differences
-            if field_diffs:
-                diff = {"sku": sku}
-                diff.update(field_diffs)
-                differences.append(diff)
-
-        print(f"[{client}] Diferencias encontradas: {len(differences)}")
-        if differences:
-            print(f"[{client}] Detalles de diferencias:\n{json.dumps(differences, indent=2, ensure_ascii=False, default=str)}")
+                        await fps.forget_if_gone(sku, e)
+                        SYNC_WRITES.inc(client=client, kind="compare", op="update", result="error")
+                        log.warning(
+                            "Error insertando imagen",
+                            extra={"client": client, "sku": sku, "error": str(e), "sample": f"compare.image_error.{client}"},
+                        )
+            diff = {"sku": sku}
+            diff.update(field_diffs)
+            differences.append(diff)
+
+        SYNC_CATALOG_SIZE.observe(shared_count, kind="compare")
+        SYNC_DIFF_SIZE.observe(len(differences), kind="compare")
+        log.info("Comparación completada", extra={"client": client, "differences": len(differences)})
+        for diff in differences:
+            log.debug("Diferencia", extra={"client": client, "diff": diff, "sample": f"compare.diff.{client}"})
+        return {
+            "client": client,
+            "differences_count": len(differences),
+            "images_pushed": images_pushed,
+            "elapsed": time.time() - start,
+            "differences": differences,
+        }
 
     except Exception as e:
         elapsed = time.time() - start
         error_msg = str(e)
-        print(f"Error comparando inventarios para {client}: {error_msg}")
+        log.error("Error comparando inventarios", extra={"client": client, "error": error_msg})
+        raise
+    finally:
+        await fps.flush()
+        await media.flush()
+        if fps.writes:
+            response_cache.invalidate(client, "inventory")
 
 
 @app.get(
@@ -693,7 +1016,6 @@ async def run_compare_inventories(client: str):
 )
 async def missingwp(client: str, background_tasks: BackgroundTasks, request: Request):
     """Listar SKUs de productos que están en la BD pero faltan en WooCommerce."""
-    log_call(request, client)
     creds = await getCredentials(client)
     if not creds:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
@@ -720,145 +1042,178 @@ async def missingwp(client: str, background_tasks: BackgroundTasks, request: Req
         return payload
     except Exception as e:
         elapsed = time.time() - start  # si no la tienes aún
-        print(f"Error en missingwp para {client}: {e}")
+        log.error("Error en missingwp", extra={"client": client, "error": str(e)})
         raise HTTPException(status_code=502, detail=str(e))
 
 @app.post("/soap/{client}/store")
 async def soap_store(client: str, request: Request):
     """Almacena en la base de datos los ítems de bodega obtenidos por SOAP para el cliente dado."""
-    log_call(request, client)
     # Obtener credenciales SOAP
     creds = await getSoapCredentials(client)
     if not creds:
         raise HTTPException(status_code=404, detail="Cliente SOAP no encontrado")
+    try:
+        return await scheduler.run(client, "soap_store", run_soap_store, client, foreground=True)
+    except RuntimeError as e:
+        # External SOAP error or timeout
+        raise HTTPException(status_code=502, detail=str(e))
+    except HTTPException:
+        # propagate HTTPExceptions
+        raise
+    except Exception as e:
+        # Any other error
+        raise HTTPException(status_code=500, detail=str(e))
+
+@memory.tracked("soap_store")
+async def run_soap_store(client: str):
+    creds = await getSoapCredentials(client)
+    if not creds:
+        raise ValueError(f"Cliente SOAP '{client}' no encontrado")
     # Identificador de proveedor para insertar en tablas (por defecto 1 si no se provee)
     prov_id = creds.get("provId", 1)
     siret_url = creds.get("siretUrl")
     bid = creds.get("bid", 0)
-    try:
-        # Llamada SOAP a bodega
+    # Llamada SOAP a bodega
+    with jobs.stage("fetch_soap"):
         resp = await wsp_request_bodega_all_items(
             siret_url=siret_url,
             ws_pid=creds.get("ws_pid"),
             ws_passwd=creds.get("ws_passwd"),
             bid=bid
         )
-        raw = resp.get("data", resp)
-        # Asegurar lista de productos
-        if isinstance(raw, list):
-            products = raw
-        elif isinstance(raw, dict):
-            products = [raw]
-        else:
-            products = []
-        inserted = 0
-        updated = 0
-        # Procesar e insertar/actualizar en BD con cargas previas de lookup para eficiencia
-        async with AsyncSessionLocal() as session:
-            async with session.begin():
-                # Preload marcas, subfamilias y productos existentes para reducir roundtrips
-                marc_res = await session.execute(
-                    text("SELECT descripcion, id FROM marcas WHERE provId = :p"), {"p": prov_id}
-                )
-                marcas_map = {row[0]: row[1] for row in marc_res.fetchall()}
-                sub_res = await session.execute(
-                    text("SELECT famId, descripcion FROM subfamilia WHERE provId = :p"), {"p": prov_id}
-                )
-                subfam_map = {row[0]: row[1] for row in sub_res.fetchall()}
-                prod_res = await session.execute(
-                    text("SELECT sku, stock, imageUrl FROM productos WHERE provId = :p"), {"p": prov_id}
-                )
-                productos_map = {row[0]: {"stock": int(row[1] or 0), "imageUrl": row[2] or ""} for row in prod_res.fetchall()}
-                for p in products:
-                    sku = p.get("codigo")
-                    if not sku:
-                        continue
-                    nombre = p.get("descripcion") or ""
-                    fam_id = p.get("familia_id") or 0
-                    fam_desc = p.get("familia") or ""
-                    marca_desc = p.get("marca") or ""
-                    stock = int(p.get("stock") or 0)
-                    img = p.get("image_url")
-                    image_url = f"https://{siret_url}/{img}" if img else 'no image'
-                    # Marca: get or insert
-                    marca_id = marcas_map.get(marca_desc)
-                    if marca_id is None:
-                        await session.execute(
-                            text("INSERT INTO marcas (descripcion, provId) VALUES (:d, :p)"),
-                            {"d": marca_desc, "p": prov_id}
-                        )
-                        result = await session.execute(
-                            text("SELECT id FROM marcas WHERE descripcion = :d AND provId = :p"),
-                            {"d": marca_desc, "p": prov_id}
-                        )
-                        marca_id = result.scalar_one()
-                        marcas_map[marca_desc] = marca_id
-                    # Subfamilia: get or insert/update
-                    existing_desc = subfam_map.get(fam_id)
-                    if existing_desc is not None:
-                        if fam_desc and existing_desc != fam_desc:
-                            await session.execute(
-                                text("UPDATE subfamilia SET descripcion = :d WHERE famId = :f AND provId = :p"),
-                                {"d": fam_desc, "f": fam_id, "p": prov_id}
-                            )
-                            subfam_map[fam_id] = fam_desc
-                        subfam_id = fam_id
-                    else:
+    raw = resp.get("data", resp)
+    # Asegurar lista de productos
+    if isinstance(raw, list):
+        products = raw
+    elif isinstance(raw, dict):
+        products = [raw]
+    else:
+        products = []
+    inserted = 0
+    updated = 0
+    # Verificar solo las imágenes nuevas o cambiadas; las rotas se guardan como 'no image'.
+    # Se hace antes de abrir la transacción: las peticiones HEAD no retienen la conexión
+    # ni dejan abierto un hueco en los ids de prodsChanges que el daemon CDC esperaría.
+    async with AsyncSessionLocal() as session:
+        img_res = await session.execute(
+            text("SELECT sku, imageUrl FROM productos WHERE provId = :p"), {"p": prov_id}
+        )
+        stored_images = {row[0]: row[1] or "" for row in img_res.fetchall()}
+    candidates = []
+    for p in products:
+        img = p.get("image_url")
+        url = f"https://{siret_url}/{img}" if img else None
+        if url and stored_images.get(p.get("codigo")) != url:
+            candidates.append(url)
+    with jobs.stage("image_check"):
+        dead_images = await image_check.dead_urls(candidates)
+    # Procesar e insertar/actualizar en BD con cargas previas de lookup para eficiencia
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            # Preload marcas, subfamilias y productos existentes para reducir roundtrips
+            marc_res = await session.execute(
+                text("SELECT descripcion, id FROM marcas WHERE provId = :p"), {"p": prov_id}
+            )
+            marcas_map = {row[0]: row[1] for row in marc_res.fetchall()}
+            sub_res = await session.execute(
+                text("SELECT famId, descripcion FROM subfamilia WHERE provId = :p"), {"p": prov_id}
+            )
+            subfam_map = {row[0]: row[1] for row in sub_res.fetchall()}
+            prod_res = await session.execute(
+                text("SELECT sku, stock, imageUrl FROM productos WHERE provId = :p"), {"p": prov_id}
+            )
+            productos_map = {row[0]: {"stock": int(row[1] or 0), "imageUrl": row[2] or ""} for row in prod_res.fetchall()}
+            for p in products:
+                sku = p.get("codigo")
+                if not sku:
+                    continue
+                nombre = p.get("descripcion") or ""
+                fam_id = p.get("familia_id") or 0
+                fam_desc = p.get("familia") or ""
+                marca_desc = p.get("marca") or ""
+                stock = int(p.get("stock") or 0)
+                img = p.get("image_url")
+                image_url = f"https://{siret_url}/{img}" if img else 'no image'
+                if image_url in dead_images:
+                    image_url = 'no image'
+                # Marca: get or insert
+                marca_id = marcas_map.get(marca_desc)
+                if marca_id is None:
+                    await session.execute(
+                        text("INSERT INTO marcas (descripcion, provId) VALUES (:d, :p)"),
+                        {"d": marca_desc, "p": prov_id}
+                    )
+                    result = await session.execute(
+                        text("SELECT id FROM marcas WHERE descripcion = :d AND provId = :p"),
+                        {"d": marca_desc, "p": prov_id}
+                    )
+                    marca_id = result.scalar_one()
+                    marcas_map[marca_desc] = marca_id
+                # Subfamilia: get or insert/update
+                existing_desc = subfam_map.get(fam_id)
+                if existing_desc is not None:
+                    if fam_desc and existing_desc != fam_desc:
                         await session.execute(
-                            text("INSERT INTO subfamilia (famId, descripcion, provId) VALUES (:f, :d, :p)"),
-                            {"f": fam_id, "d": fam_desc, "p": prov_id}
+                            text("UPDATE subfamilia SET descripcion = :d WHERE famId = :f AND provId = :p"),
+                            {"d": fam_desc, "f": fam_id, "p": prov_id}
                         )
                         subfam_map[fam_id] = fam_desc
-                        subfam_id = fam_id
-                    # Productos: compare and update/insert
-                    existing = productos_map.get(sku)
-                    if existing:
-                        if existing.get("stock") != stock or existing.get("imageUrl") != image_url:
-                            await session.execute(
-                                text("UPDATE productos SET stock = :st, imageUrl = :iu WHERE sku = :s"),
-                                {"st": stock, "iu": image_url, "s": sku}
-                            )
-                            await session.execute(
-                                text("INSERT INTO prodsChanges (sku, tipo, provId) VALUES (:s, :t, :p)"),
-                                {"s": sku, "t": "Actualizado", "p": prov_id}
-                            )
-                            updated += 1
-                    else:
+                    subfam_id = fam_id
+                else:
+                    await session.execute(
+                        text("INSERT INTO subfamilia (famId, descripcion, provId) VALUES (:f, :d, :p)"),
+                        {"f": fam_id, "d": fam_desc, "p": prov_id}
+                    )
+                    subfam_map[fam_id] = fam_desc
+                    subfam_id = fam_id
+                # Productos: compare and update/insert
+                existing = productos_map.get(sku)
+                if existing:
+                    if existing.get("stock") != stock or existing.get("imageUrl") != image_url:
                         await session.execute(
-                            text(
-                                "INSERT INTO productos (sku, nombre, marcaId, subfamId, stock, imageUrl, provId)"
-                                " VALUES (:s, :n, :m, :sf, :st, :iu, :p)"
-                            ),
-                            {"s": sku, "n": nombre, "m": marca_id, "sf": subfam_id,
-                             "st": stock, "iu": image_url, "p": prov_id}
+                            text("UPDATE productos SET stock = :st, imageUrl = :iu WHERE sku = :s"),
+                            {"st": stock, "iu": image_url, "s": sku}
                         )
                         await session.execute(
                             text("INSERT INTO prodsChanges (sku, tipo, provId) VALUES (:s, :t, :p)"),
-                            {"s": sku, "t": "Nuevo", "p": prov_id}
+                            {"s": sku, "t": "Actualizado", "p": prov_id}
                         )
-                        inserted += 1
-        # Respuesta con resumen de la operación
-        return {"client": client, "total": len(products), "inserted": inserted, "updated": updated}
-    except RuntimeError as e:
-        # External SOAP error or timeout
-        raise HTTPException(status_code=502, detail=str(e))
-    except HTTPException:
-        # propagate HTTPExceptions
-        raise
-    except Exception as e:
-        # Any other error
-        raise HTTPException(status_code=500, detail=str(e))
+                        updated += 1
+                else:
+                    await session.execute(
+                        text(
+                            "INSERT INTO productos (sku, nombre, marcaId, subfamId, stock, imageUrl, provId)"
+                            " VALUES (:s, :n, :m, :sf, :st, :iu, :p)"
+                        ),
+                        {"s": sku, "n": nombre, "m": marca_id, "sf": subfam_id,
+                         "st": stock, "iu": image_url, "p": prov_id}
+                    )
+                    await session.execute(
+                        text("INSERT INTO prodsChanges (sku, tipo, provId) VALUES (:s, :t, :p)"),
+                        {"s": sku, "t": "Nuevo", "p": prov_id}
+                    )
+                    inserted += 1
+    if inserted or updated:
+        # La tabla productos alimenta /items de los clientes con proveedor 'db'
+        response_cache.invalidate(endpoint="items")
+    # Respuesta con resumen de la operación
+    return {
+        "client": client,
+        "total": len(products),
+        "inserted": inserted,
+        "updated": updated,
+        "deadImages": len(dead_images),
+    }
 
 @app.post(
     "/missingwp/{client}/create",
-    response_model=MessageResponse,
+    response_model=JobAcceptedResponse,
+    status_code=202,
     tags=["Sync"],
 )
-async def create_missing_wp(client: str, background_tasks: BackgroundTasks, request: Request):
+async def create_missing_wp(client: str, request: Request):
     """Inicia creación de productos faltantes en WooCommerce en background."""
-    log_call(request, client)
-    background_tasks.add_task(run_create_missing_wp, client)
-    return {"message": f"Creación de productos faltantes iniciada para {client}"}
+    return await submit_job("create_missing", client, f"Creación de productos faltantes iniciada para {client}", request)
 
 async def run_create_missing_wp(client: str):
     start = time.time()
@@ -867,16 +1222,35 @@ async def run_create_missing_wp(client: str):
         return
 
     wc = WooCommerceAPI(creds["url"], creds["ck"], creds["cs"])
+    fps = await PushFingerprints(client).load()
+    # Un intento anterior cortado deja su plan y los SKUs ya creados: no se repagina la tienda ni se duplican
+    checkpoint = await checkpoints.Checkpoint("create_missing", client).load()
+    completed = False
     try:
-        wp_products = await wc.get_all_products()
-        wp_skus = {p.get("sku") for p in wp_products if p.get("sku")}
-        local_products, provider = await fetch_local_products(client)
-        missing_prods = [p for p in local_products if p.get("sku") and p.get("sku") not in wp_skus]
+        if checkpoint.plan is None:
+            with jobs.stage("fetch_remote"):
+                wp_products = await wc.get_all_products()
+            wp_skus = {p.get("sku") for p in wp_products if p.get("sku")}
+        with jobs.stage("fetch_local"):
+            local_products, provider = await fetch_local_products(client)
+        if checkpoint.plan is None:
+            missing_prods = [p for p in local_products if p.get("sku") and p.get("sku") not in wp_skus]
+            await checkpoint.set_plan([p.get("sku") for p in missing_prods])
+        else:
+            # Datos locales actuales, pero solo de los SKUs del plan original
+            by_sku = {p.get("sku"): p for p in local_products if p.get("sku")}
+            missing_prods = [by_sku[sku] for sku in checkpoint.plan if sku in by_sku]
 
-        created = []
+        created = [{"sku": sku, "id": pid} for sku, pid in checkpoint.created_ids().items()]
         errors = []
 
-        for prod in missing_prods:
+        SYNC_DIFF_SIZE.observe(len(missing_prods), kind="create_missing")
+        jobs.set_total(len(missing_prods))
+        for position, prod in enumerate(missing_prods):
+            await jobs.advance()
+            checkpoint.cursor = position
+            if checkpoint.is_done(prod.get("sku")):
+                continue
             payload = {
                 "name": prod.get("nombre"),
                 "sku": prod.get("sku"),
@@ -886,23 +1260,199 @@ async def run_create_missing_wp(client: str):
                 "type": "simple"
             }
             try:
-                new_prod = await wc.create_product(payload)
+                try:
+                    new_prod = await wc.create_product(payload)
+                except Exception as e:
+                    # Reanudando: el SKU pudo crearse justo antes del corte; se adopta en lugar de fallar
+                    if not (checkpoint.resumed and checkpoints.is_duplicate_sku_error(e)):
+                        raise
+                    existing = await wc.find_by_sku(prod.get("sku"))
+                    if not existing:
+                        raise
+                    new_prod = existing[0]
+                await fps.record(prod.get("sku"), _pushed_fields(payload))
+                await checkpoint.done(prod.get("sku"), product_id=new_prod.get("id"))
                 created.append({"sku": prod.get("sku"), "id": new_prod.get("id")})
+                SYNC_WRITES.inc(client=client, kind="create_missing", op="create", result="ok")
             except Exception as e:
                 errors.append({"sku": prod.get("sku"), "error": str(e)})
+                SYNC_WRITES.inc(client=client, kind="create_missing", op="create", result="error")
+        # Plan recorrido: lo que falle de aquí en adelante no debe dejar el plan guardado para el próximo intento
+        completed = True
 
-        print(f"[{client}] Productos creados: {len(created)}, Errores: {len(errors)}")
+        log.info("Productos faltantes creados", extra={"client": client, "created_count": len(created), "errors_count": len(errors)})
         # no WhatsApp notification on successful response
+        return {
+            "client": client,
+            "created_count": len(created),
+            "errors_count": len(errors),
+            "elapsed": time.time() - start,
+            "resumed": checkpoint.resumed,
+            "skipped_checkpoint": checkpoint.skipped,
+            "created": created,
+            "errors": errors,
+        }
     except Exception as e:
         elapsed = time.time() - start
-        print(f"Error creando productos faltantes para {client}: {e}")
+        log.error("Error creando productos faltantes", extra={"client": client, "error": str(e)})
+        raise
+    finally:
+        if completed:
+            await checkpoint.clear()
+        else:
+            await checkpoint.save()
+        await fps.flush()
+        if fps.writes:
+            response_cache.invalidate(client, "inventory")
+
+
+jobs.manager.register("sync", run_sync_remote)
+jobs.manager.register("compare", run_compare_inventories)
+jobs.manager.register("create_missing", run_create_missing_wp)
 
 
+@app.get(
+    "/jobs",
+    response_model=list[JobResponse],
+    tags=["Jobs"],
+)
+async def list_jobs(client: Optional[str] = None, status: Optional[str] = None, limit: int = 50):
+    """Lista los trabajos en segundo plano más recientes."""
+    return await jobs.manager.list(client=client, status=status, limit=min(limit, 500))
+
+@app.get(
+    "/jobs/{job_id}",
+    response_model=JobResponse,
+    tags=["Jobs"],
+)
+async def get_job(job_id: str):
+    """Estado, progreso, resumen de cambios y tiempos de un trabajo."""
+    job = await jobs.manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+@app.post(
+    "/jobs/{job_id}/cancel",
+    response_model=JobResponse,
+    tags=["Jobs"],
+)
+async def cancel_job(job_id: str):
+    """Solicita la cancelación de un trabajo en cola o en ejecución."""
+    job = await jobs.manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    if job["status"] in jobs.FINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"El trabajo ya terminó ({job['status']})")
+    return await jobs.manager.cancel(job_id)
+
+
+@app.get("/jobs/{job_id}/trace", tags=["Jobs"])
+async def get_job_trace(job_id: str):
+    """Traza del trabajo en formato Chrome (abrir en chrome://tracing o ui.perfetto.dev)."""
+    return await get_trace(job_id)
+
+
+@app.get("/traces", tags=["Jobs"])
+async def list_traces(limit: int = 50):
+    """Trazas guardadas, de la más reciente a la más antigua."""
+    return tracing.list_traces(min(limit, 500))
+
+@app.get("/traces/{trace_id}", tags=["Jobs"])
+async def get_trace(trace_id: str):
+    path = tracing.trace_path(trace_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Traza no encontrada")
+    return FileResponse(path, media_type="application/json", filename=os.path.basename(path))
+
+
+def _require_profile_token(request: Request):
+    if not profiling.authorized(request.headers):
+        raise HTTPException(status_code=403, detail="Se requiere X-Profile-Token (PROFILE_TOKEN)")
+
+@app.get("/profiles", tags=["Jobs"])
+async def list_profiles(request: Request, limit: int = 50):
+    """Perfiles guardados y ocupación del perfilador."""
+    _require_profile_token(request)
+    return {**profiling.stats(), "profiles": profiling.list_profiles(min(limit, 500))}
+
+@app.get("/profiles/{profile_id}", tags=["Jobs"])
+async def get_profile(profile_id: str, request: Request, format: Optional[str] = None):
+    """Descarga un perfil: pstats o txt (cprofile), collapsed (sample) o json (metadatos)."""
+    _require_profile_token(request)
+    meta = profiling.get_meta(profile_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    fmt = format or profiling.FORMATS.get(meta.get("mode"), "json")
+    path = profiling.profile_path(profile_id, fmt)
+    if fmt not in ("pstats", "txt", "collapsed", "json") or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"Formato '{fmt}' no disponible para este perfil")
+    media_type = "application/octet-stream" if fmt == "pstats" else "text/plain"
+    if fmt == "json":
+        media_type = "application/json"
+    return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
+
+
+@app.get("/scheduler/stats", tags=["Jobs"])
+async def scheduler_stats():
+    """Ocupación del planificador y tiempos de espera en cola por cliente."""
+    return scheduler.stats()
+
+
+@app.get("/cache/stats", tags=["Products"])
+async def cache_stats():
+    """Respuestas guardadas en la caché de lectura (edad, tamaño, ETag) y refrescos en curso."""
+    return response_cache.stats()
+
+
+@app.get("/writes/stats", tags=["Sync"])
+async def writes_stats():
+    """Actualizaciones a WooCommerce por tienda: llamadas, PUT enviados y escrituras ahorradas por fusión."""
+    return write_buffer.stats()
+
+
+@app.get("/startup/stats", tags=["Jobs"])
+async def startup_stats():
+    """Duración de las importaciones (incluidas las diferidas) y de cada paso del warm-up."""
+    return startup.stats()
+
+
+async def _load_price_lists(configs: list):
+    """Registra las listas en listaprecio y devuelve sus IDs y los precios guardados de cada una."""
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            # Insert or update price lists, ensuring 'descrip' is unique
+            await session.execute(
+                text("""
+                    INSERT INTO listaprecio (descrip, prov)
+                    VALUES (:descrip, :prov)
+                    ON DUPLICATE KEY UPDATE prov = VALUES(prov)
+                """),
+                [{"descrip": cfg["priceList"], "prov": cfg["proveedor"]} for cfg in configs],
+            )
+            res = await session.execute(
+                text("SELECT id, descrip FROM listaprecio WHERE descrip IN :names")
+                .bindparams(bindparam("names", expanding=True)),
+                {"names": [cfg["priceList"] for cfg in configs]},
+            )
+            list_ids = {row.descrip: row.id for row in res}
+            by_id = {list_id: name for name, list_id in list_ids.items()}
+            existing_res = await session.execute(
+                text("SELECT listId, sku, precio FROM preciodetalle WHERE listId IN :ids")
+                .bindparams(bindparam("ids", expanding=True)),
+                {"ids": list(by_id)},
+            )
+            stored = {name: [] for name in list_ids}
+            for row in existing_res:
+                stored[by_id[row.listId]].append((row.sku, row.precio))
+    return list_ids, stored
+
 @app.post(
     "/updatePriceList",
     response_model=PriceListResponse,
     tags=["PriceList"],
 )
+@memory.tracked("price_list")
 async def updatePriceList():
     """
     Consulta listas desde configuración fija (en el mismo archivo), realiza SOAP, guarda en DB.
@@ -918,10 +1468,14 @@ async def updatePriceList():
     ]
 
     results = []
+    names = [cfg["priceList"] for cfg in price_lists]
+    matrix = price_matrix.PriceMatrix(names)
+    errors = {}
 
+    # Precios recibidos de cada lista
     for cfg in price_lists:
         try:
-            print(f"↪️ Procesando lista: {cfg['priceList']}")
+            log.info("Procesando lista de precios", extra={"priceList": cfg["priceList"]})
 
             resp = await wsc_request_bodega_all_items(
                 siret_url=cfg["siretUrl"],
@@ -930,67 +1484,60 @@ async def updatePriceList():
                 bid=cfg.get("bid", 0)
             )
 
-            print(resp)
-
             raw = resp.get("data", resp)
             items = raw if isinstance(raw, list) else []
 
-            print(f"[{cfg['priceList']}] Productos recibidos: {len(items)}")
+            log.info("Productos recibidos", extra={"priceList": cfg["priceList"], "count": len(items)})
+            matrix.add_current(cfg["priceList"], items)
+        except Exception as e:
+            errors[cfg["priceList"]] = e
 
-            async with AsyncSessionLocal() as session:
-                async with session.begin():
-                    # Insert or update price list, ensuring 'descrip' is unique
-                    await session.execute(
-                        text("""
-                            INSERT INTO listaprecio (descrip, prov)
-                            VALUES (:descrip, :prov)
-                            ON DUPLICATE KEY UPDATE prov = VALUES(prov)
-                        """),
-                        {"descrip": cfg["priceList"], "prov": cfg["proveedor"]},
-                    )
-                    # Retrieve the list ID based on unique 'descrip'
-                    res = await session.execute(
-                        text("SELECT id FROM listaprecio WHERE descrip = :descrip"),
-                        {"descrip": cfg["priceList"]},
-                    )
-                    list_id = res.scalar_one()
+    # IDs de lista y precios guardados de todas las listas en una sola ida a la BD
+    list_ids, stored = {}, {}
+    loaded = [cfg for cfg in price_lists if cfg["priceList"] not in errors]
+    try:
+        if loaded:
+            list_ids, stored = await _load_price_lists(loaded)
+    except Exception as e:
+        # Que una lista con problemas no haga fallar a las demás: reintentar de a una
+        log.warning("Error cargando las listas de precios; se reintenta por lista", extra={"error": str(e)})
+        for cfg in loaded:
+            try:
+                ids, rows = await _load_price_lists([cfg])
+            except Exception as e:
+                errors[cfg["priceList"]] = e
+                continue
+            list_ids.update(ids)
+            stored.update(rows)
+    for name, rows in stored.items():
+        matrix.add_stored(name, rows)
+
+    # Cambios de todas las listas en una pasada
+    changes = matrix.build().changes()
+    written = False
+    for cfg in price_lists:
+        name = cfg["priceList"]
+        try:
+            if name in errors:
+                raise errors[name]
+            diff = changes[name]
+            list_id = list_ids[name]
+            inserted, updated = diff["inserted"], diff["updated"]
+            # Determine SKUs to upsert (new or price-changed)
+            to_upsert = [
+                {"sku": matrix.skus[row], "precio": matrix.price(name, row), "list_id": list_id}
+                for row in inserted + updated
+            ]
+            new_rows = set(inserted)
+            messages = [
+                f"{'Insertado' if row in new_rows else 'Actualizado'} SKU: {matrix.skus[row]}"
+                for row in sorted(inserted + updated)[:10]
+            ]
 
-                    existing_res = await session.execute(
-                        text("SELECT sku, precio FROM preciodetalle WHERE listId = :list_id"),
-                        {"list_id": list_id},
-                    )
-                    existing = {row.sku: row.precio for row in existing_res}
-
-                    # Determine SKUs to upsert (new or price-changed)
-                    to_upsert = []
-                    inserted = updated = unchanged = 0
-                    messages = []
-
-                    for prod in items:
-                        sku = prod.get("codigo")
-                        price_raw = prod.get("precio")
-                        if not sku or price_raw is None:
-                            continue
-                        try:
-                            price = float(price_raw)
-                        except:
-                            continue
-
-                        old_price = existing.get(sku)
-                        if old_price is None:
-                            inserted += 1
-                            messages.append(f"Insertado SKU: {sku}")
-                        elif old_price != price:
-                            updated += 1
-                            messages.append(f"Actualizado SKU: {sku}")
-                        else:
-                            unchanged += 1
-                            continue
-
-                        to_upsert.append({"sku": sku, "precio": price, "list_id": list_id})
-
-                    # Bulk upsert new and changed prices in one query
-                    if to_upsert:
+            # Bulk upsert new and changed prices in one query
+            if to_upsert:
+                async with AsyncSessionLocal() as session:
+                    async with session.begin():
                         await session.execute(
                             text("""
                                 INSERT INTO preciodetalle (sku, precio, listId)
@@ -1000,20 +1547,22 @@ async def updatePriceList():
                             to_upsert,
                             execution_options={"multi": True},
                         )
+                written = True
 
             results.append({
-                "priceList": cfg["priceList"],
+                "priceList": name,
                 "listId": list_id,
-                "inserted": inserted,
-                "updated": updated,
-                "unchanged": unchanged,
-                "messages": messages[:10]
+                "inserted": len(inserted),
+                "updated": len(updated),
+                "unchanged": diff["unchanged"],
+                "messages": messages
             })
+            memory.checkpoint(name)
 
         except Exception as e:
             # If error, append a result with error message in 'messages'
             results.append({
-                "priceList": cfg["priceList"],
+                "priceList": name,
                 "listId": 0,
                 "inserted": 0,
                 "updated": 0,
@@ -1021,4 +1570,32 @@ async def updatePriceList():
                 "messages": [f"Error: {str(e)}"]
             })
 
-    return {"results": results}
\ No newline at end of file
+    if written:
+        response_cache.invalidate(endpoint="items")
+    # Para las consultas entre listas (/priceList/...) sin volver a la BD
+    price_matrix.set_latest(matrix)
+    return {"results": results}
+
+
+def _latest_price_matrix(price_list: str = None):
+    matrix = price_matrix.latest()
+    if matrix is None:
+        raise HTTPException(status_code=404, detail="Sin matriz de precios: ejecute /updatePriceList primero")
+    if price_list is not None and price_list not in matrix.lists:
+        raise HTTPException(status_code=404, detail=f"Lista de precios '{price_list}' no encontrada")
+    return matrix
+
+
+@app.get("/priceList/margins", tags=["PriceList"])
+async def price_list_margins(base: str = "PUBLICO"):
+    """Diferencia relativa de cada lista con `base` (última corrida de updatePriceList, sin consultar la BD)."""
+    matrix = _latest_price_matrix(base)
+    return {**matrix.summary(), "base": base, "margins": matrix.margins(base)}
+
+
+@app.get("/priceList/missing/{price_list}", tags=["PriceList"])
+async def price_list_missing(price_list: str, limit: int = 1000):
+    """SKUs con precio en otra lista pero no en `price_list` (última corrida de updatePriceList)."""
+    matrix = _latest_price_matrix(price_list)
+    skus = matrix.missing(price_list)
+    return {**matrix.summary(), "priceList": price_list, "count": len(skus), "skus": skus[:max(0, limit)]}
\ No newline at end of file
@@ -17,6 +17,7 @@ class ItemsResponse(BaseModel):
     count: int = Field(..., description="Número de productos retornados")
     elapsed: float = Field(..., description="Tiempo de ejecución en segundos")
     productos: List[Product] = Field(..., description="Lista de productos")
+    nextCursor: Optional[str] = Field(None, description="Cursor de la página siguiente (solo con limit)")
 
 # Campos permitidos para respuestas SOAP
 ALLOWED_SOAP_FIELDS: List[str] = [
@@ -31,6 +32,7 @@ class InventoryResponse(BaseModel):
     count: int
     elapsed: float
     productos: List[Product]
+    nextCursor: Optional[str] = None
 
 class SoapResponse(BaseModel):
     client: str
@@ -58,4 +60,31 @@ class PriceListResult(BaseModel):
     messages: List[str]
 
 class PriceListResponse(BaseModel):
-    results: List[PriceListResult]
\ No newline at end of file
+    results: List[PriceListResult]
+    memory: Optional[Dict[str, Any]] = None
+
+class JobProgress(BaseModel):
+    done: int
+    total: Optional[int] = None
+    percent: Optional[float] = None
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    client: str
+    params: Dict[str, Any] = {}
+    status: str = Field(..., description="queued, running, done, failed o cancelled")
+    progress: JobProgress
+    cancelRequested: bool = False
+    createdAt: float
+    startedAt: Optional[float] = None
+    finishedAt: Optional[float] = None
+    summary: Optional[Any] = None
+    timings: Optional[Dict[str, float]] = None
+    error: Optional[str] = None
+
+class JobAcceptedResponse(BaseModel):
+    message: str
+    jobId: str
+    status: str
+    deduplicated: bool = Field(..., description="True si ya existía un trabajo activo para el cliente")
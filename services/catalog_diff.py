@@ -0,0 +1,119 @@
+"""Diff de catálogos local y remoto para sync y compare.
+
+Funciones puras, sin E/S ni estado de la API, para poder correr en línea o en
+el pool de procesos (services.cpu_pool). La entrada viaja compacta: las
+páginas de WooCommerce como los bytes JSON recibidos (el parseo también se
+hace aquí) y los productos locales como Table; la salida son solo los SKUs
+con cambios, ordenados.
+"""
+import json
+from wooCalls import WooCommerceAPI
+from services.cpu_pool import Table, pack, unpack, offloaded
+
+# Campos locales que usan sync y compare
+LOCAL_KEYS = ("sku", "nombre", "precio", "stock", "image", "imageName")
+
+
+def local_input(local_products: list):
+    """Productos locales para sync_plan/compare_plan: empaquetados solo si van al pool."""
+    if offloaded(len(local_products)):
+        return pack(local_products, LOCAL_KEYS)
+    return local_products
+
+
+def remote_map(wp_products: list) -> dict:
+    """Productos de WooCommerce (ya filtrados) indexados por SKU, con ID e imagen."""
+    by_sku = {}
+    for p in wp_products:
+        sku = p.get("sku")
+        if not sku:
+            continue
+        imagen = p.get("imagen") or {}
+        by_sku[sku] = {
+            "id": p.get("id"),
+            "sku": sku,
+            "nombre": p.get("nombre") or "",
+            "precio": float(p.get("precio") or 0),
+            "stock": int(p.get("stock") or 0),
+            "image": imagen.get("src"),
+            "imageName": imagen.get("name")
+        }
+    return by_sku
+
+
+def local_map(local_products: list) -> dict:
+    """Productos locales indexados por SKU, con la información de imagen."""
+    by_sku = {}
+    for p in local_products:
+        sku = p.get("sku")
+        if not sku:
+            continue
+        by_sku[sku] = {
+            "nombre": p.get("nombre"),
+            "precio": p.get("precio"),
+            "stock": p.get("stock"),
+            "image": p.get("image"),
+            "imageName": p.get("imageName")
+        }
+    return by_sku
+
+
+def sync_changes(local: dict, remote: dict) -> dict:
+    """Cambios candidatos de stock e imagen para un SKU (sin filtrar imágenes rotas o ya enviadas)."""
+    changes = {}
+    # Sync stock if differs
+    if int(local.get("stock") or 0) != int(remote.get("stock") or 0):
+        changes["stock_quantity"] = int(local.get("stock") or 0)
+    # Sync image if name differs
+    local_image_name = local.get("imageName")
+    if local_image_name != "no image" and local_image_name != remote.get("imageName"):
+        changes["images"] = [{"src": local.get("image"), "name": local_image_name}]
+    return changes
+
+
+def inventory_diff(local: dict, remote: dict) -> dict:
+    """Diferencias de stock y nombre de imagen entre el producto local y el remoto."""
+    field_diffs = {}
+    # compare stock
+    local_stock = int(local.get("stock") or 0)
+    remote_stock = int(remote.get("stock") or 0)
+    if local_stock != remote_stock:
+        field_diffs["stock"] = {"local": local_stock, "remote": remote_stock}
+    # compare image names
+    local_img = local.get("imageName")
+    remote_img = remote.get("imageName")
+    if local_img != remote_img and local_img != "no image":
+        field_diffs["image"] = {"local": local_img, "remote": remote_img}
+    return field_diffs
+
+
+def _maps(remote_pages: list, local) -> tuple:
+    wp_products = []
+    for page in remote_pages:
+        wp_products.extend(WooCommerceAPI._filter_products(json.loads(page)))
+    by_remote = remote_map(wp_products)
+    # En línea llega la lista tal cual; hacia el pool, empaquetada
+    by_local = local_map(unpack(local) if isinstance(local, Table) else local)
+    return by_remote, by_local, sorted(set(by_remote) & set(by_local))
+
+
+def sync_plan(remote_pages: list, local) -> dict:
+    """SKUs compartidos y, por cada uno con cambios, (sku, ID remoto, nombre local, cambios candidatos)."""
+    by_remote, by_local, shared = _maps(remote_pages, local)
+    changes = []
+    for sku in shared:
+        candidate = sync_changes(by_local[sku], by_remote[sku])
+        if candidate:
+            changes.append((sku, by_remote[sku]["id"], by_local[sku].get("nombre"), candidate))
+    return {"shared": len(shared), "changes": changes}
+
+
+def compare_plan(remote_pages: list, local) -> dict:
+    """SKUs compartidos y, por cada uno con diferencias, (sku, ID remoto, imagen local, diferencias)."""
+    by_remote, by_local, shared = _maps(remote_pages, local)
+    diffs = []
+    for sku in shared:
+        field_diffs = inventory_diff(by_local[sku], by_remote[sku])
+        if field_diffs:
+            diffs.append((sku, by_remote[sku]["id"], by_local[sku].get("image"), field_diffs))
+    return {"shared": len(shared), "diffs": diffs}
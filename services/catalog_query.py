@@ -0,0 +1,182 @@
+"""Filtros y paginación por cursor de /items y /inventory.
+
+Sin parámetros ambos endpoints devuelven el catálogo completo como siempre.
+Con filtros (prefijo de SKU, categoría, solo con stock, modificados desde)
+y/o `limit` devuelven una página y `nextCursor`, un token opaco que se pasa
+como `cursor` para pedir la siguiente con los mismos filtros.
+
+- WooCommerce: categoría (por ID), stock y fecha de modificación van en la
+  consulta a la API (category, stock_status, modified_after); el cursor
+  guarda la página de WooCommerce y la posición dentro de ella, y se
+  recorren solo las páginas necesarias para llenar `limit`. El prefijo de
+  SKU y la categoría por nombre se aplican sobre cada página.
+- BD y SOAP: obtener_datos_productos y la consulta de bodega no aceptan
+  filtros, así que se aplican en proceso antes de validar y serializar; el
+  cursor es el último SKU devuelto (orden por SKU), estable aunque el
+  catálogo cambie entre páginas. `modified_since` no está disponible.
+"""
+import json
+import base64
+import hashlib
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import HTTPException, Query
+
+MAX_LIMIT = 5000
+WOO_PAGE_SIZE = 100
+
+# Claves de SKU, categoría y stock según el formato del producto
+DB_KEYS = ("sku", "categoria", "stock")
+SOAP_KEYS = ("codigo", "familia", "stock")
+WOO_KEYS = ("sku", "categoria", "stock")
+
+
+class CatalogQuery:
+    def __init__(self, limit: Optional[int] = None, cursor: Optional[str] = None, sku_prefix: Optional[str] = None,
+                 category: Optional[str] = None, in_stock: bool = False, modified_since: Optional[datetime] = None):
+        if limit is not None and not 1 <= limit <= MAX_LIMIT:
+            raise HTTPException(status_code=400, detail=f"limit debe estar entre 1 y {MAX_LIMIT}")
+        self.limit = limit
+        self.sku_prefix = sku_prefix or None
+        self.category = category.strip() if category and category.strip() else None
+        self.in_stock = in_stock
+        if modified_since is not None and modified_since.tzinfo is not None:
+            modified_since = modified_since.astimezone(timezone.utc).replace(tzinfo=None)
+        self.modified_since = modified_since
+        self.cursor = _decode(cursor, self.fingerprint) if cursor else None
+
+    @property
+    def active(self) -> bool:
+        return bool(self.limit or self.cursor or self.sku_prefix or self.category or self.in_stock
+                    or self.modified_since)
+
+    @property
+    def category_id(self) -> Optional[int]:
+        return int(self.category) if self.category and self.category.isdigit() else None
+
+    @property
+    def fingerprint(self) -> str:
+        """Hash de los filtros: un cursor solo vale para los filtros con que se generó."""
+        filters = [self.sku_prefix, self.category, self.in_stock,
+                   self.modified_since.isoformat() if self.modified_since else None]
+        return hashlib.sha1(json.dumps(filters).encode()).hexdigest()[:8]
+
+    @property
+    def variant(self) -> str:
+        """Clave de caché de esta consulta ('' para el catálogo completo)."""
+        if not self.active:
+            return ""
+        return json.dumps([self.fingerprint, self.limit, self.cursor], separators=(",", ":"))
+
+    def matches(self, item: dict, keys: tuple = DB_KEYS, category: bool = True) -> bool:
+        sku_key, category_key, stock_key = keys
+        if self.sku_prefix and not str(item.get(sku_key) or "").startswith(self.sku_prefix):
+            return False
+        if self.in_stock and not _positive(item.get(stock_key)):
+            return False
+        if category and self.category and not _category_matches(item.get(category_key), self.category):
+            return False
+        return True
+
+    # --- BD / SOAP: todo el catálogo en memoria, cursor por SKU ---
+
+    def page(self, items: list, keys: tuple = DB_KEYS) -> tuple:
+        """(productos de la página, siguiente cursor) filtrando y paginando en proceso."""
+        if self.modified_since:
+            raise HTTPException(status_code=400, detail="modified_since solo está disponible en /inventory")
+        sku_key = keys[0]
+        after = self.cursor.get("after") if self.cursor else None
+        selected = [
+            it for it in items
+            if self.matches(it, keys) and (after is None or str(it.get(sku_key) or "") > after)
+        ]
+        if self.limit is None:
+            return selected, None
+        selected.sort(key=lambda it: str(it.get(sku_key) or ""))
+        if len(selected) <= self.limit:
+            return selected, None
+        selected = selected[:self.limit]
+        return selected, _encode({"after": str(selected[-1].get(sku_key) or "")}, self.fingerprint)
+
+    # --- WooCommerce: filtros en la consulta, cursor por página ---
+
+    def woo_params(self) -> dict:
+        params = {}
+        if self.category_id is not None:
+            params["category"] = self.category_id
+        if self.in_stock:
+            params["stock_status"] = "instock"
+        if self.modified_since:
+            params["modified_after"] = self.modified_since.isoformat(timespec="seconds")
+            params["dates_are_gmt"] = "true"
+        return params
+
+    def woo_matches(self, item: dict) -> bool:
+        # La categoría por ID ya la aplicó WooCommerce
+        return self.matches(item, WOO_KEYS, category=self.category_id is None)
+
+    async def woo_page(self, wc) -> tuple:
+        """(productos de la página, siguiente cursor) recorriendo solo las páginas necesarias."""
+        params = self.woo_params()
+        page = self.cursor.get("page", 1) if self.cursor else 1
+        index = self.cursor.get("index", 0) if self.cursor else 0
+        selected = []
+        while True:
+            products, total_pages = await wc.get_products_page(page, WOO_PAGE_SIZE, params)
+            for pos in range(index, len(products)):
+                if not self.woo_matches(products[pos]):
+                    continue
+                selected.append(products[pos])
+                if self.limit is not None and len(selected) == self.limit:
+                    nxt = (page, pos + 1) if pos + 1 < len(products) else (page + 1, 0)
+                    if nxt[0] > total_pages:
+                        return selected, None
+                    return selected, _encode({"page": nxt[0], "index": nxt[1]}, self.fingerprint)
+            if page >= total_pages or not products:
+                return selected, None
+            page, index = page + 1, 0
+
+
+def from_params(
+    limit: Optional[int] = Query(None, description=f"Productos por página (1-{MAX_LIMIT})"),
+    cursor: Optional[str] = Query(None, description="nextCursor de la página anterior"),
+    sku_prefix: Optional[str] = Query(None, description="Solo SKUs que empiezan con este prefijo"),
+    category: Optional[str] = Query(None, description="ID o nombre de categoría"),
+    in_stock: bool = Query(False, description="Solo productos con stock > 0"),
+    modified_since: Optional[datetime] = Query(None, description="Modificados desde (ISO 8601; solo /inventory)"),
+) -> CatalogQuery:
+    """Dependencia de FastAPI con los parámetros de filtro y paginación."""
+    return CatalogQuery(limit, cursor, sku_prefix, category, in_stock, modified_since)
+
+
+def _positive(value) -> bool:
+    try:
+        return float(value or 0) > 0
+    except (TypeError, ValueError):
+        return False
+
+
+def _category_matches(value, wanted: str) -> bool:
+    """Compara por ID o nombre (sin mayúsculas); en BD la categoría es 'Padre > Hijo'."""
+    if isinstance(value, dict):
+        return str(value.get("id")) == wanted or str(value.get("name") or "").lower() == wanted.lower()
+    if value is None:
+        return False
+    text = str(value).lower()
+    wanted = wanted.lower()
+    return text == wanted or text.rsplit(">", 1)[-1].strip() == wanted
+
+
+def _encode(position: dict, fingerprint: str) -> str:
+    raw = json.dumps({**position, "f": fingerprint}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(token: str, fingerprint: str) -> dict:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="cursor inválido")
+    if not isinstance(data, dict) or data.pop("f", None) != fingerprint:
+        raise HTTPException(status_code=400, detail="El cursor no corresponde a estos filtros")
+    return data
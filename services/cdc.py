@@ -0,0 +1,313 @@
+"""Sincronización continua (CDC) de prodsChanges hacia WooCommerce.
+
+La corrida batch (sync_all.py) ejecuta syncPersonal y después vacía
+prodsChanges: los cambios esperan hasta la próxima corrida y las filas que
+llegan entre el sync y el TRUNCATE se pierden. El daemon CDC (cdc_sync.py)
+consulta prodsChanges cada CDC_POLL_INTERVAL segundos (5) y procesa lo nuevo
+en micro-lotes de hasta CDC_BATCH_SIZE filas (500) con la misma lógica de
+syncPersonal (main.push_changed_rows).
+
+Cada cliente tiene una marca de agua: el id de prodsChanges hasta el cual
+todas las filas fueron confirmadas. Se guarda en el almacén de estado
+(state_store), así un reinicio retoma donde quedó. Una fila se confirma solo
+después de que su SKU se envió bien a la tienda (o si getChangedProds no la
+devuelve para ese cliente, es decir, no le corresponde):
+
+  - las filas cuyo SKU falló se reintentan en las consultas siguientes; tras
+    CDC_MAX_ATTEMPTS intentos (5) pasan a cdc_dead_letters y la marca sigue;
+  - un hueco en los ids (una transacción todavía abierta, como la de
+    soap-store, o revertida) detiene la marca hasta CDC_GAP_TIMEOUT segundos
+    (300), para no saltarse filas que se confirmen tarde. Las filas
+    posteriores al hueco se procesan igual y no se reenvían.
+
+Las filas confirmadas por todos los clientes se borran de prodsChanges
+(CDC_DELETE_ACKED=1), salvo las de cdc_dead_letters, que quedan para la
+corrida batch o para revisarlas a mano. El borrado solo se hace cuando el
+daemon atiende a todos los clientes de syncPersonal: prodsChanges es
+compartida. La entrega es al menos una vez: tras un reinicio se reenvían
+las filas ya procesadas detrás de un hueco, y las huellas de push evitan
+las escrituras repetidas.
+"""
+import os
+import json
+import time
+import asyncio
+from sqlalchemy import text
+from services import state_store
+from services.scheduler import scheduler
+from utils import metrics
+from utils.logs import get_logger
+
+POLL_INTERVAL = float(os.getenv("CDC_POLL_INTERVAL", "5"))
+BATCH_SIZE = int(os.getenv("CDC_BATCH_SIZE", "500"))
+MAX_ATTEMPTS = int(os.getenv("CDC_MAX_ATTEMPTS", "5"))
+GAP_TIMEOUT = float(os.getenv("CDC_GAP_TIMEOUT", "300"))
+DELETE_ACKED = os.getenv("CDC_DELETE_ACKED", "1") == "1"
+
+CDC_ROWS = metrics.counter(
+    "cdc_rows_total", "Filas de prodsChanges procesadas por el daemon CDC", ("client", "result"))
+CDC_BATCH = metrics.histogram(
+    "cdc_batch_seconds", "Duración de cada micro-lote del daemon CDC", ("client", "status"))
+
+log = get_logger("cdc")
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS cdc_watermarks (
+    client TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cdc_dead_letters (
+    client TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    sku TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (client, row_id)
+);
+"""
+
+
+# --- Acceso a SQLite (se ejecuta en hilos vía state_store.run) ---
+
+def _schema():
+    state_store.ensure_schema("cdc", _DDL)
+
+
+def _load_watermark(client: str):
+    _schema()
+    row = state_store.fetchone("SELECT last_id FROM cdc_watermarks WHERE client = ?", (client,))
+    return row["last_id"] if row else None
+
+
+def _save_watermark(client: str, last_id: int):
+    _schema()
+    state_store.execute(
+        "INSERT OR REPLACE INTO cdc_watermarks (client, last_id, updated_at) VALUES (?, ?, ?)",
+        (client, last_id, time.time()),
+    )
+
+
+def _dead_letter(client: str, row_id: int, sku: str, attempts: int):
+    _schema()
+    state_store.execute(
+        "INSERT OR REPLACE INTO cdc_dead_letters (client, row_id, sku, attempts, created_at)"
+        " VALUES (?, ?, ?, ?, ?)",
+        (client, row_id, sku, attempts, time.time()),
+    )
+
+
+def _reset(client: str):
+    """Tras un TRUNCATE: marca en 0 y fuera las filas descartadas (sus ids se reutilizan)."""
+    _save_watermark(client, 0)
+    state_store.execute("DELETE FROM cdc_dead_letters WHERE client = ?", (client,))
+
+
+def _dead_letter_ids() -> list:
+    _schema()
+    return [row["row_id"] for row in state_store.fetchall("SELECT DISTINCT row_id FROM cdc_dead_letters")]
+
+
+def _excluding(sql: str, params: dict, ids: list) -> str:
+    """Agrega a `sql` la condición que deja fuera los `ids` (las filas de cdc_dead_letters)."""
+    if not ids:
+        return sql
+    params.update({f"k{i}": row_id for i, row_id in enumerate(ids)})
+    return sql + " AND id NOT IN (" + ", ".join(f":k{i}" for i in range(len(ids))) + ")"
+
+
+def _row_sku(row):
+    return getattr(row, 'Sku', None) or getattr(row, 'SKU', None) or getattr(row, 'sku', None)
+
+
+class _ClientState:
+    """Posición de un cliente en prodsChanges."""
+
+    def __init__(self, client: str, last_id: int):
+        self.client = client
+        self.last_id = last_id
+        # Ids posteriores a la marca ya confirmados (detrás de un hueco o de una fila pendiente)
+        self.done = set()
+        # Id -> intentos fallidos
+        self.attempts = {}
+        # (marca, desde) del hueco que detiene la marca
+        self.gap = None
+
+    def advance(self, ids: list) -> bool:
+        """Mueve la marca sobre los ids confirmados contiguos; True si cambió."""
+        last = self.last_id
+        for row_id in ids:
+            if row_id != last + 1:
+                if self.gap is None or self.gap[0] != last:
+                    self.gap = (last, time.monotonic())
+                if time.monotonic() - self.gap[1] < GAP_TIMEOUT:
+                    break
+                log.warning(
+                    "Hueco en prodsChanges: se continúa sin esas filas",
+                    extra={"client": self.client, "from": last + 1, "to": row_id - 1,
+                           "sample": f"cdc.gap.{self.client}"},
+                )
+            if row_id not in self.done:
+                break
+            self.done.discard(row_id)
+            last = row_id
+        changed = last != self.last_id
+        self.last_id = last
+        return changed
+
+
+class CdcDaemon:
+    """Consulta prodsChanges en bucle y envía los cambios de cada cliente."""
+
+    def __init__(self, clients: list, all_clients: bool = True):
+        self.clients = clients
+        # prodsChanges es compartida: solo se borra si se atiende a todos los clientes
+        self.delete_acked = DELETE_ACKED and all_clients
+        self._states = {}
+        self._stop = asyncio.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    async def _state(self, client: str) -> _ClientState:
+        state = self._states.get(client)
+        if state is None:
+            last_id = await state_store.run(_load_watermark, client)
+            if last_id is None:
+                # Primer arranque: desde la fila más antigua pendiente
+                from dbConn import AsyncSessionLocal
+                async with AsyncSessionLocal() as session:
+                    first = (await session.execute(text("SELECT MIN(id) FROM prodsChanges"))).scalar()
+                last_id = (first or 1) - 1
+                await state_store.run(_save_watermark, client, last_id)
+            state = self._states[client] = _ClientState(client, last_id)
+        return state
+
+    async def _read(self, state: _ClientState) -> list:
+        from dbConn import AsyncSessionLocal
+        # Las filas descartadas quedan en prodsChanges por debajo de la marca: no cuentan como tope
+        params = {}
+        sql = _excluding("SELECT MAX(id) FROM prodsChanges WHERE 1 = 1", params,
+                         await state_store.run(_dead_letter_ids))
+        async with AsyncSessionLocal() as session:
+            top = (await session.execute(text(sql), params)).scalar()
+            if top is not None and top < state.last_id:
+                # Los ids volvieron a empezar (TRUNCATE): la marca ya no sirve
+                log.warning(
+                    "prodsChanges fue vaciada; la marca vuelve a 0",
+                    extra={"client": state.client, "last_id": state.last_id, "max_id": top},
+                )
+                state.last_id, state.done, state.attempts, state.gap = 0, set(), {}, None
+                await state_store.run(_reset, state.client)
+            result = await session.execute(
+                text("SELECT id, sku FROM prodsChanges WHERE id > :after ORDER BY id LIMIT :n"),
+                {"after": state.last_id, "n": BATCH_SIZE + len(state.done)},
+            )
+            return [(row.id, row.sku) for row in result]
+
+    async def poll(self, client: str) -> dict:
+        """Un micro-lote de un cliente: lee, envía, confirma. Devuelve los conteos."""
+        import main
+        from getDataClient import getCredentials
+        state = await self._state(client)
+        creds = await getCredentials(client)
+        if not creds:
+            raise ValueError(f"Cliente '{client}' no encontrado en CLIENTS_API_JSON")
+        batch = await self._read(state)
+        pending = [(row_id, sku) for row_id, sku in batch if row_id not in state.done]
+        counts = {"client": client, "rows": len(pending), "acked": 0, "retry": 0, "dead_letter": 0}
+        if pending:
+            start = time.perf_counter()
+            status = "error"
+            try:
+                skus = {sku for _, sku in pending}
+                rows = [row for row in await main.fetch_changed_rows(creds) if _row_sku(row) in skus]
+                result = await main.push_changed_rows(client, creds, rows)
+                status = "ok"
+            finally:
+                CDC_BATCH.observe(time.perf_counter() - start, client=client, status=status)
+            failed = set(result["failed"])
+            for row_id, sku in pending:
+                if sku in failed:
+                    attempts = state.attempts.get(row_id, 0) + 1
+                    if attempts < MAX_ATTEMPTS:
+                        state.attempts[row_id] = attempts
+                        counts["retry"] += 1
+                        continue
+                    await state_store.run(_dead_letter, client, row_id, sku, attempts)
+                    counts["dead_letter"] += 1
+                    log.error(
+                        "Fila de prodsChanges descartada tras varios intentos",
+                        extra={"client": client, "row_id": row_id, "sku": sku, "attempts": attempts},
+                    )
+                else:
+                    counts["acked"] += 1
+                state.attempts.pop(row_id, None)
+                state.done.add(row_id)
+            for result_name in ("acked", "retry", "dead_letter"):
+                if counts[result_name]:
+                    CDC_ROWS.inc(counts[result_name], client=client, result=result_name)
+            counts["changes_count"] = result["changes_count"]
+        if state.advance([row_id for row_id, _ in batch]):
+            await state_store.run(_save_watermark, client, state.last_id)
+        counts["last_id"] = state.last_id
+        return counts
+
+    async def _cleanup(self):
+        """Borra de prodsChanges las filas que todos los clientes confirmaron."""
+        from dbConn import AsyncSessionLocal
+        if not self._states or len(self._states) < len(self.clients):
+            return
+        low = min(state.last_id for state in self._states.values())
+        keep = await state_store.run(_dead_letter_ids)
+        params = {"low": low}
+        sql = _excluding("DELETE FROM prodsChanges WHERE id <= :low", params, keep)
+        async with AsyncSessionLocal() as session:
+            async with session.begin():
+                await session.execute(text(sql), params)
+
+    async def _poll_one(self, client: str):
+        try:
+            return await scheduler.run(client, "cdc", self.poll, client)
+        except Exception as e:
+            # La marca no se movió: el lote se reintenta en la próxima consulta
+            log.error("Error en el micro-lote CDC", extra={"client": client, "error": str(e) or repr(e)})
+            return {"client": client, "error": str(e) or repr(e)}
+
+    async def run_once(self) -> list:
+        results = await asyncio.gather(*(self._poll_one(c) for c in self.clients))
+        if self.delete_acked:
+            try:
+                await self._cleanup()
+            except Exception as e:
+                log.error("Error borrando filas confirmadas de prodsChanges", extra={"error": str(e)})
+        for r in results:
+            if r.get("rows"):
+                log.info(
+                    f"CDC {r['client']}: {r['acked']} confirmadas, {r['retry']} a reintentar",
+                    extra={**r, "sample": f"cdc.batch.{r['client']}"},
+                )
+        return results
+
+    async def run(self, interval: float = POLL_INTERVAL):
+        """Consulta hasta stop(); si un lote vino lleno, vuelve a consultar sin esperar."""
+        log.info("Daemon CDC iniciado", extra={"clients": self.clients, "interval": interval})
+        while not self._stop.is_set():
+            results = await self.run_once()
+            if any(r.get("rows", 0) >= BATCH_SIZE for r in results):
+                continue
+            try:
+                await asyncio.wait_for(self._stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+        log.info("Daemon CDC detenido")
+
+
+def sync_clients() -> list:
+    """Clientes de CLIENTS_API_JSON que usan syncPersonal (los que tienen dbId)."""
+    try:
+        entries = json.loads(os.getenv("CLIENTS_API_JSON", "[]"))
+    except json.JSONDecodeError as e:
+        log.error("Error parsing CLIENTS_API_JSON", extra={"error": str(e)})
+        return []
+    return [e["client"] for e in entries if e.get("client") and e.get("dbId") is not None]
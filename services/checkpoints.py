@@ -0,0 +1,199 @@
+"""Checkpoints de corridas de sync para reanudarlas tras un corte.
+
+Si el proceso se reinicia o una tienda excede el timeout a mitad de
+syncPersonal o de create-missing, la corrida siguiente retoma desde el
+checkpoint en lugar de empezar de cero. Por (tipo, cliente) se guarda en el
+almacén de estado:
+
+  - los SKUs ya procesados, con la huella de la fila de origen (syncPersonal)
+    y el ID del producto creado, si hubo creación;
+  - la posición (cursor) dentro del plan de la corrida;
+  - el plan, si la corrida lo calcula con un paso caro (create-missing guarda
+    los SKUs faltantes y al reanudar no vuelve a paginar la tienda).
+
+Los SKUs se agregan en lotes, cada SYNC_CHECKPOINT_EVERY ítems (100) o
+SYNC_CHECKPOINT_SECONDS segundos (10), y al cortar la corrida. Una corrida
+que termina borra su checkpoint. Se descarta, y la corrida empieza de cero,
+el checkpoint de una corrida iniciada hace más de SYNC_CHECKPOINT_MAX_AGE
+segundos (86400) o ya reanudada SYNC_CHECKPOINT_MAX_RESUMES veces (3): un
+error que se repite en cada intento no congela el plan para siempre.
+"""
+import os
+import json
+import time
+import httpx
+from services import state_store
+from services.fingerprints import fingerprint
+from utils.logs import get_logger
+
+EVERY = int(os.getenv("SYNC_CHECKPOINT_EVERY", "100"))
+SECONDS = float(os.getenv("SYNC_CHECKPOINT_SECONDS", "10"))
+MAX_AGE = float(os.getenv("SYNC_CHECKPOINT_MAX_AGE", "86400"))
+MAX_RESUMES = int(os.getenv("SYNC_CHECKPOINT_MAX_RESUMES", "3"))
+
+log = get_logger("checkpoints")
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS sync_checkpoints (
+    kind TEXT NOT NULL,
+    client TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    cursor INTEGER NOT NULL DEFAULT 0,
+    plan TEXT,
+    resumes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, client)
+);
+CREATE TABLE IF NOT EXISTS sync_checkpoint_items (
+    kind TEXT NOT NULL,
+    client TEXT NOT NULL,
+    sku TEXT NOT NULL,
+    fp TEXT,
+    product_id INTEGER,
+    PRIMARY KEY (kind, client, sku)
+);
+"""
+
+
+def row_fingerprint(row) -> str:
+    """Huella de una fila de origen: si cambió desde el checkpoint, el SKU se vuelve a procesar."""
+    mapping = getattr(row, "_mapping", None)
+    return fingerprint(dict(mapping) if mapping is not None else vars(row))
+
+
+def is_duplicate_sku_error(exc: Exception) -> bool:
+    """WooCommerce responde 400 product_invalid_sku si el SKU ya existe.
+
+    Al reanudar, es la creación que se completó en la tienda justo antes del
+    corte sin llegar al checkpoint.
+    """
+    if not isinstance(exc, httpx.HTTPStatusError) or exc.response.status_code != 400:
+        return False
+    try:
+        return exc.response.json().get("code") == "product_invalid_sku"
+    except Exception:
+        return False
+
+
+# --- Acceso a SQLite (se ejecuta en hilos vía state_store.run) ---
+
+def _schema():
+    state_store.ensure_schema("sync_checkpoints", _DDL)
+
+
+def _clear(kind: str, client: str):
+    _schema()
+    state_store.execute("DELETE FROM sync_checkpoints WHERE kind = ? AND client = ?", (kind, client))
+    state_store.execute("DELETE FROM sync_checkpoint_items WHERE kind = ? AND client = ?", (kind, client))
+
+
+def _load(kind: str, client: str, now: float):
+    _schema()
+    header = state_store.fetchone(
+        "SELECT started_at, cursor, plan, resumes FROM sync_checkpoints WHERE kind = ? AND client = ?",
+        (kind, client),
+    )
+    if header is None:
+        return None, []
+    # La edad se cuenta desde el inicio de la corrida: cada intento fallido actualiza updated_at
+    if now - header["started_at"] > MAX_AGE or header["resumes"] >= MAX_RESUMES:
+        log.warning(
+            "Checkpoint descartado",
+            extra={"kind": kind, "client": client, "resumes": header["resumes"],
+                   "age": round(now - header["started_at"])},
+        )
+        _clear(kind, client)
+        return None, []
+    state_store.execute(
+        "UPDATE sync_checkpoints SET resumes = resumes + 1 WHERE kind = ? AND client = ?", (kind, client))
+    items = state_store.fetchall(
+        "SELECT sku, fp, product_id FROM sync_checkpoint_items WHERE kind = ? AND client = ?",
+        (kind, client),
+    )
+    return dict(header), [(row["sku"], row["fp"], row["product_id"]) for row in items]
+
+
+def _save(kind: str, client: str, started_at: float, cursor: int, plan, items: list, now: float):
+    _schema()
+    state_store.execute(
+        "INSERT INTO sync_checkpoints (kind, client, started_at, updated_at, cursor, plan) VALUES (?, ?, ?, ?, ?, ?)"
+        " ON CONFLICT (kind, client) DO UPDATE SET updated_at = excluded.updated_at, cursor = excluded.cursor,"
+        " plan = COALESCE(excluded.plan, plan)",
+        (kind, client, started_at, now, cursor, plan),
+    )
+    if items:
+        state_store.executemany(
+            "INSERT OR REPLACE INTO sync_checkpoint_items (kind, client, sku, fp, product_id)"
+            " VALUES (?, ?, ?, ?, ?)",
+            [(kind, client, sku, fp, product_id) for sku, fp, product_id in items],
+        )
+
+
+class Checkpoint:
+    """Avance de una corrida de (tipo, cliente), cargado en memoria y persistido por lotes."""
+
+    def __init__(self, kind: str, client: str):
+        self.kind = kind
+        self.client = client
+        self.started_at = time.time()
+        self.resumed = False
+        self.cursor = 0
+        self.plan = None
+        self.skipped = 0
+        self._done = {}
+        self._pending = []
+        self._plan_dirty = False
+        self._last_save = time.monotonic()
+
+    async def load(self):
+        header, items = await state_store.run(_load, self.kind, self.client, time.time())
+        if header is not None:
+            self.resumed = True
+            self.started_at = header["started_at"]
+            self.cursor = header["cursor"]
+            self.plan = json.loads(header["plan"]) if header["plan"] else None
+            self._done = {sku: (fp, product_id) for sku, fp, product_id in items}
+            log.info(
+                "Reanudando corrida desde checkpoint",
+                extra={"kind": self.kind, "client": self.client, "done": len(self._done), "cursor": self.cursor},
+            )
+        return self
+
+    def is_done(self, sku: str, fp: str = None) -> bool:
+        """Si el SKU ya se procesó (y, con `fp`, a partir de la misma fila de origen)."""
+        entry = self._done.get(sku)
+        if entry is None or (fp is not None and entry[0] != fp):
+            return False
+        self.skipped += 1
+        return True
+
+    def created_ids(self) -> dict:
+        """SKU -> ID de los productos creados en intentos anteriores de la corrida."""
+        return {sku: product_id for sku, (_, product_id) in self._done.items() if product_id is not None}
+
+    async def done(self, sku: str, fp: str = None, product_id: int = None):
+        self._done[sku] = (fp, product_id)
+        self._pending.append((sku, fp, product_id))
+        if len(self._pending) >= EVERY or time.monotonic() - self._last_save >= SECONDS:
+            await self.save()
+
+    async def set_plan(self, plan: list):
+        self.plan = plan
+        self._plan_dirty = True
+        await self.save()
+
+    async def save(self):
+        if not self._done and self.plan is None:
+            return  # nada que retomar todavía
+        pending, self._pending = self._pending, []
+        plan = json.dumps(self.plan) if self._plan_dirty else None
+        self._plan_dirty = False
+        self._last_save = time.monotonic()
+        await state_store.run(
+            _save, self.kind, self.client, self.started_at, self.cursor, plan, pending, time.time(),
+        )
+
+    async def clear(self):
+        """La corrida terminó: el próximo intento empieza de cero."""
+        self._pending = []
+        await state_store.run(_clear, self.kind, self.client)
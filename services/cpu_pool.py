@@ -0,0 +1,104 @@
+"""Pool de procesos para las etapas de CPU que bloqueaban el event loop.
+
+El diff de catálogos de sync/compare y la deserialización de respuestas SOAP
+grandes (parseo de zeep y serialize_object) son Python puro: en el hilo del
+loop, o en el executor de hilos con el GIL tomado, frenan todas las demás
+peticiones. Con CPU_POOL_WORKERS > 0 (0 por defecto: todo en línea, como
+antes) esas etapas corren en un ProcessPoolExecutor de ese tamaño, creado con
+la primera tarea y con procesos "spawn" (no heredan los hilos del worker).
+
+Pasar datos a otro proceso cuesta pickle de ida y vuelta, así que viajan
+compactos: listas de dicts con las mismas claves como Table (columnas y
+tuplas), páginas de WooCommerce como los bytes recibidos. Las entradas con
+menos de CPU_POOL_MIN_ITEMS ítems (2000) se procesan en línea, donde el viaje
+costaría más que el trabajo. cpu_task_seconds (por tarea y modo) y
+event_loop_lag_seconds de /metrics permiten comparar con el pool activado y
+desactivado.
+"""
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from utils import metrics, tracing
+from utils.logs import get_logger
+
+WORKERS = int(os.getenv("CPU_POOL_WORKERS", "0"))
+MIN_ITEMS = int(os.getenv("CPU_POOL_MIN_ITEMS", "2000"))
+
+CPU_TASKS = metrics.histogram(
+    "cpu_task_seconds", "Duración de las etapas de CPU (en línea o en el pool de procesos)", ("task", "mode"))
+
+log = get_logger("cpu_pool")
+
+_pool = None
+
+
+class Table:
+    """Lista de dicts con las mismas claves como columnas + tuplas: más chica y rápida de serializar."""
+    __slots__ = ("keys", "rows")
+
+    def __init__(self, keys: tuple, rows: list):
+        self.keys = keys
+        self.rows = rows
+
+    def __reduce__(self):
+        return Table, (self.keys, self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def pack(records: list, keys: tuple) -> Table:
+    return Table(keys, [tuple(map(r.get, keys)) for r in records])
+
+
+def unpack(table: Table) -> list:
+    keys = table.keys
+    return [dict(zip(keys, row)) for row in table.rows]
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def offloaded(items: int = None) -> bool:
+    """Si una tarea de `items` ítems iría al pool de procesos."""
+    return WORKERS > 0 and (items is None or items >= MIN_ITEMS)
+
+
+async def run(task: str, fn, *args, items: int = None):
+    """fn(*args) en el pool de procesos, o en línea si está desactivado o la entrada es chica.
+
+    `fn` debe ser una función de módulo (se importa en el proceso hijo).
+    """
+    global _pool
+    start = time.perf_counter()
+    mode = "inline"
+    try:
+        if not offloaded(items):
+            return fn(*args)
+        mode = "process"
+        loop = asyncio.get_running_loop()
+        with tracing.span(f"cpu {task}", cat="cpu", items=items):
+            try:
+                return await loop.run_in_executor(_executor(), fn, *args)
+            except BrokenProcessPool:
+                # Un hijo murió (p. ej. por memoria): se recrea el pool en la próxima tarea
+                log.error("Pool de procesos roto; se ejecuta en línea", extra={"task": task})
+                _pool = None
+                mode = "inline"
+                return fn(*args)
+    finally:
+        CPU_TASKS.observe(time.perf_counter() - start, task=task, mode=mode)
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,133 @@
+"""Huellas de los últimos campos enviados con éxito a WooCommerce por (tienda, SKU).
+
+Permiten omitir escrituras redundantes: solo se envían los campos cuyo valor
+cambió desde el último push y, si ninguno cambió, no se hace la petición.
+Si la tienda responde 404 (el producto se borró en WooCommerce), las huellas
+del SKU se descartan para que el próximo push envíe todos sus campos.
+
+Una huella vence a los PUSH_FINGERPRINT_TTL segundos (86400): un producto
+borrado o editado directamente en WooCommerce sin que un push lo note vuelve
+a recibir todos sus campos (y se recrea si ya no existe) en la primera
+corrida posterior. 0 desactiva el vencimiento.
+"""
+import os
+import json
+import time
+import hashlib
+import httpx
+from services import state_store
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS push_fingerprints (
+    store TEXT NOT NULL,
+    sku TEXT NOT NULL,
+    field TEXT NOT NULL,
+    fp TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (store, sku, field)
+);
+"""
+
+TTL = float(os.getenv("PUSH_FINGERPRINT_TTL", "86400"))
+
+# Número de huellas pendientes tras el cual se persisten sin esperar al final
+FLUSH_EVERY = 200
+
+
+def fingerprint(value) -> str:
+    """Huella estable de un valor JSON-serializable."""
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _load(store: str) -> dict:
+    state_store.ensure_schema("push_fingerprints", _DDL)
+    if TTL > 0:
+        state_store.execute(
+            "DELETE FROM push_fingerprints WHERE store = ? AND updated_at < ?", (store, time.time() - TTL)
+        )
+    rows = state_store.fetchall(
+        "SELECT sku, field, fp FROM push_fingerprints WHERE store = ?", (store,)
+    )
+    return {(row["sku"], row["field"]): row["fp"] for row in rows}
+
+
+def _save(store: str, entries: list):
+    state_store.ensure_schema("push_fingerprints", _DDL)
+    now = time.time()
+    state_store.executemany(
+        "INSERT OR REPLACE INTO push_fingerprints (store, sku, field, fp, updated_at)"
+        " VALUES (?, ?, ?, ?, ?)",
+        [(store, sku, field, fp, now) for sku, field, fp in entries],
+    )
+
+
+def _forget(store: str, sku: str):
+    state_store.ensure_schema("push_fingerprints", _DDL)
+    state_store.execute(
+        "DELETE FROM push_fingerprints WHERE store = ? AND sku = ?", (store, sku)
+    )
+
+
+class PushFingerprints:
+    """Huellas de una tienda cargadas en memoria durante una corrida de sync."""
+
+    def __init__(self, store: str):
+        self.store = store
+        self._known = {}
+        self._pending = []
+        self.skipped_fields = 0
+        self.skipped_requests = 0
+        # Escrituras registradas en la corrida (los lectores cacheados las usan para invalidar)
+        self.writes = 0
+
+    async def load(self):
+        self._known = await state_store.run(_load, self.store)
+        return self
+
+    def changed(self, sku: str, fields: dict) -> dict:
+        """Devuelve solo los campos cuya huella difiere de la última enviada."""
+        out = {}
+        for field, value in fields.items():
+            if self._known.get((sku, field)) != fingerprint(value):
+                out[field] = value
+        self.skipped_fields += len(fields) - len(out)
+        return out
+
+    def skip_request(self):
+        """Cuenta una petición omitida porque no quedó nada que enviar."""
+        self.skipped_requests += 1
+
+    def is_current(self, sku: str, field: str, value) -> bool:
+        return self._known.get((sku, field)) == fingerprint(value)
+
+    async def record(self, sku: str, fields: dict):
+        """Registra los campos enviados con éxito para el SKU."""
+        if fields:
+            self.writes += 1
+        for field, value in fields.items():
+            fp = fingerprint(value)
+            self._known[(sku, field)] = fp
+            self._pending.append((sku, field, fp))
+        if len(self._pending) >= FLUSH_EVERY:
+            await self.flush()
+
+    async def forget(self, sku: str):
+        """Descarta las huellas de un SKU (p. ej. si el producto ya no existe)."""
+        for key in [k for k in self._known if k[0] == sku]:
+            del self._known[key]
+        self._pending = [p for p in self._pending if p[0] != sku]
+        await state_store.run(_forget, self.store, sku)
+
+    async def forget_if_gone(self, sku: str, exc: Exception) -> bool:
+        """Descarta las huellas del SKU si `exc` es un 404 de la tienda."""
+        if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 404:
+            await self.forget(sku)
+            return True
+        return False
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        await state_store.run(_save, self.store, pending)
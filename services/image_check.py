@@ -0,0 +1,157 @@
+"""Validación previa y concurrente de URLs de imagen, con caché de resultados.
+
+Las URLs de imagen de SIRETT y de la BD suelen estar rotas; WooCommerce tarda
+segundos en intentar descargarlas y luego rechaza la escritura completa del
+producto. Antes de escribir se verifican las URLs candidatas con HEAD (con GET
+de un byte como respaldo si el servidor no admite HEAD), limitando las
+peticiones simultáneas por host. Los resultados se guardan con TTL en el
+almacén local para no repetir la verificación en cada corrida.
+
+Solo cuenta como rota una URL con respuesta definitiva: 404/410 o un
+content-type que no es de imagen. Un timeout, un error de conexión u otro
+estado de error (5xx, 429...) deja la URL sin verificar: se trata como válida
+y no se guarda, para que una caída pasajera no termine escrita como
+'no image'.
+"""
+import os
+import time
+import asyncio
+from urllib.parse import urlparse
+import httpx
+from services import state_store
+
+ENABLED = os.getenv("IMAGE_CHECK_ENABLED", "1") == "1"
+PER_HOST = int(os.getenv("IMAGE_CHECK_PER_HOST", "4"))
+TIMEOUT = float(os.getenv("IMAGE_CHECK_TIMEOUT", "5"))
+# Estados que indican que la imagen ya no existe
+DEAD_STATUS = (404, 410)
+# Vigencia de un resultado positivo y de uno negativo, en segundos
+TTL_OK = int(os.getenv("IMAGE_CHECK_TTL", "86400"))
+TTL_DEAD = int(os.getenv("IMAGE_CHECK_DEAD_TTL", "3600"))
+# Entradas máximas de la caché en memoria del proceso
+MEMORY_MAX = int(os.getenv("IMAGE_CHECK_MEMORY_MAX", "50000"))
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS image_checks (
+    url TEXT PRIMARY KEY,
+    ok INTEGER NOT NULL,
+    status INTEGER,
+    checked_at REAL NOT NULL
+);
+"""
+
+# Caché en memoria del proceso: url -> (ok, expira_en), en orden de inserción
+_memory = {}
+
+
+def _remember(url: str, entry: tuple, now: float):
+    """Guarda un resultado en memoria sin pasar de MEMORY_MAX entradas."""
+    _memory.pop(url, None)
+    if len(_memory) >= MEMORY_MAX:
+        for key in [k for k, (_, expires) in _memory.items() if expires <= now]:
+            del _memory[key]
+        # Si todo sigue vigente, fuera las más antiguas
+        for key in list(_memory)[:len(_memory) - MEMORY_MAX + 1]:
+            del _memory[key]
+    _memory[url] = entry
+
+
+def _load(urls: list) -> dict:
+    state_store.ensure_schema("image_checks", _DDL)
+    now = time.time()
+    found = {}
+    # Consultar en bloques para no exceder el límite de parámetros de SQLite
+    for i in range(0, len(urls), 500):
+        chunk = urls[i:i + 500]
+        rows = state_store.fetchall(
+            f"SELECT url, ok, checked_at FROM image_checks WHERE url IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        for row in rows:
+            ttl = TTL_OK if row["ok"] else TTL_DEAD
+            if row["checked_at"] + ttl > now:
+                found[row["url"]] = (bool(row["ok"]), row["checked_at"] + ttl)
+    return found
+
+
+def _save(results: list):
+    state_store.ensure_schema("image_checks", _DDL)
+    now = time.time()
+    state_store.executemany(
+        "INSERT OR REPLACE INTO image_checks (url, ok, status, checked_at) VALUES (?, ?, ?, ?)",
+        [(url, int(ok), status, now) for url, ok, status in results],
+    )
+
+
+def _looks_like_url(url: str) -> bool:
+    parsed = urlparse(url or "")
+    return parsed.scheme in ("http", "https") and bool(parsed.netloc)
+
+
+async def _probe(client: httpx.AsyncClient, url: str, sem: asyncio.Semaphore):
+    async with sem:
+        try:
+            resp = await client.head(url)
+            if resp.status_code in (403, 405, 501):
+                # Algunos servidores no aceptan HEAD: pedir solo el primer byte
+                resp = await client.get(url, headers={"Range": "bytes=0-0"})
+        except httpx.HTTPError:
+            # Error transitorio (timeout, conexión): resultado desconocido
+            return url, None, None
+    if resp.status_code in DEAD_STATUS:
+        return url, False, resp.status_code
+    if resp.status_code >= 400:
+        return url, None, None  # 5xx, 429, 401...: el servidor no respondió por la imagen
+    content_type = resp.headers.get("content-type", "")
+    return url, not content_type or content_type.startswith("image/"), resp.status_code
+
+
+async def check_urls(urls) -> dict:
+    """Devuelve {url: bool} indicando qué URLs de imagen responden con una imagen.
+
+    Las que no se pudieron verificar cuentan como válidas (True).
+    """
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not ENABLED:
+        return {u: True for u in urls}
+    now = time.time()
+    results = {}
+    pending = []
+    for url in urls:
+        if not _looks_like_url(url):
+            results[url] = False
+            continue
+        cached = _memory.get(url)
+        if cached and cached[1] > now:
+            results[url] = cached[0]
+        else:
+            pending.append(url)
+    if pending:
+        stored = await state_store.run(_load, pending)
+        for url, entry in stored.items():
+            _remember(url, entry, now)
+            results[url] = entry[0]
+        pending = [u for u in pending if u not in stored]
+    if pending:
+        hosts = {}
+        async with httpx.AsyncClient(timeout=TIMEOUT, follow_redirects=True) as client:
+            probed = await asyncio.gather(*(
+                _probe(client, url, hosts.setdefault(urlparse(url).netloc, asyncio.Semaphore(PER_HOST)))
+                for url in pending
+            ))
+        verified = []
+        for url, ok, status in probed:
+            if ok is None:
+                results[url] = True  # sin verificar: se reintenta en la próxima corrida
+                continue
+            results[url] = ok
+            verified.append((url, ok, status))
+            _remember(url, (ok, now + (TTL_OK if ok else TTL_DEAD)), now)
+        if verified:
+            await state_store.run(_save, verified)
+    return results
+
+
+async def dead_urls(urls) -> set:
+    """Conjunto de URLs de imagen rotas entre las candidatas."""
+    return {url for url, ok in (await check_urls(urls)).items() if not ok}
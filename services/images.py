@@ -0,0 +1,215 @@
+"""Deduplicación de imágenes contra la biblioteca de medios de WordPress.
+
+Enviar una imagen como {"src": url} hace que WordPress la descargue y cree un
+medio nuevo en cada escritura. MediaLibrary mantiene por tienda un mapa
+URL de origen -> ID de medio (y hash de contenido -> ID cuando sube el
+archivo directamente), de modo que las escrituras referencian {"id": media_id}
+cuando la imagen ya existe y cada imagen nueva se sube una sola vez.
+
+Si el cliente tiene "wpUser" y "wpAppPassword" en CLIENTS_API_JSON, las
+imágenes nuevas se descargan, se deduplican por contenido y se suben vía
+/wp/v2/media. Si no, se deja que WooCommerce haga el sideload la primera vez
+y se aprende el ID del medio desde la respuesta del producto.
+"""
+import time
+import asyncio
+import hashlib
+import mimetypes
+import httpx
+from services import state_store, write_buffer
+from utils.logs import get_logger
+
+log = get_logger("images")
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS media_map (
+    store TEXT NOT NULL,
+    key_type TEXT NOT NULL,
+    key TEXT NOT NULL,
+    media_id INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (store, key_type, key)
+);
+"""
+
+DOWNLOAD_TIMEOUT = 20
+
+
+def _load(store: str) -> dict:
+    state_store.ensure_schema("media_map", _DDL)
+    rows = state_store.fetchall(
+        "SELECT key_type, key, media_id FROM media_map WHERE store = ?", (store,)
+    )
+    return {(row["key_type"], row["key"]): row["media_id"] for row in rows}
+
+
+def _save(store: str, entries: list):
+    state_store.ensure_schema("media_map", _DDL)
+    now = time.time()
+    state_store.executemany(
+        "INSERT OR REPLACE INTO media_map (store, key_type, key, media_id, updated_at)"
+        " VALUES (?, ?, ?, ?, ?)",
+        [(store, key_type, key, media_id, now) for key_type, key, media_id in entries],
+    )
+
+
+def _delete_media(store: str, media_id: int):
+    state_store.ensure_schema("media_map", _DDL)
+    state_store.execute(
+        "DELETE FROM media_map WHERE store = ? AND media_id = ?", (store, media_id)
+    )
+
+
+def _is_invalid_image_error(exc: Exception) -> bool:
+    """WooCommerce responde 400 si un ID de imagen ya no es un adjunto válido."""
+    if not isinstance(exc, httpx.HTTPStatusError) or exc.response.status_code != 400:
+        return False
+    try:
+        code = exc.response.json().get("code", "")
+    except Exception:
+        return False
+    return "image" in code or "attachment" in code
+
+
+class MediaLibrary:
+    """Mapa de imágenes ya subidas a una tienda y escrituras de producto que lo usan."""
+
+    def __init__(self, store: str, wc, creds: dict = None):
+        self.store = store
+        self.wc = wc
+        creds = creds or {}
+        self.upload_auth = (
+            (creds["wpUser"], creds["wpAppPassword"])
+            if creds.get("wpUser") and creds.get("wpAppPassword") else None
+        )
+        self._map = {}
+        self._pending = []
+        self._inflight = {}
+        self.reused = 0
+        self.uploaded = 0
+
+    async def load(self):
+        self._map = await state_store.run(_load, self.store)
+        return self
+
+    def _remember(self, key_type: str, key: str, media_id: int):
+        if not key or not media_id:
+            return
+        if self._map.get((key_type, key)) != media_id:
+            self._map[(key_type, key)] = media_id
+            self._pending.append((key_type, key, media_id))
+
+    def known_id(self, src: str):
+        return self._map.get(("url", src))
+
+    async def resolve(self, images: list) -> list:
+        """Convierte [{"src", "name"}] en referencias {"id"} cuando la imagen ya existe."""
+        out = []
+        for img in images or []:
+            src = img.get("src")
+            if not src or "id" in img:
+                out.append(img)
+                continue
+            media_id = self.known_id(src)
+            if media_id is not None:
+                self.reused += 1
+            elif self.upload_auth:
+                media_id = await self._upload_once(img)
+            if media_id:
+                out.append({"id": media_id})
+            else:
+                out.append(img)
+        return out
+
+    async def _upload_once(self, img: dict):
+        src = img["src"]
+        # Si otra escritura ya está subiendo la misma URL, esperar su resultado
+        future = self._inflight.get(src)
+        if future is not None:
+            return await future
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[src] = future
+        media_id = None
+        try:
+            media_id = await self._upload(img)
+        except Exception as e:
+            log.warning(
+                "No se pudo subir la imagen",
+                extra={"store": self.store, "src": src, "error": str(e), "sample": f"images.upload_error.{self.store}"},
+            )
+        finally:
+            future.set_result(media_id)
+            self._inflight.pop(src, None)
+        return media_id
+
+    async def _upload(self, img: dict):
+        src = img["src"]
+        async with httpx.AsyncClient(timeout=DOWNLOAD_TIMEOUT, follow_redirects=True) as client:
+            resp = await client.get(src)
+            resp.raise_for_status()
+            content = resp.content
+        digest = hashlib.sha256(content).hexdigest()
+        media_id = self._map.get(("sha256", digest))
+        if media_id is None:
+            filename = img.get("name") or src.rstrip("/").split("/")[-1] or "image"
+            content_type = (
+                resp.headers.get("content-type", "").split(";")[0]
+                or mimetypes.guess_type(filename)[0]
+                or "application/octet-stream"
+            )
+            media = await self.wc.upload_media(content, filename, content_type, self.upload_auth)
+            media_id = media.get("id")
+            self.uploaded += 1
+            self._remember("url", media.get("source_url"), media_id)
+        self._remember("sha256", digest, media_id)
+        self._remember("url", src, media_id)
+        return media_id
+
+    def learn(self, sent: list, product: dict):
+        """Aprende URL de origen -> ID de medio a partir de la respuesta de WooCommerce."""
+        returned = (product or {}).get("images") or []
+        for img, created in zip(sent or [], returned):
+            media_id = created.get("id")
+            if img.get("src"):
+                self._remember("url", img["src"], media_id)
+            self._remember("url", created.get("src"), media_id)
+
+    async def _forget(self, images: list):
+        for img in images:
+            media_id = img.get("id")
+            if media_id is None:
+                continue
+            for key in [k for k, v in self._map.items() if v == media_id]:
+                del self._map[key]
+            self._pending = [p for p in self._pending if p[2] != media_id]
+            await state_store.run(_delete_media, self.store, media_id)
+
+    async def _write(self, call, data: dict) -> dict:
+        sent = data.get("images")
+        if not sent:
+            return await call(data)
+        payload = dict(data, images=await self.resolve(sent))
+        try:
+            result = await call(payload)
+        except Exception as e:
+            if payload["images"] == sent or not _is_invalid_image_error(e):
+                raise
+            # El medio fue borrado en WordPress: olvidar el ID y reenviar por URL
+            await self._forget(payload["images"])
+            payload = dict(data, images=sent)
+            result = await call(payload)
+        self.learn(sent, result)
+        return result
+
+    async def update_product(self, product_id, data: dict) -> dict:
+        # Pasa por el buffer de la tienda: se fusiona con otras actualizaciones del mismo producto
+        return await self._write(lambda d: write_buffer.update_product(self.wc, product_id, d), data)
+
+    async def create_product(self, data: dict) -> dict:
+        return await self._write(self.wc.create_product, data)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        await state_store.run(_save, self.store, pending)
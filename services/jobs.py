@@ -0,0 +1,419 @@
+"""Cola persistente de trabajos en segundo plano (sync, compare, create-missing).
+
+Cada trabajo se guarda en el almacén local (services.state_store) con su estado,
+progreso, resumen de cambios y tiempos, por lo que sobrevive a reinicios.
+Solo puede haber un trabajo activo por (tipo, cliente); una segunda solicitud
+devuelve el trabajo existente.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from services import state_store
+from services.scheduler import scheduler
+from utils.metrics import JOB_DURATION
+from utils import tracing, profiling, memory
+from utils.logs import get_logger
+
+# Reanudar al arrancar los trabajos interrumpidos por un reinicio
+RESUME_ON_STARTUP = os.getenv("JOBS_RESUME_ON_STARTUP", "1") == "1"
+HEARTBEAT_SECONDS = 15
+# Un trabajo activo sin latido en este tiempo se considera huérfano
+STALE_SECONDS = 60
+PROGRESS_FLUSH_SECONDS = 1.0
+
+log = get_logger("jobs")
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("done", "failed", "cancelled")
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    client TEXT NOT NULL,
+    params TEXT,
+    status TEXT NOT NULL,
+    progress_done INTEGER NOT NULL DEFAULT 0,
+    progress_total INTEGER,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    heartbeat_at REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    summary TEXT,
+    timings TEXT,
+    error TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_one_active
+    ON jobs (kind, client) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_client_created ON jobs (client, created_at);
+"""
+
+
+class JobCancelled(Exception):
+    """Se lanza dentro de un trabajo cuando se solicitó su cancelación."""
+
+
+class JobContext:
+    """Estado en memoria del trabajo que se está ejecutando."""
+
+    def __init__(self, job_id: str, kind: str, client: str):
+        self.job_id = job_id
+        self.kind = kind
+        self.client = client
+        self.done = 0
+        self.total = None
+        self.timings = {}
+        self.extra = {}
+        self.cancel_requested = False
+        self._last_flush = 0.0
+
+    async def flush(self, force: bool = False):
+        now = time.time()
+        if not force and now - self._last_flush < PROGRESS_FLUSH_SECONDS:
+            return
+        self._last_flush = now
+        row = await state_store.run(
+            _update_progress, self.job_id, self.done, self.total, now
+        )
+        if row and row["cancel_requested"]:
+            self.cancel_requested = True
+
+
+_current = contextvars.ContextVar("current_job", default=None)
+
+
+def current():
+    """Devuelve el JobContext activo o None si no se ejecuta dentro de un trabajo."""
+    return _current.get()
+
+
+def set_total(total: int):
+    ctx = _current.get()
+    if ctx is not None:
+        ctx.total = total
+
+
+async def advance(n: int = 1):
+    """Avanza el progreso del trabajo actual y lanza JobCancelled si se pidió cancelar."""
+    ctx = _current.get()
+    if ctx is None:
+        return
+    ctx.done += n
+    await ctx.flush()
+    if ctx.cancel_requested:
+        raise JobCancelled(f"Trabajo {ctx.job_id} cancelado")
+
+
+def attach(key: str, value):
+    """Agrega un dato al resumen guardado del trabajo actual."""
+    ctx = _current.get()
+    if ctx is not None:
+        ctx.extra[key] = value
+
+
+@contextmanager
+def stage(name: str):
+    """Acumula el tiempo de una etapa en los tiempos del trabajo actual (y la traza como span)."""
+    ctx = _current.get()
+    start = time.time()
+    try:
+        with tracing.span(name, cat="stage"):
+            yield
+    finally:
+        memory.checkpoint(name)
+        if ctx is not None:
+            ctx.timings[name] = round(ctx.timings.get(name, 0.0) + time.time() - start, 4)
+
+
+# --- Acceso a SQLite (se ejecuta en hilos vía state_store.run) ---
+
+def _schema():
+    state_store.ensure_schema("jobs", _DDL)
+
+
+def _row_to_dict(row) -> dict:
+    if row is None:
+        return None
+    total = row["progress_total"]
+    done = row["progress_done"]
+    return {
+        "id": row["id"],
+        "kind": row["kind"],
+        "client": row["client"],
+        "params": json.loads(row["params"]) if row["params"] else {},
+        "status": row["status"],
+        "progress": {
+            "done": done,
+            "total": total,
+            "percent": round(100.0 * done / total, 1) if total else None,
+        },
+        "cancelRequested": bool(row["cancel_requested"]),
+        "createdAt": row["created_at"],
+        "startedAt": row["started_at"],
+        "finishedAt": row["finished_at"],
+        "summary": json.loads(row["summary"]) if row["summary"] else None,
+        "timings": json.loads(row["timings"]) if row["timings"] else None,
+        "error": row["error"],
+    }
+
+
+def _get(job_id: str):
+    _schema()
+    return state_store.fetchone("SELECT * FROM jobs WHERE id = ?", (job_id,))
+
+
+def _active(kind: str, client: str):
+    _schema()
+    return state_store.fetchone(
+        "SELECT * FROM jobs WHERE kind = ? AND client = ? AND status IN ('queued', 'running')",
+        (kind, client),
+    )
+
+
+def _insert(job_id, kind, client, params, worker, now):
+    _schema()
+    state_store.execute(
+        "INSERT INTO jobs (id, kind, client, params, status, worker, heartbeat_at, created_at)"
+        " VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+        (job_id, kind, client, json.dumps(params or {}), worker, now, now),
+    )
+
+
+def _claim_stale(job_id: str, worker: str, now: float) -> bool:
+    """Toma un trabajo activo cuyo dueño dejó de latir (reinicio o caída)."""
+    _schema()
+    return state_store.execute(
+        "UPDATE jobs SET worker = ?, heartbeat_at = ?, status = 'queued', progress_done = 0"
+        " WHERE id = ? AND status IN ('queued', 'running')"
+        " AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+        (worker, now, job_id, now - STALE_SECONDS),
+    ) == 1
+
+
+def _stale_ids(now: float) -> list:
+    _schema()
+    rows = state_store.fetchall(
+        "SELECT id FROM jobs WHERE status IN ('queued', 'running')"
+        " AND (heartbeat_at IS NULL OR heartbeat_at < ?) ORDER BY created_at",
+        (now - STALE_SECONDS,),
+    )
+    return [row["id"] for row in rows]
+
+
+def _mark_running(job_id: str, now: float):
+    state_store.execute(
+        "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ? WHERE id = ?",
+        (now, now, job_id),
+    )
+
+
+def _update_progress(job_id, done, total, now):
+    state_store.execute(
+        "UPDATE jobs SET progress_done = ?, progress_total = ?, heartbeat_at = ? WHERE id = ?",
+        (done, total, now, job_id),
+    )
+    return state_store.fetchone("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,))
+
+
+def _finish(job_id, status, done, total, summary, timings, error, now):
+    state_store.execute(
+        "UPDATE jobs SET status = ?, progress_done = ?, progress_total = ?, summary = ?,"
+        " timings = ?, error = ?, finished_at = ?, heartbeat_at = ? WHERE id = ?",
+        (
+            status, done, total,
+            json.dumps(summary, ensure_ascii=False, default=str) if summary is not None else None,
+            json.dumps(timings), error, now, now, job_id,
+        ),
+    )
+
+
+def _heartbeat(worker: str, now: float):
+    _schema()
+    state_store.execute(
+        "UPDATE jobs SET heartbeat_at = ? WHERE worker = ? AND status IN ('queued', 'running')",
+        (now, worker),
+    )
+
+
+def _request_cancel(job_id: str, now: float):
+    _schema()
+    # Los trabajos aún en cola se cancelan directamente
+    state_store.execute(
+        "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ?"
+        " WHERE id = ? AND status = 'queued'",
+        (now, job_id),
+    )
+    state_store.execute(
+        "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'",
+        (job_id,),
+    )
+
+
+def _list(client, status, limit):
+    _schema()
+    sql = "SELECT * FROM jobs WHERE 1 = 1"
+    params = []
+    if client:
+        sql += " AND client = ?"
+        params.append(client)
+    if status:
+        sql += " AND status = ?"
+        params.append(status)
+    sql += " ORDER BY created_at DESC LIMIT ?"
+    params.append(limit)
+    return state_store.fetchall(sql, params)
+
+
+class JobManager:
+    """Registra los tipos de trabajo, los encola de forma persistente y los ejecuta."""
+
+    def __init__(self):
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handlers = {}
+        self._tasks = {}
+        self._lock = asyncio.Lock()
+        self._heartbeat_task = None
+
+    def register(self, kind: str, handler):
+        """Asocia un tipo de trabajo a una corrutina handler(client, **params)."""
+        self._handlers[kind] = handler
+
+    async def submit(self, kind: str, client: str, params: dict = None):
+        """Encola un trabajo. Devuelve (job, created); si ya hay uno activo lo reutiliza."""
+        if kind not in self._handlers:
+            raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+        async with self._lock:
+            now = time.time()
+            existing = await state_store.run(_active, kind, client)
+            if existing is not None:
+                if await state_store.run(_claim_stale, existing["id"], self.worker_id, now):
+                    self._dispatch(existing["id"], kind, client, json.loads(existing["params"] or "{}"))
+                return _row_to_dict(existing), False
+            job_id = uuid.uuid4().hex
+            try:
+                await state_store.run(_insert, job_id, kind, client, params, self.worker_id, now)
+            except sqlite3.IntegrityError:
+                # Otro proceso encoló el mismo trabajo entre la consulta y el insert
+                existing = await state_store.run(_active, kind, client)
+                return _row_to_dict(existing), False
+            self._dispatch(job_id, kind, client, params or {})
+            return _row_to_dict(await state_store.run(_get, job_id)), True
+
+    async def get(self, job_id: str):
+        return _row_to_dict(await state_store.run(_get, job_id))
+
+    async def list(self, client: str = None, status: str = None, limit: int = 50) -> list:
+        rows = await state_store.run(_list, client, status, limit)
+        return [_row_to_dict(r) for r in rows]
+
+    async def cancel(self, job_id: str):
+        await state_store.run(_request_cancel, job_id, time.time())
+        task = self._tasks.get(job_id)
+        job = await self.get(job_id)
+        if task is not None and job and job["status"] == "cancelled":
+            # Aún esperaba turno: no llegará a ejecutarse
+            task.cancel()
+        return job
+
+    async def start(self):
+        """Reanuda trabajos huérfanos y arranca el latido de este proceso."""
+        if RESUME_ON_STARTUP:
+            for job_id in await state_store.run(_stale_ids, time.time()):
+                if await state_store.run(_claim_stale, job_id, self.worker_id, time.time()):
+                    row = await state_store.run(_get, job_id)
+                    if row["kind"] in self._handlers:
+                        log.info("Reanudando trabajo", extra={"jobId": job_id, "kind": row["kind"], "client": row["client"]})
+                        self._dispatch(job_id, row["kind"], row["client"], json.loads(row["params"] or "{}"))
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+        for task in list(self._tasks.values()):
+            task.cancel()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            try:
+                await state_store.run(_heartbeat, self.worker_id, time.time())
+            except Exception as e:
+                log.warning("Error en latido", extra={"error": str(e)})
+
+    def _dispatch(self, job_id, kind, client, params):
+        # Contexto vacío: el trabajo no hereda la traza ni el perfil de la petición que lo encoló
+        task = contextvars.Context().run(asyncio.create_task, self._run(job_id, kind, client, params))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _t: self._tasks.pop(job_id, None))
+
+    async def _run(self, job_id, kind, client, params):
+        created = time.time()
+        try:
+            # El planificador decide cuándo corre según el reparto justo entre clientes
+            async with scheduler.slot(client, kind):
+                row = await state_store.run(_get, job_id)
+                if row is None or row["status"] not in ACTIVE_STATUSES:
+                    return
+                created = row["created_at"]
+                await self._execute(job_id, kind, client, params, created)
+        except asyncio.CancelledError:
+            row = await state_store.run(_get, job_id)
+            if row is not None and row["status"] in ACTIVE_STATUSES and row["cancel_requested"]:
+                await state_store.run(
+                    _finish, job_id, "cancelled", row["progress_done"], row["progress_total"],
+                    None, {"queued": round(time.time() - created, 4)}, None, time.time(),
+                )
+            # Cierre del proceso: el trabajo queda activo y se reanuda al arrancar
+            raise
+
+    async def _execute(self, job_id, kind, client, params, created):
+        ctx = JobContext(job_id, kind, client)
+        started = time.time()
+        await state_store.run(_mark_running, job_id, started)
+        token = _current.set(ctx)
+        status, summary, error = "done", None, None
+        params = dict(params or {})
+        # Perfil pedido al encolar (header X-Profile) o configurado para el cliente
+        profile_mode = params.pop("profile", None) or profiling.client_mode(client)
+        prof = profiling.profile(job_id, profile_mode, kind=kind, client=client)
+        mem = memory.track(kind, memory.enabled_for(client))
+        try:
+            async with tracing.record(job_id, f"{kind} {client}", kind=kind, client=client):
+                async with prof, mem:
+                    summary = await self._handlers[kind](client, **params)
+        except JobCancelled:
+            status = "cancelled"
+        except Exception as e:
+            status, error = "failed", str(e) or repr(e)
+        finally:
+            _current.reset(token)
+        if prof.profile_id:
+            ctx.extra["profileId"] = prof.profile_id
+        if mem.report is not None:
+            ctx.extra["memory"] = mem.report
+        finished = time.time()
+        timings = {
+            "queued": round(started - created, 4),
+            "run": round(finished - started, 4),
+        }
+        timings.update(ctx.timings)
+        JOB_DURATION.observe(finished - started, kind=kind, status=status)
+        if ctx.extra:
+            summary = {"result": summary, **ctx.extra} if not isinstance(summary, dict) else {**summary, **ctx.extra}
+        await state_store.run(
+            _finish, job_id, status, ctx.done, ctx.total, summary, timings, error, finished,
+        )
+        log.info(
+            f"Trabajo {kind} {client} -> {status}",
+            extra={"jobId": job_id, "kind": kind, "client": client, "status": status, "elapsed": timings["run"]},
+        )
+
+
+manager = JobManager()
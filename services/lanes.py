@@ -0,0 +1,122 @@
+"""Carriles de prioridad para las escrituras de syncPersonal a WooCommerce.
+
+Antes cada SKU se procesaba entero y en orden: un cambio de stock esperaba
+detrás de la creación de categorías y la subida de imágenes de cientos de
+SKUs anteriores. Ahora los campos de cada SKU se reparten en tres carriles,
+cada uno con su cola, sus workers y sus métricas:
+
+  - stock: stock_quantity y precios (SYNC_LANE_STOCK_CONCURRENCY, 8)
+  - content: name y status, cuando el SKU no tiene cambio de stock
+    (SYNC_LANE_CONTENT_CONCURRENCY, 4)
+  - heavy: categorías, imágenes y creación de productos
+    (SYNC_LANE_HEAVY_CONCURRENCY, 2)
+
+Un SKU pasa por sus carriles en ese orden, uno a la vez: WooCommerce guarda
+el producto completo en cada PUT, así que dos escrituras simultáneas del
+mismo producto podrían pisarse. sync_lane_wait_seconds (espera en cola) y
+sync_lane_seconds (duración del paso) se exponen por carril en /metrics.
+"""
+import os
+import time
+import asyncio
+from services import jobs
+from utils import metrics
+
+LANES = ("stock", "content", "heavy")
+
+LANE_FIELDS = {
+    "stock": ("stock_quantity", "regular_price", "sale_price"),
+    "content": ("name", "status"),
+    "heavy": ("categories", "images"),
+}
+
+CONCURRENCY = {
+    "stock": int(os.getenv("SYNC_LANE_STOCK_CONCURRENCY", "8")),
+    "content": int(os.getenv("SYNC_LANE_CONTENT_CONCURRENCY", "4")),
+    "heavy": int(os.getenv("SYNC_LANE_HEAVY_CONCURRENCY", "2")),
+}
+
+LANE_WAIT = metrics.histogram(
+    "sync_lane_wait_seconds", "Espera en cola de cada carril de escritura", ("lane",))
+LANE_SECONDS = metrics.histogram(
+    "sync_lane_seconds", "Duración de cada paso de escritura por carril", ("lane", "result"))
+
+
+def split(changes: dict) -> dict:
+    """Reparte los campos de una actualización por carril (solo los carriles con campos).
+
+    Si el SKU ya escribe en el carril stock, name y status van en esa misma
+    petición: un PUT cuesta lo mismo con o sin ellos y así no se suma otro.
+    """
+    out = {}
+    for lane in LANES:
+        fields = {k: changes[k] for k in LANE_FIELDS[lane] if k in changes}
+        if fields:
+            out[lane] = fields
+    if "stock" in out and "content" in out:
+        out["stock"].update(out.pop("content"))
+    return out
+
+
+def next_lane(lanes, after: str = None):
+    """Primer carril de `lanes` posterior a `after` (o el primero), o None si no quedan."""
+    start = LANES.index(after) + 1 if after else 0
+    for lane in LANES[start:]:
+        if lane in lanes:
+            return lane
+    return None
+
+
+async def run(items: list, step, on_error):
+    """Procesa (carril inicial, ítem) a través de los carriles.
+
+    step(lane, item) hace el trabajo de ese carril y devuelve el siguiente
+    carril del ítem, o None si terminó. Si lanza, on_error(lane, item, exc)
+    lo registra y el ítem no sigue. Cada ítem terminado avanza el progreso
+    del trabajo actual.
+    """
+    if not items:
+        return
+    queues = {lane: asyncio.Queue() for lane in LANES}
+    for lane, item in items:
+        queues[lane].put_nowait((time.perf_counter(), item))
+    remaining = len(items)
+    finished = asyncio.Event()
+
+    async def worker(lane):
+        nonlocal remaining
+        queue = queues[lane]
+        while True:
+            enqueued, item = await queue.get()
+            start = time.perf_counter()
+            LANE_WAIT.observe(start - enqueued, lane=lane)
+            nxt = None
+            try:
+                nxt = await step(lane, item)
+                LANE_SECONDS.observe(time.perf_counter() - start, lane=lane, result="ok")
+            except Exception as e:
+                LANE_SECONDS.observe(time.perf_counter() - start, lane=lane, result="error")
+                on_error(lane, item, e)
+            if nxt is not None:
+                queues[nxt].put_nowait((time.perf_counter(), item))
+                continue
+            remaining -= 1
+            if remaining == 0:
+                finished.set()
+            await jobs.advance()
+
+    workers = [
+        asyncio.create_task(worker(lane), name=f"lane-{lane}")
+        for lane in LANES for _ in range(max(1, CONCURRENCY[lane]))
+    ]
+    waiter = asyncio.create_task(finished.wait())
+    try:
+        done, _ = await asyncio.wait([waiter, *workers], return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task is not waiter:
+                # Un worker solo termina por una excepción fuera de step (p. ej. JobCancelled)
+                task.result()
+    finally:
+        for task in (waiter, *workers):
+            task.cancel()
+        await asyncio.gather(waiter, *workers, return_exceptions=True)
@@ -0,0 +1,92 @@
+"""Respuestas NDJSON en streaming para los endpoints de catálogo completo.
+
+Con `Accept: application/x-ndjson` o `?format=ndjson`, /items, /inventory y
+/soap/{client}/bodega_items escriben un producto por línea a medida que se
+producen (páginas de WooCommerce, bloques del cursor de BD) en lugar de armar,
+validar y serializar la lista completa. La última línea es
+{"summary": {...}} con los campos de resumen de la respuesta JSON (count,
+elapsed, ...) y, si la fuente falla a mitad de camino, "error". Los fallos
+antes del primer producto responden con el código de error habitual.
+
+Estas respuestas no pasan por la caché de respuestas.
+"""
+import time
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from schemas import Product
+from utils import serialization
+from utils.logs import get_logger
+
+MEDIA_TYPE = "application/x-ndjson"
+
+log = get_logger("ndjson")
+
+# Documentación del formato alternativo en OpenAPI (`responses=` de cada endpoint)
+OPENAPI = {200: {"content": {MEDIA_TYPE: {"schema": {"type": "string", "format": "ndjson"}}}}}
+
+
+def requested(request: Request) -> bool:
+    return request.query_params.get("format") == "ndjson" or MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def _encoder(model):
+    """Función que serializa un bloque de ítems como líneas NDJSON."""
+    if model is Product:
+        return serialization.product_lines
+    if model is None:
+        lines = serialization.dumps
+    else:
+        def lines(item):
+            return model.model_validate(item).model_dump_json().encode()
+    return lambda items: b"".join(lines(item) + b"\n" for item in items)
+
+
+async def respond(chunks, summary: dict, model=None, start: float = None) -> StreamingResponse:
+    """Respuesta NDJSON a partir de un iterador asíncrono de listas de ítems.
+
+    `summary` se emite al final (los productores pueden completarlo, p. ej. con
+    nextCursor); con `model` = Product cada ítem sale con la forma de Product.
+    """
+    start = start or time.time()
+    encode = _encoder(model)
+    chunks = chunks.__aiter__()
+    # El primer bloque se espera antes de responder para devolver 404/502 con su código
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = []
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("Error antes del primer producto", extra={"summary": summary, "error": str(e) or repr(e)})
+        raise HTTPException(status_code=502, detail=str(e) or repr(e))
+
+    async def body():
+        count = 0
+        error = None
+        chunk = first
+        try:
+            while True:
+                if chunk:
+                    block = encode(chunk)
+                    count += len(chunk)
+                    yield block
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    break
+        except Exception as e:
+            error = str(e) or repr(e)
+            log.error("Error durante el streaming", extra={"summary": summary, "error": error})
+        finally:
+            aclose = getattr(chunks, "aclose", None)
+            if aclose:
+                await aclose()
+        record = {**summary, "count": count, "elapsed": time.time() - start}
+        if error:
+            record["error"] = error
+        yield serialization.dumps({"summary": record}) + b"\n"
+
+    # X-Accel-Buffering: que un nginx delante no acumule la respuesta completa
+    return StreamingResponse(body(), media_type=MEDIA_TYPE,
+                             headers={"X-Accel-Buffering": "no", "Cache-Control": "no-store"})
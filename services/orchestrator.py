@@ -0,0 +1,157 @@
+"""Orquestador multi-cliente en proceso para la corrida batch (soap-store, syncPersonal, limpieza).
+
+Ejecuta las mismas funciones que los endpoints, sin pasar por HTTP, en fases
+ordenadas por dependencia:
+
+1. soap-store de todos los clientes SOAP (alimenta productos y prodsChanges)
+2. syncPersonal de todos los clientes API (consume prodsChanges)
+3. TRUNCATE de prodsChanges, solo si todas las sincronizaciones terminaron bien
+
+Dentro de cada fase los clientes corren en paralelo a través de un
+planificador justo propio de la corrida (services.scheduler.FairScheduler),
+con concurrencia acotada y timeout por cliente, de modo que una tienda colgada
+no detiene la corrida. El planificador global del proceso no se modifica.
+"""
+import os
+import json
+import time
+import asyncio
+import datetime
+from services.scheduler import FairScheduler
+from utils import tracing, profiling
+from utils.logs import get_logger
+
+DEFAULT_CONCURRENCY = int(os.getenv("SYNC_ALL_CONCURRENCY", "4"))
+DEFAULT_TIMEOUT = float(os.getenv("SYNC_ALL_TIMEOUT", "900"))
+
+log = get_logger("orchestrator")
+
+
+def _clients_from_env(var: str) -> list:
+    try:
+        entries = json.loads(os.getenv(var, "[]"))
+    except json.JSONDecodeError as e:
+        log.error(f"Error parsing {var}", extra={"error": str(e)})
+        return []
+    return [e.get("client") for e in entries if e.get("client")]
+
+
+async def _run_task(scheduler: FairScheduler, name: str, client: str, factory, timeout: float) -> dict:
+    enqueued = time.time()
+    async with scheduler.slot(client, name):
+        start = time.time()
+        entry = {"task": name, "client": client, "startedAt": start, "queueWait": round(start - enqueued, 3)}
+        trace_id = f"{name}-{client}-{int(start * 1000)}"
+        prof = profiling.profile(trace_id, profiling.client_mode(client), kind=name, client=client)
+        try:
+            # El timeout cuenta desde que el cliente obtiene turno, no desde que se encola
+            async with tracing.record(trace_id, f"{name} {client}", kind=name, client=client) as trace:
+                if trace is not None:
+                    entry["traceId"] = trace_id
+                async with prof:
+                    result = await asyncio.wait_for(factory(client), timeout=timeout)
+            entry["status"] = "ok" if result is not None else "skipped"
+            entry["result"] = result
+        except asyncio.TimeoutError:
+            entry["status"] = "timeout"
+            entry["error"] = f"Tiempo límite de {timeout:g}s excedido"
+        except Exception as e:
+            entry["status"] = "error"
+            entry["error"] = str(e) or repr(e)
+        if prof.profile_id:
+            entry["profileId"] = prof.profile_id
+        entry["elapsed"] = round(time.time() - start, 3)
+        return entry
+
+
+async def _run_phase(name: str, clients: list, factory, concurrency: int, timeout: float) -> dict:
+    start = time.time()
+    scheduler = FairScheduler(max_concurrency=max(1, concurrency))
+    tasks = await asyncio.gather(
+        *(_run_task(scheduler, name, c, factory, timeout) for c in clients)
+    )
+    return {
+        "phase": name,
+        "elapsed": round(time.time() - start, 3),
+        "ok": sum(1 for t in tasks if t["status"] in ("ok", "skipped")),
+        "failed": sum(1 for t in tasks if t["status"] not in ("ok", "skipped")),
+        "tasks": list(tasks),
+    }
+
+
+async def run_all(
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: float = DEFAULT_TIMEOUT,
+    soap: bool = True,
+    sync: bool = True,
+    clear: bool = True,
+    force_clear: bool = False,
+) -> dict:
+    """Ejecuta la corrida completa y devuelve un reporte estructurado de tiempos."""
+    # Importación diferida: main construye la app y las conexiones
+    import main
+
+    start = time.time()
+    report = {
+        "startedAt": datetime.datetime.utcnow().isoformat(),
+        "concurrency": concurrency,
+        "timeout": timeout,
+        "phases": [],
+    }
+
+    if soap:
+        soap_clients = _clients_from_env("SOAP_CREDENTIALS_JSON")
+        report["phases"].append(
+            await _run_phase("soap_store", soap_clients, main.run_soap_store, concurrency, timeout)
+        )
+
+    if sync:
+        api_clients = _clients_from_env("CLIENTS_API_JSON")
+        report["phases"].append(
+            await _run_phase("sync_personal", api_clients, main.run_sync_personal, concurrency, timeout)
+        )
+
+    if clear:
+        failed = sum(p["failed"] for p in report["phases"])
+        phase = {"phase": "clear_prods_changes", "elapsed": 0.0, "tasks": []}
+        if failed and not force_clear:
+            # Conservar prodsChanges para que la próxima corrida reintente lo pendiente
+            phase["status"] = "skipped"
+            phase["reason"] = f"{failed} tarea(s) fallaron en fases previas"
+        else:
+            clear_start = time.time()
+            try:
+                await asyncio.wait_for(main.run_clear_prods_change(), timeout=timeout)
+                phase["status"] = "ok"
+            except Exception as e:
+                phase["status"] = "error"
+                phase["error"] = str(e) or repr(e)
+            phase["elapsed"] = round(time.time() - clear_start, 3)
+        report["phases"].append(phase)
+
+    report["elapsed"] = round(time.time() - start, 3)
+    return report
+
+
+def summary_lines(report: dict) -> list:
+    """Resumen legible (una línea por tarea) para consola y WhatsApp."""
+    tags = {"soap_store": "SOAP", "sync_personal": "SYNC"}
+    lines = []
+    for phase in report["phases"]:
+        tag = tags.get(phase["phase"])
+        if tag is None:
+            detail = phase.get("error") or phase.get("reason") or ""
+            lines.append(f"[CLEAR] prodsChange: {phase['status'].upper()} ({phase['elapsed']}s) {detail}".rstrip())
+            continue
+        for t in phase["tasks"]:
+            if t["status"] in ("ok", "skipped"):
+                result = t.get("result") or {}
+                counts = ", ".join(
+                    f"{k}={v}" for k, v in result.items()
+                    if k in ("total", "inserted", "updated", "changes_count", "skipped_unchanged")
+                )
+                lines.append(f"[{tag}] {t['client']}: {t['status'].upper()} ({t['elapsed']}s) {counts}".rstrip())
+            else:
+                lines.append(f"[{tag}] {t['client']}: {t['status'].upper()} ({t['elapsed']}s) -> {t.get('error')}")
+    lines.append(f"Total: {report['elapsed']}s")
+    return lines
@@ -0,0 +1,201 @@
+"""Matriz SKU × lista de precios para updatePriceList.
+
+Antes cada lista (VIP, PLATINUM, GOLD, ...) se comparaba en su propio bucle
+contra su propia consulta, comparando Decimal de la BD con float del SOAP
+(Decimal("0.10") != 0.1, así que muchos precios iguales se reescribían en
+cada corrida). PriceMatrix reúne todas las listas en dos matrices SKU × lista
+(precio recibido y precio guardado, NaN donde no hay) y calcula los cambios
+de todas de una vez, con tolerancia PRICE_TOLERANCE (0.005 por defecto:
+medio centavo, la precisión de preciodetalle).
+
+Con NumPy instalado (opcional) las operaciones son vectoriales; sin NumPy se
+usan listas por columna con los mismos resultados. La última matriz queda en
+memoria (latest()) para consultas entre listas sin volver a la BD: márgenes
+de cada lista respecto de otra y SKUs que faltan en una lista.
+"""
+import os
+import math
+import statistics
+
+try:
+    import numpy as np
+except ImportError:  # opcional: acelera la matriz con muchos SKUs
+    np = None
+
+TOLERANCE = float(os.getenv("PRICE_TOLERANCE", "0.005"))
+
+_NAN = float("nan")
+
+_latest = None
+
+
+def _price(value):
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return None
+    return price if math.isfinite(price) else None
+
+
+class PriceMatrix:
+    """Precios recibidos y guardados de varias listas, indexados por SKU."""
+
+    def __init__(self, lists: list):
+        self.lists = list(lists)
+        self._col = {name: j for j, name in enumerate(self.lists)}
+        self.skus = []
+        self._row = {}
+        # Antes de build(): lista -> {fila: precio}
+        self._staged = {"current": [{} for _ in self.lists], "stored": [{} for _ in self.lists]}
+        self.current = self.stored = None
+
+    @property
+    def engine(self) -> str:
+        return "numpy" if np is not None else "python"
+
+    def _index(self, sku: str) -> int:
+        row = self._row.get(sku)
+        if row is None:
+            row = self._row[sku] = len(self.skus)
+            self.skus.append(sku)
+        return row
+
+    def add_current(self, name: str, items: list):
+        """Ítems SOAP de una lista ({"codigo", "precio"}); los precios inválidos se ignoran."""
+        staged = self._staged["current"][self._col[name]]
+        for prod in items:
+            sku = prod.get("codigo")
+            price = _price(prod.get("precio"))
+            if sku and price is not None:
+                staged[self._index(sku)] = price
+
+    def add_stored(self, name: str, rows):
+        """Filas (sku, precio) de preciodetalle de una lista."""
+        staged = self._staged["stored"][self._col[name]]
+        for sku, precio in rows:
+            price = _price(precio)
+            if sku and price is not None:
+                staged[self._index(sku)] = price
+
+    def _build_matrix(self, columns: list):
+        n = len(self.skus)
+        if np is None:
+            out = []
+            for staged in columns:
+                col = [_NAN] * n
+                for row, price in staged.items():
+                    col[row] = price
+                out.append(col)
+            return out
+        matrix = np.full((n, len(self.lists)), np.nan)
+        for j, staged in enumerate(columns):
+            if staged:
+                matrix[np.fromiter(staged.keys(), dtype=np.intp, count=len(staged)), j] = \
+                    np.fromiter(staged.values(), dtype=float, count=len(staged))
+        return matrix
+
+    def build(self):
+        """Arma las matrices; después de esto no se agregan más precios."""
+        self.current = self._build_matrix(self._staged["current"])
+        self.stored = self._build_matrix(self._staged["stored"])
+        self._staged = None
+        return self
+
+    def changes(self, tolerance: float = TOLERANCE) -> dict:
+        """Por lista: SKUs nuevos, SKUs con precio distinto (más allá de la tolerancia) y sin cambio."""
+        out = {}
+        if np is not None:
+            has_new = ~np.isnan(self.current)
+            has_old = ~np.isnan(self.stored)
+            inserted = has_new & ~has_old
+            with np.errstate(invalid="ignore"):
+                updated = has_new & has_old & (np.abs(self.current - self.stored) > tolerance)
+            unchanged = (has_new & has_old).sum(axis=0) - updated.sum(axis=0)
+            for j, name in enumerate(self.lists):
+                out[name] = {
+                    "inserted": np.flatnonzero(inserted[:, j]).tolist(),
+                    "updated": np.flatnonzero(updated[:, j]).tolist(),
+                    "unchanged": int(unchanged[j]),
+                }
+            return out
+        for j, name in enumerate(self.lists):
+            inserted, updated, unchanged = [], [], 0
+            for row, (new, old) in enumerate(zip(self.current[j], self.stored[j])):
+                if new != new:
+                    continue
+                if old != old:
+                    inserted.append(row)
+                elif abs(new - old) > tolerance:
+                    updated.append(row)
+                else:
+                    unchanged += 1
+            out[name] = {"inserted": inserted, "updated": updated, "unchanged": unchanged}
+        return out
+
+    def price(self, name: str, row: int) -> float:
+        j = self._col[name]
+        return float(self.current[row, j]) if np is not None else self.current[j][row]
+
+    def _effective(self):
+        """Precio vigente tras la actualización: el recibido o, si no llegó, el guardado."""
+        if np is not None:
+            return np.where(np.isnan(self.current), self.stored, self.current)
+        return [
+            [new if new == new else old for new, old in zip(cur, sto)]
+            for cur, sto in zip(self.current, self.stored)
+        ]
+
+    def missing(self, name: str) -> list:
+        """SKUs con precio en alguna otra lista pero no en `name`."""
+        j = self._col[name]
+        eff = self._effective()
+        if np is not None:
+            present = ~np.isnan(eff)
+            others = np.delete(present, j, axis=1).any(axis=1)
+            return [self.skus[i] for i in np.flatnonzero(others & ~present[:, j])]
+        out = []
+        for row, sku in enumerate(self.skus):
+            if eff[j][row] != eff[j][row] and any(
+                    eff[k][row] == eff[k][row] for k in range(len(self.lists)) if k != j):
+                out.append(sku)
+        return out
+
+    def margins(self, base: str) -> dict:
+        """Por lista: diferencia relativa con `base` (precio / base - 1) en los SKUs comunes."""
+        b = self._col[base]
+        eff = self._effective()
+        out = {}
+        for j, name in enumerate(self.lists):
+            if j == b:
+                continue
+            if np is not None:
+                col, ref = eff[:, j], eff[:, b]
+                mask = ~np.isnan(col) & ~np.isnan(ref) & (ref > 0)
+                ratios = col[mask] / ref[mask] - 1
+                values = ratios.tolist()
+            else:
+                values = [
+                    p / r - 1 for p, r in zip(eff[j], eff[b])
+                    if p == p and r == r and r > 0
+                ]
+            out[name] = {
+                "skus": len(values),
+                "mean": round(statistics.fmean(values), 4) if values else None,
+                "median": round(statistics.median(values), 4) if values else None,
+                "min": round(min(values), 4) if values else None,
+                "max": round(max(values), 4) if values else None,
+            }
+        return out
+
+    def summary(self) -> dict:
+        return {"lists": self.lists, "skus": len(self.skus), "engine": self.engine}
+
+
+def set_latest(matrix: PriceMatrix):
+    global _latest
+    _latest = matrix
+
+
+def latest():
+    """Última matriz calculada por updatePriceList en este proceso (o None)."""
+    return _latest
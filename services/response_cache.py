@@ -0,0 +1,208 @@
+"""Caché de respuestas de lectura por cliente con stale-while-revalidate y ETag.
+
+/inventory y /items recorren toda la tienda o el procedimiento en cada llamada,
+aunque el frontend consulte cada minuto. Cada respuesta exitosa se guarda ya
+serializada, por endpoint y cliente:
+
+  - fresca (menos de RESPONSE_CACHE_TTL segundos, 60 por defecto): se sirve
+    directamente;
+  - vencida pero dentro de RESPONSE_CACHE_STALE segundos más (600): se sirve
+    al instante y se refresca en segundo plano;
+  - más vieja, ausente o pedida con `Cache-Control: no-cache`: se espera la
+    carga.
+
+Las peticiones concurrentes comparten una sola carga por clave. El ETag es
+fuerte (hash del contenido sin el campo `elapsed`); si un refresco trae el
+mismo contenido se conservan los bytes y el ETag anteriores, así los clientes
+con `If-None-Match` reciben 304 sin cuerpo. Cada cliente puede ajustar los
+tiempos con "cacheTtl" y "cacheStale" en su entrada; RESPONSE_CACHE_ENABLED=0
+desactiva la caché y RESPONSE_CACHE_MAX_ENTRIES (64) limita las respuestas
+guardadas. Las corridas que escriben en la tienda o en la BD invalidan las
+entradas del cliente.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from fastapi import Request, Response
+from utils import metrics, serialization
+from utils.logs import get_logger
+
+ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+STALE = float(os.getenv("RESPONSE_CACHE_STALE", "600"))
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "64"))
+
+CACHE_REQUESTS = metrics.counter(
+    "response_cache_requests_total", "Lecturas servidas por la caché de respuestas", ("endpoint", "result"))
+CACHE_REFRESHES = metrics.counter(
+    "response_cache_refreshes_total", "Cargas de la caché de respuestas", ("endpoint", "result"))
+
+log = get_logger("response_cache")
+
+
+class _Entry:
+    __slots__ = ("body", "etag", "digest", "stored_at")
+
+    def __init__(self, body: bytes, digest: str, stored_at: float):
+        self.body = body
+        self.digest = digest
+        self.etag = f'"{digest}"'
+        self.stored_at = stored_at
+
+
+# (endpoint, client, variante) -> _Entry, en orden de uso para descartar la menos reciente.
+# La variante distingue páginas y filtros ('' es el catálogo completo).
+_entries = OrderedDict()
+# (endpoint, client, variante) -> tarea de carga en curso
+_inflight = {}
+# (endpoint, client) -> generación; se incrementa al invalidar ese par: una carga
+# iniciada antes no debe guardar su resultado. Las escrituras de un cliente no
+# afectan las cargas de los demás.
+_generations = {}
+
+
+def _render(model, payload: dict) -> tuple:
+    """Cuerpo JSON con la forma de `model` y hash del contenido sin `elapsed`."""
+    content = serialization.render(model, payload, exclude=("elapsed",))
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    # `elapsed` cambia en cada carga: queda fuera del hash y se antepone al cuerpo
+    elapsed = json.dumps(payload.get("elapsed")).encode()
+    body = b'{"elapsed":' + elapsed + (b"," + content[1:] if len(content) > 2 else b"}")
+    return body, digest
+
+
+def _generation(key: tuple) -> int:
+    return _generations.get(key[:2], 0)
+
+
+def _store(key: tuple, body: bytes, digest: str, generation: int) -> _Entry:
+    previous = _entries.get(key)
+    now = time.time()
+    if generation != _generation(key):
+        # Invalidada durante la carga (hubo escrituras): servir sin guardar
+        return _Entry(body, digest, now)
+    if previous is not None and previous.digest == digest:
+        # Mismo contenido: conservar bytes y ETag para que los 304 sigan valiendo
+        previous.stored_at = now
+        entry = previous
+    else:
+        entry = _Entry(body, digest, now)
+    _entries[key] = entry
+    _entries.move_to_end(key)
+    while len(_entries) > MAX_ENTRIES:
+        _entries.popitem(last=False)
+    return entry
+
+
+async def _load(key: tuple, loader, model) -> _Entry:
+    generation = _generation(key)
+    try:
+        payload = await loader()
+        body, digest = _render(model, payload)
+    except BaseException:
+        CACHE_REFRESHES.inc(endpoint=key[0], result="error")
+        raise
+    CACHE_REFRESHES.inc(endpoint=key[0], result="ok")
+    return _store(key, body, digest, generation)
+
+
+def _refresh(key: tuple, loader, model, background: bool = False) -> asyncio.Task:
+    """Carga única por clave: las peticiones concurrentes esperan la misma tarea."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_load(key, loader, model), name=f"cache-{key[0]}-{key[1]}")
+        task.background = False
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _done(key, t))
+    task.background = task.background or background
+    return task
+
+
+def _done(key: tuple, task: asyncio.Task):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if task.cancelled() or task.exception() is None:
+        return
+    # Quien esperaba la carga ya recibió la excepción; los refrescos en segundo plano solo se registran
+    if task.background:
+        log.warning(
+            "Refresco de caché fallido; se sigue sirviendo la copia anterior",
+            extra={"endpoint": key[0], "client": key[1], "error": str(task.exception())[:300],
+                   "sample": f"response_cache.error.{key[0]}.{key[1]}"},
+        )
+
+
+def _not_modified(request: Request, entry: _Entry) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == entry.etag for t in tags)
+
+
+def _response(request: Request, entry: _Entry, state: str, endpoint: str) -> Response:
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": "private, no-cache",
+        "Age": str(int(time.time() - entry.stored_at)),
+        "X-Cache": state,
+    }
+    if _not_modified(request, entry):
+        CACHE_REQUESTS.inc(endpoint=endpoint, result="not_modified")
+        return Response(status_code=304, headers=headers)
+    CACHE_REQUESTS.inc(endpoint=endpoint, result=state.lower())
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+async def serve(request: Request, endpoint: str, client: str, loader, model,
+                ttl: float = None, stale: float = None, variant: str = "") -> Response:
+    """Responde desde la caché o con `loader()` (payload validado con `model`)."""
+    key = (endpoint, client, variant)
+    if not ENABLED:
+        body, digest = _render(model, await loader())
+        return _response(request, _Entry(body, digest, time.time()), "BYPASS", endpoint)
+    ttl = TTL if ttl is None else float(ttl)
+    stale = STALE if stale is None else float(stale)
+    entry = _entries.get(key)
+    forced = "no-cache" in request.headers.get("cache-control", "")
+    if entry is not None and not forced:
+        age = time.time() - entry.stored_at
+        if age < ttl:
+            _entries.move_to_end(key)
+            return _response(request, entry, "HIT", endpoint)
+        if age < ttl + stale:
+            _refresh(key, loader, model, background=True)
+            return _response(request, entry, "STALE", endpoint)
+    # Sin copia utilizable: esperar la carga compartida (shield: si este cliente
+    # se desconecta, la carga sigue para los demás)
+    entry = await asyncio.shield(_refresh(key, loader, model))
+    return _response(request, entry, "MISS", endpoint)
+
+
+def invalidate(client: str = None, endpoint: str = None):
+    """Descarta las respuestas guardadas de un cliente y/o endpoint (todas si no se indica)."""
+    def matches(key):
+        return (client is None or key[1] == client) and (endpoint is None or key[0] == endpoint)
+
+    # Las cargas en curso de los pares afectados no guardan su resultado
+    for pair in {key[:2] for key in (*_entries, *_inflight) if matches(key)}:
+        _generations[pair] = _generations.get(pair, 0) + 1
+    for key in list(_entries):
+        if matches(key):
+            del _entries[key]
+
+
+def stats() -> dict:
+    now = time.time()
+    return {
+        "enabled": ENABLED,
+        "entries": [
+            {"endpoint": k[0], "client": k[1], "variant": k[2], "bytes": len(e.body),
+             "age": round(now - e.stored_at, 1), "etag": e.etag}
+            for k, e in _entries.items()
+        ],
+        "refreshing": [f"{k[0]}:{k[1]}" for k in _inflight],
+    }
@@ -0,0 +1,228 @@
+"""Planificador justo ponderado (WFQ) para el trabajo pesado por cliente.
+
+Todo sync, compare, create-missing, syncPersonal y soap-store pasa por aquí
+antes de ejecutarse. El planificador limita la concurrencia global y por
+cliente y reparte los turnos según el peso de cada cliente, de modo que un
+catálogo grande no deja esperando a las tiendas pequeñas.
+
+Configuración por cliente (en CLIENTS_API_JSON o SOAP_CREDENTIALS_JSON):
+  - "weight": participación relativa (default 1)
+  - "maxConcurrency": tareas simultáneas del cliente (default 1)
+  - "priority": clase de prioridad; mayor se atiende primero (default 0)
+
+Las peticiones HTTP síncronas (POST /syncPersonal, POST /soap/{client}/store)
+piden turno en primer plano: tienen su propio cupo, por cliente
+(SCHEDULER_FOREGROUND_CLIENT_CONCURRENCY, 1) y global
+(SCHEDULER_FOREGROUND_CONCURRENCY, 2), para no quedar esperando minutos
+detrás de un trabajo en segundo plano del mismo cliente.
+
+El costo de cada tarea es la duración promedio observada para ese
+(cliente, tipo), así los clientes con tareas largas avanzan su tiempo virtual
+más rápido y ceden turno a los demás.
+"""
+import os
+import json
+import time
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from utils.metrics import SCHEDULER_WAIT
+
+MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "4"))
+DEFAULT_CLIENT_CONCURRENCY = int(os.getenv("SCHEDULER_CLIENT_CONCURRENCY", "1"))
+FOREGROUND_CONCURRENCY = int(os.getenv("SCHEDULER_FOREGROUND_CONCURRENCY", "2"))
+FOREGROUND_CLIENT_CONCURRENCY = int(os.getenv("SCHEDULER_FOREGROUND_CLIENT_CONCURRENCY", "1"))
+# Costo inicial (segundos) de un (cliente, tipo) sin historial
+DEFAULT_COST = 1.0
+# Suavizado del costo observado
+COST_ALPHA = 0.3
+
+
+def _load_client_config() -> dict:
+    config = {}
+    for var in ("SOAP_CREDENTIALS_JSON", "CLIENTS_API_JSON"):
+        try:
+            entries = json.loads(os.getenv(var, "[]"))
+        except json.JSONDecodeError:
+            entries = []
+        for entry in entries:
+            name = entry.get("client")
+            if not name:
+                continue
+            cfg = config.setdefault(name, {})
+            for key in ("weight", "maxConcurrency", "priority"):
+                if key in entry:
+                    cfg[key] = entry[key]
+    return config
+
+
+class _Ticket:
+    __slots__ = ("client", "kind", "foreground", "future", "enqueued_at", "seq", "finish_tag")
+
+    def __init__(self, client, kind, foreground, future, seq):
+        self.client = client
+        self.kind = kind
+        self.foreground = foreground
+        self.future = future
+        self.enqueued_at = time.time()
+        self.seq = seq
+        self.finish_tag = 0.0
+
+
+class _ClientState:
+    def __init__(self, name: str, cfg: dict):
+        self.name = name
+        self.weight = max(float(cfg.get("weight", 1) or 1), 0.01)
+        self.max_concurrency = max(int(cfg.get("maxConcurrency", DEFAULT_CLIENT_CONCURRENCY) or 1), 1)
+        self.priority = int(cfg.get("priority", 0) or 0)
+        self.queue = []
+        self.running = 0
+        self.running_foreground = 0
+        self.last_finish = 0.0
+        # Métricas de espera en cola
+        self.granted = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_last = 0.0
+
+
+class FairScheduler:
+    """Reparte turnos de ejecución entre clientes con WFQ y límites de concurrencia."""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, client_config: dict = None,
+                 max_foreground: int = FOREGROUND_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.max_foreground = max_foreground
+        self._config = client_config if client_config is not None else _load_client_config()
+        self._clients = {}
+        self._costs = {}
+        self._running = 0
+        self._running_foreground = 0
+        self._vtime = 0.0
+        self._seq = itertools.count()
+
+    def _client(self, name: str) -> _ClientState:
+        state = self._clients.get(name)
+        if state is None:
+            state = _ClientState(name, self._config.get(name, {}))
+            self._clients[name] = state
+        return state
+
+    def _cost(self, client: str, kind: str) -> float:
+        return self._costs.get((client, kind), DEFAULT_COST)
+
+    @asynccontextmanager
+    async def slot(self, client: str, kind: str, foreground: bool = False):
+        """Espera turno para (cliente, tipo) y lo libera al salir.
+
+        Con foreground=True el turno sale del cupo de primer plano.
+        """
+        state = self._client(client)
+        ticket = _Ticket(client, kind, foreground, asyncio.get_running_loop().create_future(), next(self._seq))
+        # Etiqueta de finalización WFQ: inicio virtual + costo / peso
+        start_tag = max(self._vtime, state.last_finish)
+        ticket.finish_tag = start_tag + self._cost(client, kind) / state.weight
+        state.last_finish = ticket.finish_tag
+        state.queue.append(ticket)
+        self._pump()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket in state.queue:
+                state.queue.remove(ticket)
+            elif ticket.future.done() and not ticket.future.cancelled():
+                # Se otorgó el turno justo al cancelarse: devolverlo
+                self._release(state, foreground)
+            raise
+        started = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - started
+            key = (client, kind)
+            prev = self._costs.get(key)
+            self._costs[key] = elapsed if prev is None else (1 - COST_ALPHA) * prev + COST_ALPHA * elapsed
+            self._release(state, foreground)
+
+    async def run(self, client: str, kind: str, factory, *args, foreground: bool = False, **kwargs):
+        """Ejecuta factory(*args, **kwargs) cuando el planificador da turno al cliente."""
+        async with self.slot(client, kind, foreground):
+            return await factory(*args, **kwargs)
+
+    def _release(self, state: _ClientState, foreground: bool):
+        if foreground:
+            state.running_foreground -= 1
+            self._running_foreground -= 1
+        else:
+            state.running -= 1
+            self._running -= 1
+        self._pump()
+
+    def _has_room(self, state: _ClientState, foreground: bool) -> bool:
+        if foreground:
+            return (state.running_foreground < FOREGROUND_CLIENT_CONCURRENCY
+                    and self._running_foreground < self.max_foreground)
+        return state.running < state.max_concurrency and self._running < self.max_concurrency
+
+    def _pump(self):
+        while True:
+            ticket, state = self._next_ticket()
+            if ticket is None:
+                return
+            state.queue.remove(ticket)
+            if ticket.foreground:
+                state.running_foreground += 1
+                self._running_foreground += 1
+            else:
+                state.running += 1
+                self._running += 1
+            self._vtime = max(self._vtime, ticket.finish_tag - self._cost(ticket.client, ticket.kind) / state.weight)
+            wait = time.time() - ticket.enqueued_at
+            state.granted += 1
+            state.wait_total += wait
+            state.wait_max = max(state.wait_max, wait)
+            state.wait_last = wait
+            SCHEDULER_WAIT.observe(wait, client=ticket.client, kind=ticket.kind)
+            ticket.future.set_result(None)
+
+    def _next_ticket(self):
+        best, best_state, best_key = None, None, None
+        for state in self._clients.values():
+            for ticket in state.queue:
+                if ticket.future.done() or not self._has_room(state, ticket.foreground):
+                    continue
+                key = (-state.priority, ticket.finish_tag, ticket.seq)
+                if best_key is None or key < best_key:
+                    best, best_state, best_key = ticket, state, key
+                # La cola de cada cliente está ordenada por etiqueta: basta el primero con cupo
+                break
+        return best, best_state
+
+    def stats(self) -> dict:
+        """Estado actual y métricas de espera en cola por cliente."""
+        clients = {}
+        for name, state in self._clients.items():
+            clients[name] = {
+                "weight": state.weight,
+                "priority": state.priority,
+                "maxConcurrency": state.max_concurrency,
+                "running": state.running,
+                "runningForeground": state.running_foreground,
+                "queued": len(state.queue),
+                "granted": state.granted,
+                "waitAvg": round(state.wait_total / state.granted, 4) if state.granted else 0.0,
+                "waitMax": round(state.wait_max, 4),
+                "waitLast": round(state.wait_last, 4),
+            }
+        return {
+            "maxConcurrency": self.max_concurrency,
+            "maxForeground": self.max_foreground,
+            "running": self._running,
+            "runningForeground": self._running_foreground,
+            "queued": sum(len(s.queue) for s in self._clients.values()),
+            "costs": {f"{c}:{k}": round(v, 4) for (c, k), v in self._costs.items()},
+            "clients": clients,
+        }
+
+
+scheduler = FairScheduler()
@@ -0,0 +1,71 @@
+"""Almacén local (SQLite) para el estado operativo del servicio.
+
+Guarda datos que deben sobrevivir reinicios pero que no pertenecen a la BD
+de negocio (huellas de escritura, trabajos, checkpoints, cachés).
+La ruta se configura con la variable de entorno STATE_DB_PATH.
+"""
+import os
+import sqlite3
+import asyncio
+import threading
+
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "state.db")
+
+_lock = threading.RLock()
+_conn = None
+_schemas = set()
+
+
+def _get_connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(STATE_DB_PATH, check_same_thread=False, isolation_level=None)
+        _conn.row_factory = sqlite3.Row
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+    return _conn
+
+
+def ensure_schema(name: str, ddl: str):
+    """Ejecuta el DDL de un módulo una sola vez por proceso."""
+    if name in _schemas:
+        return
+    with _lock:
+        if name not in _schemas:
+            _get_connection().executescript(ddl)
+            _schemas.add(name)
+
+
+def execute(sql: str, params=()) -> int:
+    """Ejecuta una sentencia y devuelve el número de filas afectadas."""
+    with _lock:
+        return _get_connection().execute(sql, params).rowcount
+
+
+def executemany(sql: str, seq_params) -> int:
+    """Ejecuta una sentencia en lote dentro de una transacción."""
+    with _lock:
+        conn = _get_connection()
+        conn.execute("BEGIN")
+        try:
+            cur = conn.executemany(sql, seq_params)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cur.rowcount
+
+
+def fetchall(sql: str, params=()) -> list:
+    with _lock:
+        return _get_connection().execute(sql, params).fetchall()
+
+
+def fetchone(sql: str, params=()):
+    with _lock:
+        return _get_connection().execute(sql, params).fetchone()
+
+
+async def run(fn, *args, **kwargs):
+    """Ejecuta una operación SQLite fuera del event loop."""
+    return await asyncio.to_thread(fn, *args, **kwargs)
@@ -0,0 +1,128 @@
+"""Warm-up opcional al arrancar la API.
+
+Sin warm-up, la primera petición de cada tipo paga el costo de arranque: abrir
+conexiones a la BD, importar zeep y parsear el WSDL, y el TLS con cada tienda.
+Con WARMUP_ON_STARTUP=1, al arrancar:
+
+  - db: abre WARMUP_DB_CONNECTIONS conexiones (2 por defecto) y las deja en el
+    pool, si hay clientes con provider 'db';
+  - soap: importa zeep y carga el WSDL de cada host de SOAP_CREDENTIALS_JSON
+    (queda en la caché de getDataClient);
+  - woo: una petición mínima a cada tienda de CLIENTS_API_JSON, que deja la
+    conexión abierta en el cliente compartido de wooCalls.
+
+Los pasos corren en paralelo, cada uno con WARMUP_TIMEOUT segundos (30); un
+paso que falla solo se registra. Por defecto el warm-up corre en segundo
+plano y el worker atiende de inmediato; WARMUP_WAIT=1 retrasa el arranque
+hasta que termine. Los tiempos quedan en /startup/stats y en el log.
+"""
+import os
+import json
+import time
+import asyncio
+from utils import startup
+from utils.logs import get_logger
+
+ENABLED = os.getenv("WARMUP_ON_STARTUP", "0") == "1"
+WAIT = os.getenv("WARMUP_WAIT", "0") == "1"
+TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "30"))
+DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "2"))
+
+log = get_logger("warmup")
+
+_task = None
+
+
+def _entries(var: str) -> list:
+    try:
+        entries = json.loads(os.getenv(var, "[]"))
+    except json.JSONDecodeError:
+        return []
+    return [e for e in entries if isinstance(e, dict)]
+
+
+async def _warm_db():
+    from sqlalchemy import text
+    from dbConn import engine
+    # Abrir todas a la vez para que el pool quede con DB_CONNECTIONS conexiones
+    conns = await asyncio.gather(*(engine.connect() for _ in range(DB_CONNECTIONS)))
+    try:
+        for conn in conns:
+            await conn.execute(text("SELECT 1"))
+    finally:
+        for conn in conns:
+            await conn.close()
+
+
+async def _warm_soap(host: str):
+    from getDataClient import preload_wsdl
+    await asyncio.to_thread(preload_wsdl, host)
+
+
+async def _warm_store(entry: dict):
+    from wooCalls import WooCommerceAPI
+    await WooCommerceAPI(entry["url"], entry["ck"], entry["cs"]).ping()
+
+
+def _steps() -> list:
+    """(nombre, corrutina) de cada paso según la configuración de clientes."""
+    clients = _entries("CLIENTS_API_JSON")
+    steps = []
+    if DB_CONNECTIONS > 0 and any(c.get("provider", "db") == "db" for c in clients):
+        steps.append(("db", _warm_db()))
+    hosts = {e["siretUrl"] for e in _entries("SOAP_CREDENTIALS_JSON") if e.get("siretUrl")}
+    steps += [(f"soap:{host}", _warm_soap(host)) for host in sorted(hosts)]
+    stores = {c["url"].rstrip("/"): c for c in clients if c.get("url") and c.get("ck") and c.get("cs")}
+    steps += [(f"woo:{url}", _warm_store(entry)) for url, entry in sorted(stores.items())]
+    return steps
+
+
+async def _timed(name: str, coro) -> dict:
+    start = time.perf_counter()
+    step = {"step": name, "status": "ok"}
+    try:
+        await asyncio.wait_for(coro, TIMEOUT)
+    except asyncio.TimeoutError:
+        step["status"] = "timeout"
+    except Exception as e:
+        step["status"] = "error"
+        step["error"] = str(e)[:300] or repr(e)
+    step["elapsed"] = round(time.perf_counter() - start, 4)
+    return step
+
+
+async def run() -> list:
+    """Ejecuta todos los pasos y devuelve su resultado y duración."""
+    startup.set_warmup("running")
+    start = time.perf_counter()
+    steps = await asyncio.gather(*(_timed(name, coro) for name, coro in _steps()))
+    elapsed = round(time.perf_counter() - start, 4)
+    failed = [s for s in steps if s["status"] != "ok"]
+    startup.set_warmup("partial" if failed else "done", list(steps), elapsed)
+    log.info(
+        f"Warm-up terminado en {elapsed}s ({len(steps) - len(failed)}/{len(steps)} pasos ok)",
+        extra={"elapsed": elapsed, "steps": steps, "imports": startup.stats()["imports"]},
+    )
+    return steps
+
+
+async def start():
+    """Lanza el warm-up si está habilitado (esperándolo con WARMUP_WAIT=1)."""
+    global _task
+    if not ENABLED:
+        return
+    if WAIT:
+        await run()
+        return
+    _task = asyncio.create_task(run(), name="warmup")
+
+
+async def stop():
+    global _task
+    if _task is not None and not _task.done():
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    _task = None
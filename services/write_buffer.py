@@ -0,0 +1,145 @@
+"""Buffer por tienda que fusiona las actualizaciones de un mismo producto.
+
+Un SKU suele aparecer varias veces en pocos minutos entre prodsChanges (CDC y
+syncPersonal), /sync y /compare, y cada aparición era un PUT aparte. Con
+WRITE_COALESCE_WINDOW > 0 (2 segundos por defecto; 0 lo desactiva) las
+actualizaciones pasan por este buffer:
+
+  - la primera escritura de un producto sale de inmediato (sin demora);
+  - las que llegan mientras ese PUT está en vuelo se fusionan por campo
+    (gana la última) y salen juntas en un solo PUT cuando se cumple la
+    ventana desde el anterior; las que llegan en ese lapso se suman;
+  - cada llamador recibe la respuesta (o el error) del PUT que incluyó sus
+    campos;
+  - `images` no se fusiona entre llamadores con imágenes distintas: el que
+    llega con otras imágenes espera a que salga el PUT pendiente y va en el
+    siguiente. Así la respuesta que recibe cada llamador trae sus propias
+    imágenes y MediaLibrary.learn no asocia una URL al medio de otra.
+
+Así un producto nunca tiene dos PUT simultáneos, que en WooCommerce se pueden
+pisar, y mientras sus actualizaciones llegan seguidas sale como mucho un PUT
+por ventana. Si el PUT termina sin nada pendiente, la próxima actualización
+vuelve a salir de inmediato. woo_writes_coalesced_total y /writes/stats
+informan las escrituras ahorradas por tienda.
+"""
+import os
+import asyncio
+import weakref
+from utils import metrics
+
+WINDOW = float(os.getenv("WRITE_COALESCE_WINDOW", "2"))
+
+WRITES_COALESCED = metrics.counter(
+    "woo_writes_coalesced_total", "Actualizaciones fusionadas en un PUT ya pendiente", ("store",))
+
+# Event loop -> {URL base de la tienda: StoreBuffer}; se liberan junto con su loop
+# (asyncio.run sucesivos en scripts y pruebas)
+_buffers = weakref.WeakKeyDictionary()
+
+
+class _Pending:
+    __slots__ = ("fields", "waiters", "sent")
+
+    def __init__(self):
+        self.fields = {}
+        self.waiters = []
+        # Se marca cuando el PUT del lote terminó (bien, con error o cancelado)
+        self.sent = asyncio.Event()
+
+
+class StoreBuffer:
+    """Actualizaciones pendientes de una tienda, por ID de producto."""
+
+    def __init__(self, store: str):
+        self.store = store
+        self._pending = {}
+        self._flushers = {}
+        self.calls = 0
+        self.requests = 0
+
+    async def update(self, wc, product_id, fields: dict) -> dict:
+        """PUT de `fields` al producto, fusionado con los pendientes del mismo ID."""
+        self.calls += 1
+        pending = self._pending.get(product_id)
+        while (pending is not None and "images" in fields
+               and pending.fields.get("images", fields["images"]) != fields["images"]):
+            # Otras imágenes ya pendientes: este llamador va en el PUT siguiente
+            await pending.sent.wait()
+            pending = self._pending.get(product_id)
+        if pending is None:
+            pending = self._pending[product_id] = _Pending()
+        else:
+            WRITES_COALESCED.inc(store=self.store)
+        pending.fields.update(fields)
+        future = asyncio.get_running_loop().create_future()
+        pending.waiters.append(future)
+        if product_id not in self._flushers:
+            self._flushers[product_id] = asyncio.create_task(self._flush(wc, product_id))
+        return await future
+
+    async def _flush(self, wc, product_id):
+        loop = asyncio.get_running_loop()
+        pending = None
+        try:
+            while True:
+                pending = self._pending.pop(product_id)
+                started = loop.time()
+                self.requests += 1
+                try:
+                    result = await wc.update_product(product_id, pending.fields)
+                except Exception as e:
+                    for future in pending.waiters:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for future in pending.waiters:
+                        if not future.done():
+                            future.set_result(result)
+                pending.sent.set()
+                if product_id not in self._pending:
+                    break
+                # Lo que llegó durante el PUT espera el resto de la ventana y sale junto
+                await asyncio.sleep(max(0.0, WINDOW - (loop.time() - started)))
+        finally:
+            del self._flushers[product_id]
+            # Si se canceló el flusher (cierre del loop o del proceso), nadie debe quedar esperando
+            for batch in (pending, self._pending.pop(product_id, None)):
+                if batch is None:
+                    continue
+                for future in batch.waiters:
+                    if not future.done():
+                        future.cancel()
+                batch.sent.set()
+
+    def stats(self) -> dict:
+        return {
+            "store": self.store,
+            "calls": self.calls,
+            "requests": self.requests,
+            # Cada producto pendiente será un PUT más
+            "saved": self.calls - self.requests - len(self._pending),
+            "pending": len(self._pending),
+        }
+
+
+def enabled() -> bool:
+    return WINDOW > 0
+
+
+def for_store(wc) -> StoreBuffer:
+    buffers = _buffers.setdefault(asyncio.get_running_loop(), {})
+    buffer = buffers.get(wc.base_url)
+    if buffer is None:
+        buffer = buffers[wc.base_url] = StoreBuffer(wc.store)
+    return buffer
+
+
+async def update_product(wc, product_id, fields: dict) -> dict:
+    """Actualiza un producto a través del buffer de su tienda (o directo si está desactivado)."""
+    if not enabled():
+        return await wc.update_product(product_id, fields)
+    return await for_store(wc).update(wc, product_id, fields)
+
+
+def stats() -> list:
+    return [buffer.stats() for buffer in _buffers.get(asyncio.get_running_loop(), {}).values()]
@@ -1,86 +1,83 @@
 #!/usr/bin/env python3
-import os
-import json
+"""Corrida batch: soap-store, syncPersonal y limpieza de prodsChanges para todos los clientes.
+
+Ejecuta la lógica en proceso (sin llamar a la API por HTTP), en paralelo por
+cliente y con timeout por cliente. Ver services/orchestrator.py.
+"""
 import sys
-try:
-    import requests
-except ImportError:
-    print("Por favor instale 'requests': pip install requests")
-    sys.exit(1)
-from dotenv import load_dotenv
+import json
 import asyncio
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.orchestrator import run_all, summary_lines, DEFAULT_CONCURRENCY, DEFAULT_TIMEOUT
 from utils.whatsapp_notifier import send_whatsapp
 
-def main():
-    load_dotenv()
-    api_base = os.getenv("API_BASE_URL", "http://localhost:8000")
-    # Ejecutar SOAP store para cada cliente
-    summary_lines = []
-    soap_env = os.getenv("SOAP_CREDENTIALS_JSON", "[]")
-    try:
-        soap_clients = json.loads(soap_env)
-    except json.JSONDecodeError as e:
-        print(f"Error parsing SOAP_CREDENTIALS_JSON: {e}")
-        soap_clients = []
-    for entry in soap_clients:
-        client = entry.get("client")
-        if not client:
-            continue
-        url = f"{api_base}/soap/{client}/store"
-        try:
-            resp = requests.post(url)
-            if resp.ok:
-                msg = f"[SOAP] {client}: OK -> {resp.text}"
-            else:
-                msg = f"[SOAP] {client}: ERROR {resp.status_code} -> {resp.text}"
-        except Exception as e:
-            msg = f"[SOAP] {client}: EXCEPTION -> {e}"
-        print(msg)
-        summary_lines.append(msg)
 
-    # Ejecutar syncPersonal para cada cliente API
-    clients_env = os.getenv("CLIENTS_API_JSON", "[]")
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sincronización batch multi-cliente")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Clientes en paralelo por fase (env SYNC_ALL_CONCURRENCY)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="Timeout por cliente en segundos (env SYNC_ALL_TIMEOUT)")
+    parser.add_argument("--skip-soap", action="store_true", help="No ejecutar soap-store")
+    parser.add_argument("--skip-sync", action="store_true", help="No ejecutar syncPersonal")
+    parser.add_argument("--no-clear", action="store_true", help="No vaciar prodsChanges")
+    parser.add_argument("--force-clear", action="store_true",
+                        help="Vaciar prodsChanges aunque alguna tarea haya fallado")
+    parser.add_argument("--report", help="Ruta donde guardar el reporte JSON de tiempos")
+    parser.add_argument("--no-notify", action="store_true", help="No enviar resumen por WhatsApp")
+    return parser.parse_args(argv)
+
+
+async def _main(args) -> int:
+    from dbConn import engine
+    from wooCalls import close_clients
+    from services import cpu_pool
     try:
-        api_clients = json.loads(clients_env)
-    except json.JSONDecodeError as e:
-        print(f"Error parsing CLIENTS_API_JSON: {e}")
-        api_clients = []
-    for entry in api_clients:
-        client = entry.get("client")
-        if not client:
-            continue
-        url = f"{api_base}/syncPersonal/{client}"
+        report = await run_all(
+            concurrency=args.concurrency,
+            timeout=args.timeout,
+            soap=not args.skip_soap,
+            sync=not args.skip_sync,
+            clear=not args.no_clear,
+            force_clear=args.force_clear,
+        )
+    finally:
+        await close_clients()
+        await engine.dispose()
+        cpu_pool.shutdown()
+    lines = summary_lines(report)
+    for line in lines:
+        print(line)
+    print("Tiempos por fase:")
+    for phase in report["phases"]:
+        print(f"  {phase['phase']}: {phase['elapsed']}s")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        print(f"Reporte guardado en {args.report}")
+
+    if not args.no_notify:
+        # Enviar notificación por WhatsApp con el resumen
         try:
-            resp = requests.post(url)
-            if resp.ok:
-                msg = f"[SYNC] {client}: OK -> {resp.text}"
-            else:
-                msg = f"[SYNC] {client}: ERROR {resp.status_code} -> {resp.text}"
+            await send_whatsapp("sync_all", "\n".join(lines))
         except Exception as e:
-            msg = f"[SYNC] {client}: EXCEPTION -> {e}"
-        print(msg)
-        summary_lines.append(msg)
+            print(f"Error enviando notificación WhatsApp: {e}")
 
-    # Limpiar tabla de cambios
-    url = f"{api_base}/clearProdsChange"
-    try:
-        resp = requests.post(url)
-        if resp.ok:
-            msg = f"[CLEAR] prodsChange: OK -> {resp.text}"
-        else:
-            msg = f"[CLEAR] prodsChange: ERROR {resp.status_code} -> {resp.text}"
-    except Exception as e:
-        msg = f"[CLEAR] prodsChange: EXCEPTION -> {e}"
-    print(msg)
-    summary_lines.append(msg)
+    failed = any(
+        p.get("failed") or p.get("status") == "error" for p in report["phases"]
+    )
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.exit(asyncio.run(_main(args)))
 
-    # Enviar notificación por WhatsApp con el resumen
-    try:
-        load_dotenv()  # asegurar variables de Twilio cargadas
-        resumen = "\n".join(summary_lines)
-        asyncio.run(send_whatsapp("sync_all", resumen))
-    except Exception as e:
-        print(f"Error enviando notificación WhatsApp: {e}")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
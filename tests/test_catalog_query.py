@@ -0,0 +1,118 @@
+"""Filtros y cursores de /items y /inventory."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from services.catalog_query import CatalogQuery, SOAP_KEYS
+
+
+def _items(*skus):
+    return [{"sku": sku, "categoria": "Hogar > Cocina", "stock": 1} for sku in skus]
+
+
+def _pages(query, items, keys=None):
+    skus, cursor = [], None
+    while True:
+        q = CatalogQuery(limit=query.limit, cursor=cursor, sku_prefix=query.sku_prefix,
+                         category=query.category, in_stock=query.in_stock)
+        page, cursor = q.page(items, keys) if keys else q.page(items)
+        skus.append([it.get((keys or ("sku",))[0]) for it in page])
+        if cursor is None:
+            return skus
+
+
+def test_without_parameters_returns_everything():
+    query = CatalogQuery()
+    assert not query.active and query.variant == ""
+    assert query.page(_items("B", "A")) == (_items("B", "A"), None)
+
+
+def test_pages_follow_sku_order():
+    assert _pages(CatalogQuery(limit=2), _items("C", "A", "E", "B", "D")) == [["A", "B"], ["C", "D"], ["E"]]
+
+
+def test_cursor_is_stable_when_catalog_changes():
+    items = _items("A", "B", "C", "D")
+    first, cursor = CatalogQuery(limit=2).page(items)
+    # Entre páginas se agrega un SKU antes del cursor y se borra uno ya devuelto
+    items = _items("0", "B", "C", "D", "AA")
+    second, cursor = CatalogQuery(limit=2, cursor=cursor).page(items)
+    assert [it["sku"] for it in first] == ["A", "B"]
+    assert [it["sku"] for it in second] == ["C", "D"]
+    assert cursor is None
+
+
+def test_filters():
+    items = [
+        {"sku": "TZ-1", "categoria": "Hogar > Cocina", "stock": 3},
+        {"sku": "TZ-2", "categoria": "Hogar > Baño", "stock": 0},
+        {"sku": "PL-1", "categoria": "Cocina", "stock": "2"},
+    ]
+    assert [it["sku"] for it in CatalogQuery(sku_prefix="TZ").page(items)[0]] == ["TZ-1", "TZ-2"]
+    assert [it["sku"] for it in CatalogQuery(category="cocina").page(items)[0]] == ["TZ-1", "PL-1"]
+    assert [it["sku"] for it in CatalogQuery(in_stock=True).page(items)[0]] == ["TZ-1", "PL-1"]
+
+
+def test_soap_keys():
+    items = [{"codigo": "B", "familia": "X", "stock": 1}, {"codigo": "A", "familia": "X", "stock": 1}]
+    assert _pages(CatalogQuery(limit=1), items, SOAP_KEYS) == [["A"], ["B"]]
+
+
+def test_cursor_is_bound_to_its_filters():
+    _, cursor = CatalogQuery(limit=1, sku_prefix="A").page(_items("A1", "A2"))
+    assert CatalogQuery(limit=1, cursor=cursor, sku_prefix="A").cursor == {"after": "A1"}
+    with pytest.raises(HTTPException) as err:
+        CatalogQuery(limit=1, cursor=cursor, sku_prefix="B")
+    assert err.value.status_code == 400
+    with pytest.raises(HTTPException):
+        CatalogQuery(cursor="no-es-un-cursor!")
+
+
+def test_limit_bounds():
+    for limit in (0, 5001):
+        with pytest.raises(HTTPException):
+            CatalogQuery(limit=limit)
+
+
+def test_variant_distinguishes_pages():
+    _, cursor = CatalogQuery(limit=1).page(_items("A", "B"))
+    variants = {CatalogQuery(limit=1).variant, CatalogQuery(limit=2).variant,
+                CatalogQuery(limit=1, cursor=cursor).variant, CatalogQuery(limit=1, in_stock=True).variant}
+    assert len(variants) == 4
+
+
+class FakeWoo:
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    async def get_products_page(self, page, per_page, params):
+        self.requests.append((page, params))
+        return self.pages[page - 1], len(self.pages)
+
+
+def _woo_pages(query, wc):
+    out, cursor = [], None
+    while True:
+        q = CatalogQuery(limit=query.limit, cursor=cursor, sku_prefix=query.sku_prefix,
+                         category=query.category, in_stock=query.in_stock)
+        page, cursor = asyncio.run(q.woo_page(wc))
+        out.append([p["sku"] for p in page])
+        if cursor is None:
+            return out
+
+
+def test_woo_cursor_walks_pages():
+    wc = FakeWoo([_items("A", "X1", "B"), _items("C", "D")])
+    assert _woo_pages(CatalogQuery(limit=2), wc) == [["A", "X1"], ["B", "C"], ["D"]]
+    # Cada página se pide desde la posición guardada, sin releer las anteriores
+    assert [page for page, _ in wc.requests] == [1, 1, 2, 2]
+
+
+def test_woo_filters_go_to_the_api():
+    wc = FakeWoo([_items("A1", "B1", "A2")])
+    query = CatalogQuery(limit=5, sku_prefix="A", category="15", in_stock=True)
+    page, cursor = asyncio.run(query.woo_page(wc))
+    assert [p["sku"] for p in page] == ["A1", "A2"] and cursor is None
+    assert wc.requests[0][1] == {"category": 15, "stock_status": "instock"}
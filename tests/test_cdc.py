@@ -0,0 +1,308 @@
+"""Marca de agua, huecos, reintentos y TRUNCATE del daemon CDC."""
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+import dbConn
+from services import cdc, state_store
+from conftest import CLIENT
+
+
+class Clock:
+    """Reloj monotónico controlado por la prueba."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class _Result:
+    def __init__(self, rows=None, value=None):
+        self._rows = rows or []
+        self._value = value
+
+    def scalar(self):
+        return self._value
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class FakeProdsChanges:
+    """prodsChanges en memoria, con la forma de AsyncSessionLocal."""
+
+    def __init__(self, rows=()):
+        self.rows = dict(rows)  # id -> sku
+        self.deletes = []
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def begin(self):
+        return self
+
+    async def execute(self, stmt, params=None):
+        sql = str(stmt)
+        params = params or {}
+        keep = {v for k, v in params.items() if k.startswith("k")}
+        if sql.startswith("SELECT MAX(id)"):
+            return _Result(value=max((i for i in self.rows if i not in keep), default=None))
+        if sql.startswith("SELECT MIN(id)"):
+            return _Result(value=min(self.rows, default=None))
+        if sql.startswith("SELECT id, sku"):
+            ids = sorted(i for i in self.rows if i > params["after"])[:params["n"]]
+            return _Result(rows=[SimpleNamespace(id=i, sku=self.rows[i]) for i in ids])
+        if sql.startswith("DELETE FROM prodsChanges"):
+            self.deletes.append((params["low"], keep))
+            for i in [i for i in self.rows if i <= params["low"] and i not in keep]:
+                del self.rows[i]
+            return _Result()
+        raise AssertionError(f"SQL inesperado: {sql}")
+
+
+class FakeStore:
+    """fetch/push de main: registra los SKUs enviados y hace fallar los de `failing`."""
+
+    def __init__(self, table):
+        self.table = table
+        self.failing = set()
+        self.pushed = []
+
+    async def fetch_changed_rows(self, creds):
+        return [SimpleNamespace(sku=sku) for sku in dict.fromkeys(self.table.rows.values())]
+
+    async def push_changed_rows(self, client, creds, rows):
+        skus = [row.sku for row in rows]
+        self.pushed.append(skus)
+        return {"failed": [s for s in skus if s in self.failing], "changes_count": len(skus)}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cdc, "time", SimpleNamespace(
+        monotonic=clock.monotonic, time=time.time, perf_counter=time.perf_counter))
+    return clock
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeProdsChanges()
+    monkeypatch.setattr(dbConn, "AsyncSessionLocal", table)
+    return table
+
+
+@pytest.fixture
+def store(monkeypatch, table):
+    store = FakeStore(table)
+    monkeypatch.setattr(main, "fetch_changed_rows", store.fetch_changed_rows)
+    monkeypatch.setattr(main, "push_changed_rows", store.push_changed_rows)
+    return store
+
+
+def _watermark():
+    return cdc._load_watermark(CLIENT)
+
+
+def _dead_letters():
+    cdc._schema()
+    return [(row["row_id"], row["sku"], row["attempts"])
+            for row in state_store.fetchall("SELECT row_id, sku, attempts FROM cdc_dead_letters")]
+
+
+# --- _ClientState.advance ---
+
+def test_advance_moves_over_contiguous_done_ids():
+    state = cdc._ClientState(CLIENT, 10)
+    state.done = {11, 12, 14}
+    assert state.advance([11, 12, 13, 14]) is True
+    assert state.last_id == 12
+    assert state.done == {14}
+
+
+def test_gap_holds_watermark_until_timeout(clock, monkeypatch):
+    monkeypatch.setattr(cdc, "GAP_TIMEOUT", 300)
+    state = cdc._ClientState(CLIENT, 10)
+    state.done = {12, 13}
+
+    assert state.advance([12, 13]) is False
+    assert state.last_id == 10
+    assert state.gap == (10, clock.now)
+
+    clock.now += 299
+    assert state.advance([12, 13]) is False
+    assert state.last_id == 10
+
+    clock.now += 2
+    assert state.advance([12, 13]) is True
+    assert state.last_id == 13
+    assert state.done == set()
+
+
+def test_gap_filled_before_timeout(clock, monkeypatch):
+    monkeypatch.setattr(cdc, "GAP_TIMEOUT", 300)
+    state = cdc._ClientState(CLIENT, 10)
+    state.done = {12}
+    assert state.advance([12]) is False
+
+    clock.now += 10
+    state.done.add(11)
+    assert state.advance([11, 12]) is True
+    assert state.last_id == 12
+
+
+def test_gap_timer_restarts_for_a_new_gap(clock, monkeypatch):
+    monkeypatch.setattr(cdc, "GAP_TIMEOUT", 300)
+    state = cdc._ClientState(CLIENT, 10)
+    state.done = {12}
+    state.advance([12])
+
+    clock.now += 301
+    state.done = {12, 14}
+    # El hueco en 11 ya venció; el de 13 empieza a contar ahora
+    assert state.advance([12, 14]) is True
+    assert state.last_id == 12
+    assert state.gap == (12, clock.now)
+
+
+# --- CdcDaemon.poll ---
+
+def test_poll_does_not_resend_rows_behind_a_gap(clock, table, store, monkeypatch):
+    monkeypatch.setattr(cdc, "GAP_TIMEOUT", 300)
+    table.rows = {1: "A", 2: "B", 4: "D"}
+    cdc._save_watermark(CLIENT, 0)
+    daemon = cdc.CdcDaemon([CLIENT])
+
+    counts = asyncio.run(daemon.poll(CLIENT))
+    assert counts["acked"] == 3
+    assert counts["last_id"] == 2
+    assert _watermark() == 2
+
+    async def later():
+        clock.now += 100
+        first = await daemon.poll(CLIENT)
+        clock.now += 201
+        return first, await daemon.poll(CLIENT)
+
+    before, after = asyncio.run(later())
+    assert before["rows"] == 0 and before["last_id"] == 2
+    assert after["rows"] == 0 and after["last_id"] == 4
+    assert _watermark() == 4
+    assert store.pushed == [["A", "B", "D"]]
+
+
+def test_poll_processes_a_late_row_inside_the_gap(clock, table, store):
+    table.rows = {1: "A", 3: "C"}
+    cdc._save_watermark(CLIENT, 0)
+    daemon = cdc.CdcDaemon([CLIENT])
+
+    async def run():
+        await daemon.poll(CLIENT)
+        table.rows[2] = "B"  # la transacción abierta se confirma
+        return await daemon.poll(CLIENT)
+
+    counts = asyncio.run(run())
+    assert counts["rows"] == 1
+    assert counts["last_id"] == 3
+    assert store.pushed == [["A", "C"], ["B"]]
+
+
+def test_failed_row_retries_then_dead_letters(clock, table, store, monkeypatch):
+    monkeypatch.setattr(cdc, "MAX_ATTEMPTS", 3)
+    table.rows = {1: "A", 2: "B", 3: "C"}
+    store.failing = {"B"}
+    cdc._save_watermark(CLIENT, 0)
+    daemon = cdc.CdcDaemon([CLIENT])
+
+    async def run():
+        return [await daemon.poll(CLIENT) for _ in range(3)]
+
+    first, second, third = asyncio.run(run())
+    assert (first["acked"], first["retry"], first["last_id"]) == (2, 1, 1)
+    assert (second["rows"], second["retry"], second["last_id"]) == (1, 1, 1)
+    assert (third["dead_letter"], third["last_id"]) == (1, 3)
+    assert store.pushed == [["A", "B", "C"], ["B"], ["B"]]
+    assert _dead_letters() == [(2, "B", 3)]
+    assert _watermark() == 3
+
+    # Todo quedó confirmado, pero la fila descartada no se borra de prodsChanges
+    asyncio.run(daemon._cleanup())
+    assert table.deletes == [(3, {2})]
+    assert table.rows == {2: "B"}
+
+
+def test_kept_dead_letter_is_not_taken_for_a_truncate(clock, table, store, monkeypatch):
+    monkeypatch.setattr(cdc, "MAX_ATTEMPTS", 1)
+    table.rows = {1: "A", 2: "B", 3: "C"}
+    store.failing = {"B"}
+    cdc._save_watermark(CLIENT, 0)
+    daemon = cdc.CdcDaemon([CLIENT])
+
+    async def run():
+        await daemon.poll(CLIENT)
+        await daemon._cleanup()
+        # Solo queda la fila descartada (2), por debajo de la marca (3)
+        return await daemon.poll(CLIENT)
+
+    counts = asyncio.run(run())
+    assert table.rows == {2: "B"}
+    assert (counts["rows"], counts["last_id"]) == (0, 3)
+    assert store.pushed == [["A", "B", "C"]]
+    assert _dead_letters() == [(2, "B", 1)]
+
+    table.rows[4] = "D"
+    counts = asyncio.run(daemon.poll(CLIENT))
+    assert (counts["acked"], counts["last_id"]) == (1, 4)
+
+
+def test_cleanup_waits_for_every_client(clock, table, store):
+    table.rows = {1: "A"}
+    cdc._save_watermark(CLIENT, 0)
+    daemon = cdc.CdcDaemon([CLIENT, "otra"])
+
+    async def run():
+        await daemon.poll(CLIENT)
+        await daemon._cleanup()
+
+    asyncio.run(run())
+    assert table.deletes == []
+
+
+def test_truncate_resets_watermark_and_dead_letters(clock, table, store, monkeypatch):
+    monkeypatch.setattr(cdc, "MAX_ATTEMPTS", 1)
+    table.rows = {1: "A", 2: "B", 3: "C"}
+    store.failing = {"B"}
+    cdc._save_watermark(CLIENT, 0)
+    daemon = cdc.CdcDaemon([CLIENT])
+
+    asyncio.run(daemon.poll(CLIENT))
+    assert _watermark() == 3
+    assert _dead_letters() == [(2, "B", 1)]
+
+    # TRUNCATE: los ids vuelven a empezar por debajo de la marca
+    table.rows = {1: "X", 2: "Y"}
+    store.failing = set()
+    counts = asyncio.run(daemon.poll(CLIENT))
+    assert counts["acked"] == 2
+    assert counts["last_id"] == 2
+    assert store.pushed[-1] == ["X", "Y"]
+    assert _dead_letters() == []
+    assert _watermark() == 2
+
+
+def test_first_start_begins_at_oldest_row(clock, table, store):
+    table.rows = {41: "A", 42: "B"}
+    counts = asyncio.run(cdc.CdcDaemon([CLIENT]).poll(CLIENT))
+    assert counts["acked"] == 2
+    assert _watermark() == 42
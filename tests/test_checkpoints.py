@@ -0,0 +1,259 @@
+"""Checkpoints de corridas: reanudación, límites y borrado al terminar."""
+import time
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import main
+from services import checkpoints, state_store, write_buffer
+from conftest import CLIENT
+
+
+def _header(kind):
+    checkpoints._schema()
+    row = state_store.fetchone(
+        "SELECT cursor, plan, resumes FROM sync_checkpoints WHERE kind = ? AND client = ?", (kind, CLIENT))
+    return dict(row) if row else None
+
+
+def _items(kind):
+    checkpoints._schema()
+    return sorted(
+        row["sku"] for row in state_store.fetchall(
+            "SELECT sku FROM sync_checkpoint_items WHERE kind = ? AND client = ?", (kind, CLIENT)))
+
+
+async def _load(kind="sync_personal"):
+    return await checkpoints.Checkpoint(kind, CLIENT).load()
+
+
+# --- Checkpoint ---
+
+def test_resume_matches_row_fingerprint():
+    async def run():
+        first = await _load()
+        await first.done("A", "fp-a")
+        await first.done("B", "fp-b", product_id=7)
+        await first.save()
+        return await _load()
+
+    resumed = asyncio.run(run())
+    assert resumed.resumed
+    assert resumed.is_done("A", "fp-a")
+    assert not resumed.is_done("B", "fp-b-cambiada")  # la fila cambió desde el corte
+    assert not resumed.is_done("C", "fp-c")
+    assert resumed.is_done("B")
+    assert resumed.skipped == 2
+    assert resumed.created_ids() == {"B": 7}
+
+
+def test_nothing_done_saves_nothing():
+    async def run():
+        checkpoint = await _load()
+        await checkpoint.save()
+        return await _load()
+
+    assert not asyncio.run(run()).resumed
+    assert _header("sync_personal") is None
+
+
+def test_done_saves_in_batches(monkeypatch):
+    monkeypatch.setattr(checkpoints, "EVERY", 2)
+    monkeypatch.setattr(checkpoints, "SECONDS", 3600)
+
+    async def run():
+        checkpoint = await _load()
+        await checkpoint.done("A", "fp")
+        assert _items("sync_personal") == []
+        await checkpoint.done("B", "fp")
+
+    asyncio.run(run())
+    assert _items("sync_personal") == ["A", "B"]
+
+
+def test_clear_removes_checkpoint():
+    async def run():
+        checkpoint = await _load()
+        await checkpoint.done("A", "fp")
+        await checkpoint.save()
+        await checkpoint.clear()
+        return await _load()
+
+    assert not asyncio.run(run()).resumed
+    assert _header("sync_personal") is None
+    assert _items("sync_personal") == []
+
+
+def test_plan_survives_later_saves():
+    async def run():
+        checkpoint = await _load("create_missing")
+        await checkpoint.set_plan(["A", "B"])
+        await checkpoint.done("A")
+        checkpoint.cursor = 1
+        await checkpoint.save()
+        return await _load("create_missing")
+
+    resumed = asyncio.run(run())
+    assert resumed.plan == ["A", "B"]
+    assert resumed.cursor == 1
+
+
+def test_old_checkpoint_is_discarded(monkeypatch):
+    monkeypatch.setattr(checkpoints, "MAX_AGE", 60)
+
+    async def run():
+        checkpoint = await _load()
+        checkpoint.started_at = time.time() - 120
+        await checkpoint.done("A", "fp")
+        await checkpoint.save()
+        return await _load()
+
+    assert not asyncio.run(run()).resumed
+    assert _header("sync_personal") is None
+
+
+def test_resumes_are_capped(monkeypatch):
+    monkeypatch.setattr(checkpoints, "MAX_RESUMES", 2)
+
+    async def run():
+        checkpoint = await _load()
+        await checkpoint.done("A", "fp")
+        await checkpoint.save()
+        return [(await _load()).resumed for _ in range(3)]
+
+    assert asyncio.run(run()) == [True, True, False]
+    assert _items("sync_personal") == []
+
+
+# --- Corridas reanudadas ---
+
+def _duplicate_sku():
+    request = httpx.Request("POST", "http://woo.test/wp-json/wc/v3/products")
+    response = httpx.Response(400, json={"code": "product_invalid_sku"}, request=request)
+    return httpx.HTTPStatusError("400 Bad Request", request=request, response=response)
+
+
+class FakeWoo:
+    """Tienda en memoria; `cut_at` corta la corrida justo después de crear ese SKU."""
+
+    base_url = "http://woo.test"
+    store = "woo.test"
+
+    def __init__(self, skus=()):
+        self.products = {sku: i + 1 for i, sku in enumerate(skus)}
+        self.cut_at = None
+        self.fail = set()
+        self.listings = 0
+        self.creates = []
+        self.updates = []
+
+    def __call__(self, *args):
+        return self
+
+    async def get_all_products(self):
+        self.listings += 1
+        return [{"id": pid, "sku": sku} for sku, pid in self.products.items()]
+
+    async def find_by_sku(self, sku):
+        return [{"id": self.products[sku], "sku": sku, "categories": []}] if sku in self.products else []
+
+    async def create_product(self, data):
+        sku = data["sku"]
+        if sku in self.fail:
+            raise RuntimeError("500 de la tienda")
+        if sku in self.products:
+            raise _duplicate_sku()
+        self.products[sku] = len(self.products) + 1
+        self.creates.append(sku)
+        if sku == self.cut_at:
+            # El producto quedó creado en la tienda, pero el proceso se corta antes del checkpoint
+            raise asyncio.CancelledError()
+        return {"id": self.products[sku], "sku": sku}
+
+    async def update_product(self, product_id, fields):
+        self.updates.append((product_id, dict(fields)))
+        return {"id": product_id}
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    woo = FakeWoo()
+    monkeypatch.setattr(main, "WooCommerceAPI", woo)
+    monkeypatch.setattr(write_buffer, "WINDOW", 0)
+    return woo
+
+
+@pytest.fixture
+def local(monkeypatch):
+    products = []
+
+    async def fetch_local_products(client):
+        return products, "db"
+
+    monkeypatch.setattr(main, "fetch_local_products", fetch_local_products)
+    return products
+
+
+def _local(*skus):
+    return [{"sku": sku, "nombre": sku, "precio": 10, "stock": 3} for sku in skus]
+
+
+def test_create_missing_resumes_without_duplicates(woo, local):
+    woo.products = {"P1": 1}
+    local.extend(_local("P1", "P2", "P3", "P4", "P5"))
+    woo.cut_at = "P3"
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(main.run_create_missing_wp(CLIENT))
+    assert _header("create_missing")["plan"] == '["P2", "P3", "P4", "P5"]'
+    assert _items("create_missing") == ["P2"]
+
+    woo.cut_at = None
+    result = asyncio.run(main.run_create_missing_wp(CLIENT))
+    assert woo.listings == 1  # el plan guardado evita repaginar la tienda
+    assert woo.creates == ["P2", "P3", "P4", "P5"]
+    assert sorted(c["sku"] for c in result["created"]) == ["P2", "P3", "P4", "P5"]
+    assert (result["errors_count"], result["resumed"], result["skipped_checkpoint"]) == (0, True, 1)
+    assert _header("create_missing") is None
+    assert _items("create_missing") == []
+
+
+def test_create_missing_clears_checkpoint_despite_item_errors(woo, local):
+    local.extend(_local("P1", "P2"))
+    woo.fail = {"P2"}
+
+    result = asyncio.run(main.run_create_missing_wp(CLIENT))
+    assert (result["created_count"], result["errors_count"]) == (1, 1)
+    # El plan recorrido no queda guardado: el próximo intento vuelve a comparar con la tienda
+    assert _header("create_missing") is None
+
+
+def _row(sku, stock):
+    return SimpleNamespace(Sku=sku, Name=sku, Stock=stock, FamilyxExport=None, Image=None,
+                           Sync=1, Tipo="Actualizado", FinalPrice=10)
+
+
+def test_sync_personal_skips_only_unchanged_rows(woo, monkeypatch):
+    woo.products = {"A": 1, "B": 2, "C": 3}
+    rows = [_row("A", 5), _row("B", 6), _row("C", 7)]
+
+    async def fetch_changed_rows(creds):
+        return rows
+
+    monkeypatch.setattr(main, "fetch_changed_rows", fetch_changed_rows)
+
+    async def interrupted():
+        # Intento anterior: A y B enviados; B cambió en el origen desde entonces
+        checkpoint = await _load()
+        await checkpoint.done("A", checkpoints.row_fingerprint(rows[0]))
+        await checkpoint.done("B", checkpoints.row_fingerprint(_row("B", 1)))
+        await checkpoint.save()
+
+    asyncio.run(interrupted())
+    result = asyncio.run(main.run_sync_personal(CLIENT))
+    assert (result["resumed"], result["skipped_checkpoint"]) == (True, 1)
+    assert sorted(pid for pid, _ in woo.updates) == [2, 3]
+    assert result["failed"] == []
+    assert _header("sync_personal") is None
@@ -0,0 +1,86 @@
+"""Huellas de push: campos omitidos, descarte y vencimiento."""
+import asyncio
+
+import httpx
+
+from services import fingerprints, state_store
+from services.fingerprints import PushFingerprints
+from conftest import CLIENT
+
+
+def _http_error(status):
+    request = httpx.Request("PUT", "http://woo.test/wp-json/wc/v3/products/1")
+    return httpx.HTTPStatusError(str(status), request=request, response=httpx.Response(status, request=request))
+
+
+async def _recorded(fields):
+    fps = await PushFingerprints(CLIENT).load()
+    await fps.record("A", fields)
+    await fps.flush()
+    return await PushFingerprints(CLIENT).load()
+
+
+def test_changed_returns_only_new_values():
+    async def run():
+        fps = await _recorded({"stock_quantity": 5, "name": "Taza"})
+        return fps, fps.changed("A", {"stock_quantity": 5, "name": "Taza roja"})
+
+    fps, changes = asyncio.run(run())
+    assert changes == {"name": "Taza roja"}
+    assert fps.skipped_fields == 1
+    assert fps.skipped_requests == 0  # la petición se cuenta aparte, solo si no queda nada
+    assert fps.is_current("A", "stock_quantity", 5)
+    assert not fps.is_current("B", "stock_quantity", 5)
+
+
+def test_record_counts_writes():
+    async def run():
+        fps = await PushFingerprints(CLIENT).load()
+        await fps.record("A", {})
+        await fps.record("A", {"stock_quantity": 1})
+        return fps.writes
+
+    assert asyncio.run(run()) == 1
+
+
+def test_forget_drops_memory_pending_and_stored():
+    async def run():
+        fps = await _recorded({"stock_quantity": 5})
+        await fps.record("A", {"name": "Taza"})
+        await fps.forget("A")
+        await fps.flush()
+        return fps, await PushFingerprints(CLIENT).load()
+
+    fps, reloaded = asyncio.run(run())
+    assert fps.changed("A", {"stock_quantity": 5}) == {"stock_quantity": 5}
+    assert reloaded.changed("A", {"stock_quantity": 5, "name": "Taza"}) == {"stock_quantity": 5, "name": "Taza"}
+
+
+def test_forget_if_gone_only_on_404():
+    async def run():
+        fps = await _recorded({"stock_quantity": 5})
+        kept = await fps.forget_if_gone("A", _http_error(500))
+        assert fps.is_current("A", "stock_quantity", 5)
+        gone = await fps.forget_if_gone("A", _http_error(404))
+        return kept, gone, fps.is_current("A", "stock_quantity", 5)
+
+    assert asyncio.run(run()) == (False, True, False)
+
+
+def test_fingerprints_expire(monkeypatch):
+    monkeypatch.setattr(fingerprints, "TTL", 3600)
+    asyncio.run(_recorded({"stock_quantity": 5}))
+    state_store.execute("UPDATE push_fingerprints SET updated_at = updated_at - 7200")
+
+    fps = asyncio.run(PushFingerprints(CLIENT).load())
+    assert fps.changed("A", {"stock_quantity": 5}) == {"stock_quantity": 5}
+    assert state_store.fetchall("SELECT sku FROM push_fingerprints") == []
+
+
+def test_ttl_zero_keeps_fingerprints(monkeypatch):
+    monkeypatch.setattr(fingerprints, "TTL", 0)
+    asyncio.run(_recorded({"stock_quantity": 5}))
+    state_store.execute("UPDATE push_fingerprints SET updated_at = 0")
+
+    fps = asyncio.run(PushFingerprints(CLIENT).load())
+    assert fps.changed("A", {"stock_quantity": 5}) == {}
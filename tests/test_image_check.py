@@ -0,0 +1,91 @@
+"""Clasificación de URLs de imagen: rotas, válidas y sin verificar."""
+import asyncio
+
+import httpx
+import pytest
+
+from services import image_check
+
+
+def _probe(status, content_type="image/jpeg", head_status=None):
+    def handler(request):
+        code = head_status if head_status is not None and request.method == "HEAD" else status
+        return httpx.Response(code, headers={"content-type": content_type})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await image_check._probe(client, "http://img.test/a.jpg", asyncio.Semaphore(1))
+
+    return asyncio.run(run())[1]
+
+
+@pytest.mark.parametrize("status, content_type, expected", [
+    (200, "image/jpeg", True),
+    (200, "", True),
+    (200, "text/html", False),
+    (404, "text/html", False),
+    (410, "text/html", False),
+    (500, "text/html", None),
+    (503, "text/html", None),
+    (429, "text/html", None),
+])
+def test_probe_status(status, content_type, expected):
+    assert _probe(status, content_type) is expected
+
+
+def test_probe_falls_back_to_get_when_head_is_refused():
+    assert _probe(200, head_status=405) is True
+    assert _probe(404, head_status=405) is False
+
+
+def test_probe_timeout_is_unknown():
+    def handler(request):
+        raise httpx.ConnectTimeout("timeout", request=request)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await image_check._probe(client, "http://img.test/a.jpg", asyncio.Semaphore(1))
+
+    assert asyncio.run(run())[1] is None
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    monkeypatch.setattr(image_check, "ENABLED", True)
+    monkeypatch.setattr(image_check, "_memory", {})
+    results = {}
+    calls = []
+
+    async def probe(client, url, sem):
+        calls.append(url)
+        return url, results[url], 200 if results[url] else 404
+
+    monkeypatch.setattr(image_check, "_probe", probe)
+    return results, calls
+
+
+def test_unknown_urls_are_kept_and_not_cached(probes):
+    results, calls = probes
+    results.update({"http://img.test/ok.jpg": True, "http://img.test/dead.jpg": False,
+                    "http://img.test/down.jpg": None})
+
+    dead = asyncio.run(image_check.dead_urls(list(results) + ["no image"]))
+    assert dead == {"http://img.test/dead.jpg", "no image"}
+
+    calls.clear()
+    image_check._memory.clear()
+    asyncio.run(image_check.dead_urls(list(results)))
+    # Los verificados salen del almacén; el caído se vuelve a probar
+    assert calls == ["http://img.test/down.jpg"]
+
+
+def test_memory_is_capped(monkeypatch):
+    monkeypatch.setattr(image_check, "_memory", {})
+    monkeypatch.setattr(image_check, "MEMORY_MAX", 3)
+    image_check._remember("expired", (True, 50), now=100)
+    for url in ("a", "b", "c"):
+        image_check._remember(url, (True, 500), now=100)
+    # La vencida sale primero
+    assert list(image_check._memory) == ["a", "b", "c"]
+    image_check._remember("d", (True, 500), now=100)
+    assert list(image_check._memory) == ["b", "c", "d"]
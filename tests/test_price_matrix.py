@@ -0,0 +1,129 @@
+"""Matriz de precios (NumPy y Python) y aislamiento de errores de updatePriceList."""
+import asyncio
+from decimal import Decimal
+
+import pytest
+
+import main
+from services import price_matrix
+
+LISTS = ["VIP", "GOLD", "OFERTA"]
+
+
+@pytest.fixture(params=["python", "numpy"])
+def engine(request, monkeypatch):
+    if request.param == "numpy":
+        monkeypatch.setattr(price_matrix, "np", pytest.importorskip("numpy"))
+    else:
+        monkeypatch.setattr(price_matrix, "np", None)
+    return request.param
+
+
+def _matrix():
+    matrix = price_matrix.PriceMatrix(LISTS)
+    matrix.add_current("VIP", [
+        {"codigo": "A", "precio": 0.1},       # igual a Decimal("0.10")
+        {"codigo": "B", "precio": "12.50"},   # cambió
+        {"codigo": "C", "precio": 7},         # nuevo
+        {"codigo": "D", "precio": "n/a"},     # inválido: se ignora
+        {"codigo": None, "precio": 3},
+    ])
+    matrix.add_stored("VIP", [("A", Decimal("0.10")), ("B", Decimal("12.00")), ("E", Decimal("4"))])
+    matrix.add_current("GOLD", [{"codigo": "A", "precio": 0.104}, {"codigo": "B", "precio": 11}])
+    matrix.add_stored("GOLD", [("A", Decimal("0.10")), ("B", Decimal("11.00"))])
+    matrix.add_stored("OFERTA", [("A", Decimal("0.05"))])
+    return matrix.build()
+
+
+def _named(matrix, changes):
+    return {
+        name: {
+            "inserted": sorted(matrix.skus[r] for r in diff["inserted"]),
+            "updated": sorted(matrix.skus[r] for r in diff["updated"]),
+            "unchanged": diff["unchanged"],
+        }
+        for name, diff in changes.items()
+    }
+
+
+def test_changes_counts(engine):
+    matrix = _matrix()
+    assert matrix.engine == engine
+    assert _named(matrix, matrix.changes(tolerance=0.005)) == {
+        "VIP": {"inserted": ["C"], "updated": ["B"], "unchanged": 1},
+        "GOLD": {"inserted": [], "updated": [], "unchanged": 2},
+        "OFERTA": {"inserted": [], "updated": [], "unchanged": 0},
+    }
+
+
+def test_tolerance(engine):
+    matrix = _matrix()
+    # 0.104 contra 0.10 supera una tolerancia de una milésima
+    assert _named(matrix, matrix.changes(tolerance=0.001))["GOLD"]["updated"] == ["A"]
+    assert _named(matrix, matrix.changes(tolerance=1))["VIP"]["updated"] == []
+
+
+def test_price_missing_and_margins(engine):
+    matrix = _matrix()
+    assert matrix.price("VIP", matrix.skus.index("B")) == 12.5
+    # E solo está guardado en VIP; C solo llegó en VIP
+    assert sorted(matrix.missing("GOLD")) == ["C", "E"]
+    assert sorted(matrix.missing("OFERTA")) == ["B", "C", "E"]
+    margins = matrix.margins("VIP")
+    assert margins["GOLD"]["skus"] == 2
+    assert margins["OFERTA"] == {"skus": 1, "mean": -0.5, "median": -0.5, "min": -0.5, "max": -0.5}
+
+
+def test_numpy_matches_python(monkeypatch):
+    numpy = pytest.importorskip("numpy")
+    results = {}
+    for name, module in (("python", None), ("numpy", numpy)):
+        monkeypatch.setattr(price_matrix, "np", module)
+        matrix = _matrix()
+        results[name] = (_named(matrix, matrix.changes()), sorted(matrix.missing("GOLD")), matrix.margins("VIP"))
+    assert results["numpy"] == results["python"]
+
+
+# --- updatePriceList ---
+
+class _Session:
+    def __init__(self, writes):
+        self.writes = writes
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def begin(self):
+        return self
+
+    async def execute(self, stmt, params=None, **kwargs):
+        self.writes.extend(params)
+
+
+def test_load_error_is_isolated_per_list(monkeypatch):
+    writes = []
+    loads = []
+
+    async def soap(siret_url, ws_cid, ws_passwd, bid=0):
+        return {"data": [{"codigo": f"SKU{ws_cid}", "precio": 10}]}
+
+    async def load(configs):
+        names = [cfg["priceList"] for cfg in configs]
+        loads.append(names)
+        if len(names) > 1 or names == ["GOLD"]:
+            raise RuntimeError("deadlock")
+        return {names[0]: len(loads)}, {names[0]: []}
+
+    monkeypatch.setattr(main, "wsc_request_bodega_all_items", soap)
+    monkeypatch.setattr(main, "_load_price_lists", load)
+    monkeypatch.setattr(main, "AsyncSessionLocal", lambda: _Session(writes))
+
+    results = {r["priceList"]: r for r in asyncio.run(main.updatePriceList())["results"]}
+    assert len(loads[0]) == 6 and len(loads) == 7
+    assert results["GOLD"]["messages"] == ["Error: deadlock"]
+    ok = [name for name, r in results.items() if r["inserted"] == 1]
+    assert len(ok) == 5 and "GOLD" not in ok
+    assert len(writes) == 5
@@ -0,0 +1,164 @@
+"""Caché de respuestas: frescas, vencidas, ETag/304 e invalidación por generación."""
+import json
+import asyncio
+from types import SimpleNamespace
+from collections import OrderedDict
+
+import pytest
+from starlette.requests import Request
+
+from schemas import ItemsResponse
+from services import response_cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class Loader:
+    """Carga del endpoint: cuenta llamadas y puede quedar esperando a la prueba."""
+
+    def __init__(self, client="tienda"):
+        self.client = client
+        self.calls = 0
+        self.stock = 1
+        self.gate = None
+
+    async def __call__(self):
+        self.calls += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        return {"client": self.client, "provider": "db", "count": 1, "elapsed": 0.1 * self.calls,
+                "productos": [{"sku": "A", "precio": 10, "stock": self.stock}]}
+
+
+def _request(**headers):
+    return Request({"type": "http", "method": "GET", "path": "/items", "query_string": b"",
+                    "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]})
+
+
+async def _serve(loader, client="tienda", **headers):
+    return await response_cache.serve(_request(**headers), "items", client, loader, ItemsResponse, ttl=60, stale=600)
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache, "ENABLED", True)
+    monkeypatch.setattr(response_cache, "_entries", OrderedDict())
+    monkeypatch.setattr(response_cache, "_inflight", {})
+    monkeypatch.setattr(response_cache, "_generations", {})
+    monkeypatch.setattr(response_cache, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+def test_body_matches_the_model():
+    response = asyncio.run(_serve(Loader()))
+    body = json.loads(response.body)
+    assert body == ItemsResponse.model_validate(body).model_dump()
+    assert body["elapsed"] == 0.1
+    assert response.headers["x-cache"] == "MISS"
+
+
+def test_fresh_stale_and_expired(cache):
+    loader = Loader()
+
+    async def run():
+        states = [(await _serve(loader)).headers["x-cache"]]
+        cache.now += 30
+        states.append((await _serve(loader)).headers["x-cache"])
+        cache.now += 60
+        states.append((await _serve(loader)).headers["x-cache"])
+        await _settle()  # refresco en segundo plano
+        states.append((await _serve(loader)).headers["x-cache"])
+        cache.now += 1000
+        states.append((await _serve(loader)).headers["x-cache"])
+        return states
+
+    assert asyncio.run(run()) == ["MISS", "HIT", "STALE", "HIT", "MISS"]
+    assert loader.calls == 3
+
+
+def test_concurrent_misses_share_one_load():
+    loader = Loader()
+
+    async def run():
+        loader.gate = asyncio.Event()
+        tasks = [asyncio.create_task(_serve(loader)) for _ in range(3)]
+        await _settle()
+        loader.gate.set()
+        return await asyncio.gather(*tasks)
+
+    responses = asyncio.run(run())
+    assert loader.calls == 1
+    assert len({r.body for r in responses}) == 1
+
+
+def test_etag_survives_refresh_with_same_content(cache):
+    loader = Loader()
+
+    async def run():
+        first = await _serve(loader)
+        etag = first.headers["etag"]
+        cache.now += 100
+        await _serve(loader, cache_control="no-cache")  # recarga: mismo contenido, otro elapsed
+        cached = await _serve(loader, if_none_match=etag)
+        loader.stock = 2
+        await _serve(loader, cache_control="no-cache")
+        changed = await _serve(loader, if_none_match=etag)
+        return etag, cached, changed
+
+    etag, cached, changed = asyncio.run(run())
+    assert cached.status_code == 304 and cached.body == b""
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+
+def test_invalidate_drops_only_matching_client():
+    ours, theirs = Loader("tienda"), Loader("otra")
+
+    async def run():
+        await _serve(ours)
+        await _serve(theirs, client="otra")
+        response_cache.invalidate("tienda", "items")
+        return (await _serve(ours)).headers["x-cache"], (await _serve(theirs, client="otra")).headers["x-cache"]
+
+    assert asyncio.run(run()) == ("MISS", "HIT")
+
+
+def test_load_started_before_invalidation_is_not_stored():
+    loader = Loader()
+
+    async def run():
+        loader.gate = asyncio.Event()
+        pending = asyncio.create_task(_serve(loader))
+        await _settle()
+        response_cache.invalidate("tienda")  # hubo escrituras durante la carga
+        loader.gate.set()
+        served = await pending
+        loader.gate = None
+        return served, await _serve(loader)
+
+    served, after = asyncio.run(run())
+    assert served.status_code == 200  # quien esperaba recibe la respuesta igual
+    assert after.headers["x-cache"] == "MISS"
+    assert loader.calls == 2
+
+
+def test_entries_are_capped(monkeypatch):
+    monkeypatch.setattr(response_cache, "MAX_ENTRIES", 2)
+
+    async def run():
+        for client in ("a", "b", "c"):
+            await _serve(Loader(client), client=client)
+
+    asyncio.run(run())
+    assert [e["client"] for e in response_cache.stats()["entries"]] == ["b", "c"]
@@ -0,0 +1,139 @@
+"""Turnos del planificador WFQ: pesos, prioridad, límites y cupo de primer plano."""
+import asyncio
+
+from services.scheduler import FairScheduler
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def _order(scheduler, requests, blocker="bloqueo"):
+    """Encola `requests` [(nombre, cliente)] detrás de un turno ocupado y devuelve el orden de atención."""
+    order = []
+    release = asyncio.Event()
+
+    async def hold():
+        async with scheduler.slot(blocker, "sync"):
+            await release.wait()
+
+    async def task(name, client):
+        async with scheduler.slot(client, "sync"):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    holder = asyncio.create_task(hold())
+    await _settle()
+    tasks = [asyncio.create_task(task(name, client)) for name, client in requests]
+    await _settle()
+    release.set()
+    await asyncio.gather(holder, *tasks)
+    return order
+
+
+def _requests():
+    return [(f"a{i}", "a") for i in range(1, 5)] + [(f"b{i}", "b") for i in range(1, 3)]
+
+
+def test_equal_weights_alternate():
+    scheduler = FairScheduler(max_concurrency=1, client_config={})
+    order = asyncio.run(_order(scheduler, _requests()))
+    assert order == ["a1", "b1", "a2", "b2", "a3", "a4"]
+
+
+def test_weight_gives_proportional_turns():
+    scheduler = FairScheduler(max_concurrency=1, client_config={"a": {"weight": 2}})
+    order = asyncio.run(_order(scheduler, _requests()))
+    assert order == ["a1", "a2", "b1", "a3", "a4", "b2"]
+
+
+def test_priority_class_goes_first():
+    scheduler = FairScheduler(max_concurrency=1, client_config={"b": {"priority": 1}})
+    order = asyncio.run(_order(scheduler, _requests()))
+    assert order == ["b1", "b2", "a1", "a2", "a3", "a4"]
+
+
+def test_client_concurrency_limit():
+    async def run():
+        scheduler = FairScheduler(max_concurrency=4, client_config={"b": {"maxConcurrency": 2}})
+        release = asyncio.Event()
+
+        async def task(client):
+            async with scheduler.slot(client, "sync"):
+                await release.wait()
+
+        tasks = [asyncio.create_task(task(c)) for c in ("a", "a", "b", "b", "b")]
+        await _settle()
+        stats = scheduler.stats()
+        release.set()
+        await asyncio.gather(*tasks)
+        return stats, scheduler.stats()
+
+    during, after = asyncio.run(run())
+    assert (during["clients"]["a"]["running"], during["clients"]["a"]["queued"]) == (1, 1)
+    assert (during["clients"]["b"]["running"], during["clients"]["b"]["queued"]) == (2, 1)
+    assert (after["running"], after["queued"]) == (0, 0)
+    assert after["clients"]["b"]["granted"] == 3
+
+
+def test_foreground_does_not_wait_for_background():
+    async def run():
+        scheduler = FairScheduler(max_concurrency=1, client_config={}, max_foreground=2)
+        release = asyncio.Event()
+        entered = []
+
+        async def task(name, client, foreground):
+            async with scheduler.slot(client, "sync", foreground=foreground):
+                entered.append(name)
+                await release.wait()
+
+        tasks = [
+            asyncio.create_task(task("fondo", "a", False)),
+            asyncio.create_task(task("fondo2", "b", False)),
+            asyncio.create_task(task("http", "a", True)),
+            asyncio.create_task(task("http2", "a", True)),   # cupo por cliente: 1
+            asyncio.create_task(task("http-b", "b", True)),
+            asyncio.create_task(task("http-c", "c", True)),  # cupo global: 2
+        ]
+        await _settle()
+        during = list(entered), scheduler.stats()
+        release.set()
+        await asyncio.gather(*tasks)
+        return during, entered
+
+    (entered, stats), final = asyncio.run(run())
+    assert entered == ["fondo", "http", "http-b"]
+    assert (stats["running"], stats["runningForeground"], stats["queued"]) == (1, 2, 3)
+    assert sorted(final) == ["fondo", "fondo2", "http", "http-b", "http-c", "http2"]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        scheduler = FairScheduler(max_concurrency=1, client_config={})
+        release = asyncio.Event()
+
+        async def hold():
+            async with scheduler.slot("a", "sync"):
+                await release.wait()
+
+        async def wait():
+            async with scheduler.slot("b", "sync"):
+                pass
+
+        holder = asyncio.create_task(hold())
+        await _settle()
+        waiter = asyncio.create_task(wait())
+        await _settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        queued = scheduler.stats()["queued"]
+        release.set()
+        await holder
+        # El turno liberado no queda tomado por el cancelado
+        await scheduler.run("c", "sync", asyncio.sleep, 0)
+        return queued, scheduler.stats()
+
+    queued, stats = asyncio.run(run())
+    assert queued == 0
+    assert (stats["running"], stats["queued"]) == (0, 0)
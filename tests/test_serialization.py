@@ -0,0 +1,100 @@
+"""render(): mismos bytes con orjson, con json y con la validación de pydantic."""
+import sys
+import datetime
+import importlib.util
+from decimal import Decimal
+
+import pytest
+
+from schemas import ItemsResponse, InventoryResponse
+from utils import serialization
+
+
+@pytest.fixture(scope="module")
+def fallback():
+    """Copia del módulo cargada sin orjson (json de la biblioteca estándar)."""
+    saved = sys.modules.get("orjson")
+    sys.modules["orjson"] = None
+    try:
+        spec = importlib.util.find_spec("utils.serialization")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if saved is None:
+            del sys.modules["orjson"]
+        else:
+            sys.modules["orjson"] = saved
+    assert module.orjson is None
+    return module
+
+
+PRODUCTS = [
+    {"sku": "A-1", "nombre": "Taza \"grande\" ñandú ☕", "precio": 10, "stock": "3", "extra": "fuera"},
+    {"sku": "B-2", "nombre": "Línea\nnueva \\ barra", "precio": "12.50", "stock": 2.0},
+    {"sku": "C-3", "precio": "", "stock": None, "categoria": {"id": 15, "name": "Cocina"}},
+    {"sku": "D-4", "precio": Decimal("0.10"), "stock": Decimal("7"), "categoria": "Hogar > Cocina"},
+    {"sku": "E-5", "precio": 1e20, "stock": 0, "image": "http://img.test/e+07.jpg", "imageName": "NaN"},
+    {"sku": "F-6", "precio": 1e-07, "stock": 10 ** 6},
+    {"sku": "F-7", "precio": 2.5e-05, "stock": 1},
+    {"sku": "G-7", "precio": float("nan")},
+    {"sku": "H-8", "precio": float("inf"), "nombre": "1e+20 Infinity"},
+]
+
+
+# El "" de WooCommerce sale como null; pydantic lo rechaza al validar
+VALID = [p for p in PRODUCTS if p.get("precio") != ""]
+
+
+def _payloads(products=PRODUCTS):
+    yield ItemsResponse, {"client": "tienda", "provider": "db", "count": len(products), "elapsed": 0.25,
+                          "productos": products}
+    yield ItemsResponse, {"client": "tienda", "provider": "sirett", "count": 0, "elapsed": 1e-05,
+                          "productos": [], "nextCursor": "eyJhZnRlciI6IkEifQ"}
+    yield InventoryResponse, {"client": "tienda", "count": 1, "elapsed": 3.0, "productos": products[:1]}
+
+
+@pytest.mark.skipif(serialization.orjson is None, reason="orjson no instalado")
+@pytest.mark.parametrize("model, payload", list(_payloads()))
+def test_json_fallback_matches_orjson(fallback, model, payload):
+    assert fallback.render(model, payload) == serialization.render(model, payload)
+
+
+@pytest.mark.parametrize("model, payload", list(_payloads(VALID)))
+def test_render_matches_pydantic(fallback, model, payload, monkeypatch):
+    expected = model.model_validate(payload).model_dump_json().encode()
+    assert fallback.render(model, payload) == expected
+    assert serialization.render(model, payload) == expected
+    monkeypatch.setattr(serialization, "STRICT", True)
+    assert serialization.render(model, payload) == expected
+
+
+def test_exclude(fallback):
+    model, payload = next(_payloads(VALID))
+    expected = model.model_validate(payload).model_dump_json(exclude={"elapsed"}).encode()
+    assert fallback.render(model, payload, exclude=("elapsed",)) == expected
+
+
+def test_default_types(fallback):
+    value = {"d": Decimal("1.50"), "t": datetime.date(2024, 1, 2), "s": ("a",), "b": b"x"}
+    assert fallback.dumps(value) == b'{"d":"1.50","t":"2024-01-02","s":["a"],"b":"x"}'
+    if serialization.orjson is not None:
+        assert serialization.dumps(value) == fallback.dumps(value)
+
+
+def test_product_lines(fallback):
+    lines = serialization.product_lines(PRODUCTS[:2])
+    assert lines == fallback.product_lines(PRODUCTS[:2])
+    assert lines.count(b"\n") == 2
+    assert serialization.product_lines([]) == b""
+
+
+def test_empty_price_renders_as_null(fallback):
+    model, payload = next(_payloads())
+    body = fallback.render(model, payload)
+    assert b'{"sku":"C-3","nombre":null,"precio":null,"stock":null' in body
+    assert body == serialization.render(model, payload)
+
+
+def test_product_without_sku_fails():
+    with pytest.raises(ValueError):
+        serialization.shape_products([{"nombre": "sin sku"}])
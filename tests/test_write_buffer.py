@@ -0,0 +1,189 @@
+"""Fusión de PUT por producto en StoreBuffer."""
+import gc
+import asyncio
+
+import pytest
+
+from services import write_buffer
+
+
+class FakeWc:
+    """Tienda cuyo PUT espera a que la prueba lo libere."""
+
+    base_url = "http://woo.test"
+    store = "woo.test"
+
+    def __init__(self):
+        self.puts = []
+        self.errors = {}  # número de PUT -> excepción
+        self.gates = {}
+
+    def gate(self, n):
+        return self.gates.setdefault(n, asyncio.Event())
+
+    async def update_product(self, product_id, fields):
+        n = len(self.puts)
+        self.puts.append((product_id, dict(fields)))
+        await self.gate(n).wait()
+        if n in self.errors:
+            raise self.errors[n]
+        return {"id": product_id, "put": n}
+
+
+@pytest.fixture(autouse=True)
+def window(monkeypatch):
+    monkeypatch.setattr(write_buffer, "WINDOW", 0.01)
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_first_write_goes_out_immediately():
+    async def run():
+        wc, buffer = FakeWc(), write_buffer.StoreBuffer("woo.test")
+        task = asyncio.create_task(buffer.update(wc, 1, {"regular_price": "10"}))
+        await _settle()
+        assert wc.puts == [(1, {"regular_price": "10"})]
+        wc.gate(0).set()
+        return await task, buffer.stats()
+
+    result, stats = asyncio.run(run())
+    assert result == {"id": 1, "put": 0}
+    assert stats == {"store": "woo.test", "calls": 1, "requests": 1, "saved": 0, "pending": 0}
+
+
+def test_updates_during_inflight_put_merge_into_one():
+    async def run():
+        wc, buffer = FakeWc(), write_buffer.StoreBuffer("woo.test")
+        first = asyncio.create_task(buffer.update(wc, 1, {"regular_price": "10"}))
+        await _settle()
+        second = asyncio.create_task(buffer.update(wc, 1, {"regular_price": "11", "stock_quantity": 5}))
+        third = asyncio.create_task(buffer.update(wc, 1, {"regular_price": "12"}))
+        await _settle()
+        assert len(wc.puts) == 1  # nunca dos PUT simultáneos del mismo producto
+        wc.gate(0).set()
+        wc.gate(1).set()
+        results = await asyncio.gather(first, second, third)
+        return wc.puts, results, buffer.stats()
+
+    puts, results, stats = asyncio.run(run())
+    assert puts == [(1, {"regular_price": "10"}), (1, {"regular_price": "12", "stock_quantity": 5})]
+    assert results == [{"id": 1, "put": 0}, {"id": 1, "put": 1}, {"id": 1, "put": 1}]
+    assert (stats["calls"], stats["requests"], stats["saved"]) == (3, 2, 1)
+
+
+def test_different_images_are_not_merged():
+    async def run():
+        wc, buffer = FakeWc(), write_buffer.StoreBuffer("woo.test")
+        first = asyncio.create_task(buffer.update(wc, 1, {"regular_price": "10"}))
+        await _settle()
+        soap = asyncio.create_task(buffer.update(wc, 1, {"images": [{"id": 5}]}))
+        db = asyncio.create_task(buffer.update(wc, 1, {"images": [{"src": "http://img/b.jpg"}]}))
+        same = asyncio.create_task(buffer.update(wc, 1, {"images": [{"id": 5}], "stock_quantity": 2}))
+        await _settle()
+        for n in range(3):
+            wc.gate(n).set()
+        return wc.puts, await asyncio.gather(first, soap, db, same)
+
+    puts, (first, soap, db, same) = asyncio.run(run())
+    assert puts == [
+        (1, {"regular_price": "10"}),
+        (1, {"images": [{"id": 5}], "stock_quantity": 2}),
+        (1, {"images": [{"src": "http://img/b.jpg"}]}),
+    ]
+    assert soap == same == {"id": 1, "put": 1}
+    assert db == {"id": 1, "put": 2}
+
+
+def test_error_reaches_every_waiter_of_the_merged_put():
+    async def run():
+        wc, buffer = FakeWc(), write_buffer.StoreBuffer("woo.test")
+        wc.errors[1] = RuntimeError("500 de la tienda")
+        first = asyncio.create_task(buffer.update(wc, 1, {"regular_price": "10"}))
+        await _settle()
+        second = asyncio.create_task(buffer.update(wc, 1, {"regular_price": "11"}))
+        third = asyncio.create_task(buffer.update(wc, 1, {"stock_quantity": 5}))
+        await _settle()
+        wc.gate(0).set()
+        wc.gate(1).set()
+        return await asyncio.gather(first, second, third, return_exceptions=True)
+
+    first, second, third = asyncio.run(run())
+    assert first == {"id": 1, "put": 0}
+    assert isinstance(second, RuntimeError) and isinstance(third, RuntimeError)
+
+
+def test_error_of_inflight_put_does_not_drop_queued_fields():
+    async def run():
+        wc, buffer = FakeWc(), write_buffer.StoreBuffer("woo.test")
+        wc.errors[0] = RuntimeError("timeout")
+        first = asyncio.create_task(buffer.update(wc, 1, {"regular_price": "10"}))
+        await _settle()
+        second = asyncio.create_task(buffer.update(wc, 1, {"stock_quantity": 5}))
+        await _settle()
+        wc.gate(0).set()
+        wc.gate(1).set()
+        return wc.puts, await asyncio.gather(first, second, return_exceptions=True)
+
+    puts, (first, second) = asyncio.run(run())
+    assert isinstance(first, RuntimeError)
+    assert second == {"id": 1, "put": 1}
+    assert puts[1] == (1, {"stock_quantity": 5})
+
+
+def test_products_do_not_wait_for_each_other():
+    async def run():
+        wc, buffer = FakeWc(), write_buffer.StoreBuffer("woo.test")
+        tasks = [asyncio.create_task(buffer.update(wc, pid, {"regular_price": "10"})) for pid in (1, 2)]
+        await _settle()
+        assert sorted(pid for pid, _ in wc.puts) == [1, 2]
+        wc.gate(0).set()
+        wc.gate(1).set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+
+def test_cancelled_flusher_cancels_every_waiter():
+    async def run():
+        wc, buffer = FakeWc(), write_buffer.StoreBuffer("woo.test")
+        first = asyncio.create_task(buffer.update(wc, 1, {"regular_price": "10"}))
+        await _settle()
+        second = asyncio.create_task(buffer.update(wc, 1, {"regular_price": "11"}))
+        await _settle()
+        buffer._flushers[1].cancel()
+        results = await asyncio.gather(first, second, return_exceptions=True)
+        return results, buffer.stats()
+
+    results, stats = asyncio.run(run())
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+    assert stats["pending"] == 0
+
+
+def test_disabled_buffer_writes_directly(monkeypatch):
+    monkeypatch.setattr(write_buffer, "WINDOW", 0)
+
+    async def run():
+        wc = FakeWc()
+        wc.gate(0).set()
+        return await write_buffer.update_product(wc, 7, {"regular_price": "10"}), write_buffer.stats()
+
+    result, stats = asyncio.run(run())
+    assert result == {"id": 7, "put": 0}
+    assert stats == []
+
+
+def test_buffers_are_per_loop_and_released_with_it():
+    async def run():
+        wc = FakeWc()
+        wc.gate(0).set()
+        await write_buffer.update_product(wc, 1, {"regular_price": "10"})
+        assert write_buffer.for_store(wc) is write_buffer.for_store(wc)
+        return write_buffer.stats()
+
+    stats = asyncio.run(run())
+    assert [s["requests"] for s in stats] == [1]
+    gc.collect()
+    assert len(write_buffer._buffers) == 0
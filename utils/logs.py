@@ -0,0 +1,164 @@
+"""Logging estructurado que no bloquea el event loop.
+
+Los registros se encolan (QueueHandler) y un hilo en segundo plano
+(QueueListener) los formatea y escribe a stdout y a un archivo con rotación.
+Si la cola se llena, los registros se descartan y se cuentan en lugar de
+frenar a quien registra.
+
+Los campos estructurados se pasan con `extra`:
+
+    log = get_logger("sync")
+    log.info("Sincronización completada", extra={"client": client, "changes": n})
+
+Los eventos de alto volumen por SKU llevan una clave de muestreo en `extra`
+("sample"): de cada clave se registran los primeros LOG_SAMPLE_FIRST eventos
+de cada ventana de LOG_SAMPLE_WINDOW segundos y luego uno de cada
+LOG_SAMPLE_EVERY, indicando cuántos se omitieron.
+
+Variables de entorno: LOG_LEVEL (INFO), LOG_FORMAT (json | text), LOG_FILE
+(logs/app.log; vacío desactiva el archivo), LOG_MAX_BYTES, LOG_BACKUPS,
+LOG_QUEUE_SIZE y las de muestreo.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import datetime
+import threading
+import logging.handlers
+
+LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_FILE = os.getenv("LOG_FILE", "logs/app.log")
+MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+SAMPLE_FIRST = int(os.getenv("LOG_SAMPLE_FIRST", "20"))
+SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "60"))
+
+ROOT = "app"
+
+# Atributos propios de LogRecord; el resto son campos estructurados de `extra`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sample"}
+
+_setup_lock = threading.Lock()
+_listener = None
+_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(
+            f"{k}={v}" for k, v in record.__dict__.items() if k not in _RESERVED and not k.startswith("_")
+        )
+        return f"{line} {fields}" if fields else line
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar una muestra de los registros que traen la clave 'sample'."""
+
+    def __init__(self):
+        super().__init__()
+        self._counts = {}
+        self._window_start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start > SAMPLE_WINDOW:
+                self._counts.clear()
+                self._window_start = now
+            seen, last = self._counts.get(key, (0, 0))
+            seen += 1
+            keep = seen <= SAMPLE_FIRST or (SAMPLE_EVERY > 0 and seen % SAMPLE_EVERY == 0)
+            self._counts[key] = (seen, seen if keep else last)
+        if keep and seen - last > 1:
+            record.skipped = seen - last - 1
+        return keep
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta en vez de bloquear cuando la cola está llena."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+def setup():
+    """Configura el logger 'app' con el escritor en segundo plano (idempotente)."""
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+        formatter = JsonFormatter() if FORMAT == "json" else TextFormatter()
+        handlers = []
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(formatter)
+        handlers.append(stream)
+        if LOG_FILE:
+            os.makedirs(os.path.dirname(LOG_FILE) or ".", exist_ok=True)
+            rotating = logging.handlers.RotatingFileHandler(
+                LOG_FILE, maxBytes=MAX_BYTES, backupCount=BACKUPS, encoding="utf-8"
+            )
+            rotating.setFormatter(formatter)
+            handlers.append(rotating)
+        _handler = DroppingQueueHandler(queue.Queue(QUEUE_SIZE))
+        _handler.addFilter(SamplingFilter())
+        root = logging.getLogger(ROOT)
+        root.setLevel(LEVEL)
+        root.addHandler(_handler)
+        root.propagate = False
+        _listener = logging.handlers.QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown)
+
+
+def shutdown():
+    """Vacía la cola y detiene el escritor."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            logging.getLogger(ROOT).removeHandler(_handler)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger hijo de 'app' ('app.sync', 'app.access', ...)."""
+    setup()
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+def stats() -> dict:
+    return {"queued": _handler.queue.qsize() if _handler else 0, "dropped": DroppingQueueHandler.dropped}
@@ -0,0 +1,67 @@
+"""Medición del retraso (lag) del event loop.
+
+Una tarea duerme LOOP_LAG_INTERVAL segundos (0.1 por defecto; 0 la desactiva)
+y mide cuánto tarde despierta respecto a lo pedido: ese exceso es el tiempo
+que el loop estuvo bloqueado por trabajo síncrono (parseo, mapeos, json).
+Cada muestra va al histograma event_loop_lag_seconds de /metrics y a una
+ventana reciente de la que stats() calcula percentiles.
+"""
+import os
+import asyncio
+from collections import deque
+from utils.metrics import EVENT_LOOP_LAG
+
+INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+WINDOW = 4096
+
+
+def summarize(values) -> dict:
+    """Conteo, p50/p95/p99 y máximo de una serie de valores en segundos."""
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+
+    def pct(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {"count": len(ordered), "p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "max": ordered[-1]}
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = INTERVAL, window: int = WINDOW):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self._task = None
+
+    def start(self):
+        """Arranca el muestreo en el loop actual (no hace nada si ya corre o está desactivado)."""
+        if self.interval <= 0 or (self._task and not self._task.done()):
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="loop-lag")
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - before - self.interval)
+            self.samples.append(lag)
+            EVENT_LOOP_LAG.observe(lag)
+
+    def reset(self):
+        self.samples.clear()
+
+    def stats(self) -> dict:
+        return summarize(self.samples) | {"intervalSeconds": self.interval}
+
+
+monitor = LoopLagMonitor()
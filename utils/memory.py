@@ -0,0 +1,190 @@
+"""Seguimiento opcional del pico de memoria por corrida con tracemalloc.
+
+Las corridas de catálogo completo mantienen varias copias del catálogo a la vez
+(JSON crudo, productos filtrados, mapas remoto/local, OrderedDicts de SOAP).
+Con MEMORY_TRACKING=1, o "trackMemory": true en la entrada del cliente, cada
+trabajo, soap-store y actualización de listas de precios registra:
+
+  - peakBytes: pico de memoria Python asignada durante la corrida
+  - peakDeltaBytes: pico por encima de lo asignado al empezar
+  - topSites: líneas de código con más memoria viva en el punto más alto
+    observado (se toma una instantánea al cerrar cada etapa que supera el
+    máximo anterior)
+
+tracemalloc mide todo el proceso: si corren varias tareas a la vez, el pico
+de cada una incluye la memoria de las demás. Su costo (CPU y memoria) es
+notable, por eso está desactivado por defecto.
+"""
+import os
+import json
+import time
+import functools
+import tracemalloc
+import contextvars
+import linecache
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ENABLED = os.getenv("MEMORY_TRACKING", "0") == "1"
+# Marcos de pila guardados por asignación (más marcos = más costo)
+FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "1"))
+# 0 desactiva las instantáneas (solo se reporta el pico)
+TOP_SITES = int(os.getenv("MEMORY_TOP_SITES", "10"))
+# Nueva instantánea solo si la memoria supera la anterior en este factor
+SNAPSHOT_GROWTH = 1.25
+
+_current = contextvars.ContextVar("memory_tracker", default=None)
+_active = []
+_started_here = False
+
+
+def _load_clients() -> set:
+    clients = set()
+    for var in ("SOAP_CREDENTIALS_JSON", "CLIENTS_API_JSON"):
+        try:
+            entries = json.loads(os.getenv(var, "[]"))
+        except json.JSONDecodeError:
+            entries = []
+        for entry in entries:
+            if entry.get("client") and entry.get("trackMemory"):
+                clients.add(entry["client"])
+    return clients
+
+
+_clients = _load_clients()
+
+
+def enabled_for(client: str = None) -> bool:
+    return ENABLED or (client is not None and client in _clients)
+
+
+# Sitios que no interesan en el reporte. Se descartan después de agrupar por
+# línea: Snapshot.filter_traces evalúa fnmatch por cada asignación y es lento.
+_IGNORED_FILES = {
+    tracemalloc.__file__,
+    linecache.__file__,
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+    "<unknown>",
+}
+
+
+def _short_path(filename: str) -> str:
+    rel = os.path.relpath(filename)
+    if not rel.startswith(".."):
+        return rel
+    # Fuera del proyecto (biblioteca estándar, site-packages): basta el final de la ruta
+    return "/".join(filename.split(os.sep)[-2:])
+
+
+def _rss_max_bytes():
+    if resource is None:
+        return None
+    # ru_maxrss está en KiB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class track:
+    """Mide el pico de memoria del bloque `async with`; el resultado queda en `report`."""
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self.report = None
+        self.peak = 0
+        self.top_sites = []
+        self.top_at = None
+        self._snapshot_current = 0
+        self._token = None
+
+    async def __aenter__(self):
+        if not self.enabled or _current.get() is not None:
+            return self
+        global _started_here
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(FRAMES)
+            _started_here = True
+        current, peak = tracemalloc.get_traced_memory()
+        # Reiniciar el pico sin perder el de las mediciones en curso
+        for other in _active:
+            other.peak = max(other.peak, peak)
+        tracemalloc.reset_peak()
+        self.baseline = current
+        self.peak = current
+        self._start = time.time()
+        self._token = _current.set(self)
+        _active.append(self)
+        return self
+
+    def checkpoint(self, label: str):
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        # Cada instantánea bloquea el proceso ~1 s por cada 150k asignaciones vivas
+        if TOP_SITES <= 0 or current <= self._snapshot_current * SNAPSHOT_GROWTH:
+            return
+        self._snapshot_current = current
+        stats = tracemalloc.take_snapshot().statistics("lineno")
+        self.top_sites = [
+            {
+                "site": f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                "sizeBytes": stat.size,
+                "count": stat.count,
+            }
+            for stat in stats
+            if stat.traceback[0].filename not in _IGNORED_FILES
+        ][:TOP_SITES]
+        self.top_at = {"stage": label, "currentBytes": current}
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._token is None:
+            return False
+        global _started_here
+        try:
+            self.checkpoint("end")
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, peak)
+            self.report = {
+                "name": self.name,
+                "elapsed": round(time.time() - self._start, 4),
+                "baselineBytes": self.baseline,
+                "peakBytes": self.peak,
+                "peakDeltaBytes": self.peak - self.baseline,
+                "endBytes": current,
+                "rssMaxBytes": _rss_max_bytes(),
+                "concurrentRuns": len(_active) - 1,
+                "topSitesAt": self.top_at,
+                "topSites": self.top_sites,
+            }
+        finally:
+            _active.remove(self)
+            _current.reset(self._token)
+            if not _active and _started_here:
+                tracemalloc.stop()
+                _started_here = False
+        return False
+
+
+def checkpoint(label: str):
+    """Registra el punto actual como posible pico de la medición en curso, si la hay."""
+    tracker = _current.get()
+    if tracker is not None:
+        tracker.checkpoint(label)
+
+
+def tracked(name: str):
+    """Decorador: mide la corrutina y agrega el reporte como 'memory' si devuelve un dict."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            client = kwargs.get("client", args[0] if args and isinstance(args[0], str) else None)
+            tracker = track(name, enabled_for(client))
+            async with tracker:
+                result = await fn(*args, **kwargs)
+            if tracker.report is not None and isinstance(result, dict):
+                result["memory"] = tracker.report
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,241 @@
+"""Métricas en proceso (contadores e histogramas) en formato de texto de Prometheus.
+
+Implementación mínima sin dependencias: cada observación es una búsqueda en un
+diccionario bajo un lock, para que instrumentar los caminos calientes no tenga
+costo apreciable. Se exponen en GET /metrics.
+"""
+import re
+import time
+import bisect
+import threading
+import httpx
+from utils import tracing
+
+_lock = threading.Lock()
+_INF = 'le="+Inf"'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+SIZE_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_labels_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        idx = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            if idx < len(self.buckets):
+                entry[0][idx] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, _INF)} {count}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+_registry = []
+
+
+def counter(name, help, labelnames=()) -> Counter:
+    metric = Counter(name, help, labelnames)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    metric = Histogram(name, help, labelnames, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Métricas del servicio ---
+
+WOO_REQUESTS = counter(
+    "woo_requests_total", "Peticiones a la API REST de WooCommerce", ("store", "endpoint", "method", "status"))
+WOO_LATENCY = histogram(
+    "woo_request_seconds", "Latencia de peticiones a WooCommerce", ("store", "endpoint", "method"))
+SOAP_REQUESTS = counter(
+    "soap_requests_total", "Llamadas SOAP a SIRETT", ("host", "operation", "status"))
+SOAP_LATENCY = histogram(
+    "soap_request_seconds", "Latencia de llamadas SOAP (incluye carga del WSDL como operation=wsdl)",
+    ("host", "operation"))
+DB_STATEMENTS = counter(
+    "db_statements_total", "Sentencias ejecutadas en la BD", ("statement", "status"))
+DB_LATENCY = histogram(
+    "db_statement_seconds", "Latencia de sentencias de BD por procedimiento o tabla", ("statement",))
+SYNC_CATALOG_SIZE = histogram(
+    "sync_catalog_items", "Productos considerados por corrida", ("kind",), SIZE_BUCKETS)
+SYNC_DIFF_SIZE = histogram(
+    "sync_diff_items", "Productos con diferencias por corrida", ("kind",), SIZE_BUCKETS)
+SYNC_WRITES = counter(
+    "sync_writes_total", "Escrituras de productos a WooCommerce", ("client", "kind", "op", "result"))
+JOB_DURATION = histogram(
+    "job_duration_seconds", "Duración de trabajos en segundo plano", ("kind", "status"))
+SCHEDULER_WAIT = histogram(
+    "scheduler_queue_wait_seconds", "Espera en cola del planificador", ("client", "kind"))
+EVENT_LOOP_LAG = histogram(
+    "event_loop_lag_seconds", "Retraso del event loop respecto al intervalo de muestreo", (), LAG_BUCKETS)
+
+
+# --- Instrumentación de httpx para WooCommerce ---
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def endpoint_label(path: str) -> str:
+    """'/wp-json/wc/v3/products/123' -> 'wc/v3/products/{id}'."""
+    path = path.split("/wp-json/", 1)[-1]
+    return _ID_SEGMENT.sub("/{id}", "/" + path.strip("/")).lstrip("/")
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Transporte httpx que registra conteo y latencia de cada petición a una tienda."""
+
+    def __init__(self, store: str, inner: httpx.AsyncBaseTransport = None):
+        self.store = store
+        self.inner = inner or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = endpoint_label(request.url.path)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = await self.inner.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            end = time.perf_counter()
+            WOO_LATENCY.observe(end - start, store=self.store, endpoint=endpoint, method=request.method)
+            WOO_REQUESTS.inc(store=self.store, endpoint=endpoint, method=request.method, status=status)
+            tracing.add(f"woo {request.method} {endpoint}", "http", start, end, status=status)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+# --- Instrumentación de SQLAlchemy ---
+
+_STATEMENT_RE = re.compile(
+    r"^\s*(?:(CALL)\s+(\w+)|(SELECT)\b.*?\bFROM\s+(\w+)|(INSERT)\s+INTO\s+(\w+)|(UPDATE)\s+(\w+)"
+    r"|(DELETE)\s+FROM\s+(\w+)|(TRUNCATE)\s+TABLE\s+(\w+)|(\w+))",
+    re.IGNORECASE | re.DOTALL,
+)
+_statement_labels = {}
+
+
+def statement_label(sql: str) -> str:
+    """Etiqueta corta: 'CALL getChangedProds', 'SELECT productos', ..."""
+    label = _statement_labels.get(sql)
+    if label is None:
+        m = _STATEMENT_RE.match(sql)
+        if m:
+            groups = [g for g in m.groups() if g]
+            label = " ".join([groups[0].upper()] + groups[1:2])
+        else:
+            label = "other"
+        if len(_statement_labels) < 1000:
+            _statement_labels[sql] = label
+    return label
+
+
+def instrument_engine(sync_engine):
+    """Registra conteo y latencia de cada sentencia ejecutada por el engine."""
+    from sqlalchemy import event
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["_metrics_start"].pop()
+        end = time.perf_counter()
+        label = statement_label(statement)
+        DB_LATENCY.observe(end - start, statement=label)
+        DB_STATEMENTS.inc(statement=label, status="ok")
+        tracing.add(f"db {label}", "db", start, end)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        stack = context.connection.info.get("_metrics_start") if context.connection is not None else None
+        if stack:
+            stack.pop()
+        DB_STATEMENTS.inc(statement=statement_label(context.statement or ""), status="error")
@@ -0,0 +1,345 @@
+"""Perfilado bajo demanda de peticiones y trabajos, sin redesplegar.
+
+Se activa por petición con el header `X-Profile: sample|cprofile` junto con
+`X-Profile-Token` igual a PROFILE_TOKEN (sin PROFILE_TOKEN definido el header
+se ignora, y /profiles responde 403), o por cliente con la clave "profile" en
+CLIENTS_API_JSON / SOAP_CREDENTIALS_JSON, que perfila todos sus trabajos,
+corridas batch y peticiones a rutas con ese cliente.
+
+Modos:
+  - sample: muestreo de pilas cada PROFILE_SAMPLE_INTERVAL segundos del hilo
+    del event loop y de los hilos de asyncio.to_thread (zeep, SQLite). Costo
+    bajo; genera pilas colapsadas listas para flamegraph.pl o speedscope.
+  - cprofile: perfilador determinista de la biblioteca estándar sobre el hilo
+    del event loop. Más preciso por función pero más caro; genera .pstats y
+    un resumen de texto. Solo puede correr uno a la vez.
+
+Ambos modos observan el proceso completo durante la ventana perfilada, así
+que otras peticiones concurrentes también aparecen en el resultado. Como
+máximo corren PROFILE_MAX_CONCURRENT perfiles a la vez; si no hay cupo la
+petición o el trabajo se ejecuta sin perfilar.
+"""
+import os
+import io
+import sys
+import json
+import hmac
+import time
+import pstats
+import asyncio
+import cProfile
+import threading
+import contextvars
+from collections import Counter
+from utils.logs import get_logger
+
+ENABLED = os.getenv("PROFILING_ENABLED", "1") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+# Perfiles conservados en disco
+KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+# El muestreo se detiene solo pasado este tiempo para acotar memoria
+MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "900"))
+TOKEN = os.getenv("PROFILE_TOKEN", "")
+
+MODES = ("sample", "cprofile")
+# Extensión del archivo principal de cada modo
+FORMATS = {"sample": "collapsed", "cprofile": "pstats"}
+MAX_STACK_DEPTH = 128
+
+log = get_logger("profiling")
+
+_current = contextvars.ContextVar("profile", default=None)
+_lock = threading.Lock()
+_running = 0
+_cprofile_running = False
+
+
+def _load_client_modes() -> dict:
+    modes = {}
+    for var in ("SOAP_CREDENTIALS_JSON", "CLIENTS_API_JSON"):
+        try:
+            entries = json.loads(os.getenv(var, "[]"))
+        except json.JSONDecodeError:
+            entries = []
+        for entry in entries:
+            mode = _normalize(entry.get("profile"))
+            if entry.get("client") and mode:
+                modes[entry["client"]] = mode
+    return modes
+
+
+def _normalize(value):
+    if value is True:
+        return "sample"
+    if not isinstance(value, str):
+        return None
+    value = value.strip().lower()
+    if value in ("1", "true", "yes", "on"):
+        return "sample"
+    return value if value in MODES else None
+
+
+_client_modes = _load_client_modes()
+
+
+def client_mode(client: str):
+    """Modo configurado para el cliente, o None."""
+    return _client_modes.get(client)
+
+
+def authorized(headers) -> bool:
+    """Si la petición trae el token de perfilado (nunca, si PROFILE_TOKEN no está definido)."""
+    return bool(TOKEN) and hmac.compare_digest(headers.get("x-profile-token", ""), TOKEN)
+
+
+def request_mode(headers):
+    """Modo pedido por header, solo con el token de perfilado."""
+    mode = _normalize(headers.get("x-profile"))
+    return mode if mode and authorized(headers) else None
+
+
+def path_mode(path: str):
+    """Modo del primer cliente configurado que aparezca como segmento de la ruta."""
+    if not _client_modes:
+        return None
+    for segment in path.split("/"):
+        mode = _client_modes.get(segment)
+        if mode:
+            return mode
+    return None
+
+
+def _acquire(mode: str) -> bool:
+    global _running, _cprofile_running
+    with _lock:
+        if _running >= MAX_CONCURRENT:
+            return False
+        if mode == "cprofile":
+            # cProfile instala un único hook por hilo: dos a la vez se pisan
+            if _cprofile_running:
+                return False
+            _cprofile_running = True
+        _running += 1
+        return True
+
+
+def _release(mode: str):
+    global _running, _cprofile_running
+    with _lock:
+        _running -= 1
+        if mode == "cprofile":
+            _cprofile_running = False
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _fold(thread_name: str, frame) -> str:
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ";".join(reversed(stack))
+
+
+class _Sampler(threading.Thread):
+    """Toma muestras de pila del hilo del event loop y de los hilos de asyncio."""
+
+    def __init__(self, loop_thread: int):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.loop_thread = loop_thread
+        self.stacks = Counter()
+        self.samples = 0
+        self._done = threading.Event()
+        self._names = {}
+
+    def _thread_name(self, ident: int):
+        name = self._names.get(ident)
+        if name is None:
+            self._names = {t.ident: t.name for t in threading.enumerate()}
+            name = self._names.get(ident, "")
+        return name
+
+    def run(self):
+        deadline = time.monotonic() + MAX_SECONDS
+        while not self._done.wait(SAMPLE_INTERVAL) and time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == self.loop_thread:
+                    name = "event_loop"
+                else:
+                    # Solo los hilos de asyncio.to_thread ("asyncio_0", ...)
+                    name = self._thread_name(ident)
+                    if not name.startswith("asyncio"):
+                        continue
+                self.stacks[_fold(name, frame)] += 1
+            self.samples += 1
+
+    def stop_sampling(self):
+        self._done.set()
+
+
+def _safe_id(profile_id: str) -> str:
+    return "".join(c for c in profile_id if c.isalnum() or c in "-_.")
+
+
+def profile_path(profile_id: str, fmt: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{_safe_id(profile_id)}.{fmt}")
+
+
+class profile:
+    """Perfila el bloque `async with` si hay modo y cupo; si no, no hace nada.
+
+    Tras salir, `profile_id` indica si se guardó un perfil.
+    """
+
+    def __init__(self, profile_id: str, mode: str = None, **meta):
+        self.requested_id = profile_id
+        self.mode = _normalize(mode)
+        self.meta = meta
+        self.profile_id = None
+        self._profiler = None
+        self._sampler = None
+        self._token = None
+        self._discarded = False
+
+    async def __aenter__(self):
+        if not ENABLED or self.mode is None or _current.get() is not None:
+            return self
+        if not _acquire(self.mode):
+            log.warning("Sin cupo para perfilar; se ejecuta sin perfil", extra={"profileId": self.requested_id})
+            return self
+        self._token = _current.set(self)
+        self._start = time.time()
+        if self.mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._sampler = _Sampler(threading.get_ident())
+            self._sampler.start()
+        return self
+
+    def _halt(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+        else:
+            self._sampler.stop_sampling()
+
+    def discard(self):
+        """Detiene el perfil sin guardarlo y libera su cupo."""
+        if self._token is None or self._discarded:
+            return
+        self._discarded = True
+        self._halt()
+        _release(self.mode)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._token is None:
+            return False
+        _current.reset(self._token)
+        if self._discarded:
+            return False
+        elapsed = time.time() - self._start
+        try:
+            self._halt()
+            if self._sampler is not None:
+                await asyncio.to_thread(self._sampler.join)
+        finally:
+            _release(self.mode)
+        meta = {
+            "profileId": self.requested_id,
+            "mode": self.mode,
+            "startedAt": self._start,
+            "elapsed": round(elapsed, 4),
+            "error": exc_type.__name__ if exc_type else None,
+            **self.meta,
+        }
+        try:
+            await asyncio.to_thread(_save, self.requested_id, meta, self._profiler, self._sampler)
+            self.profile_id = self.requested_id
+        except Exception as e:
+            log.error("No se pudo guardar el perfil", extra={"profileId": self.requested_id, "error": str(e)})
+        return False
+
+
+def discard_current():
+    """Descarta el perfil activo en este contexto, si lo hay.
+
+    Lo usan los endpoints que solo encolan un trabajo: el perfil útil es el del
+    trabajo, y el de la petición ocuparía un cupo sin aportar nada.
+    """
+    prof = _current.get()
+    if prof is not None:
+        prof.discard()
+
+
+def _save(profile_id: str, meta: dict, profiler, sampler):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    if profiler is not None:
+        profiler.dump_stats(profile_path(profile_id, "pstats"))
+        buf = io.StringIO()
+        pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(80)
+        with open(profile_path(profile_id, "txt"), "w") as f:
+            f.write(buf.getvalue())
+    else:
+        meta["samples"] = sampler.samples
+        meta["sampleInterval"] = SAMPLE_INTERVAL
+        with open(profile_path(profile_id, "collapsed"), "w") as f:
+            for stack, count in sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+    # El JSON de metadatos se escribe al final: marca el perfil como completo
+    with open(profile_path(profile_id, "json"), "w") as f:
+        json.dump(meta, f, ensure_ascii=False, default=str)
+    _prune()
+
+
+def _prune():
+    metas = sorted(
+        (f for f in os.listdir(PROFILE_DIR) if f.endswith(".json")),
+        key=lambda f: os.path.getmtime(os.path.join(PROFILE_DIR, f)),
+    )
+    stale = {f[:-5] for f in metas[:-KEEP]} if KEEP > 0 else set()
+    if not stale:
+        return
+    for f in os.listdir(PROFILE_DIR):
+        if f.rsplit(".", 1)[0] in stale:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, f))
+            except OSError:
+                pass
+
+
+def get_meta(profile_id: str):
+    path = profile_path(profile_id, "json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def list_profiles(limit: int = 50) -> list:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    entries = []
+    for f in os.listdir(PROFILE_DIR):
+        if f.endswith(".json"):
+            try:
+                with open(os.path.join(PROFILE_DIR, f)) as fh:
+                    entries.append(json.load(fh))
+            except (OSError, ValueError):
+                continue
+    entries.sort(key=lambda e: e.get("startedAt", 0), reverse=True)
+    return entries[:limit]
+
+
+def stats() -> dict:
+    return {
+        "enabled": ENABLED,
+        "running": _running,
+        "maxConcurrent": MAX_CONCURRENT,
+        "clients": dict(_client_modes),
+    }
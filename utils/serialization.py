@@ -0,0 +1,162 @@
+"""Serialización rápida de las respuestas de catálogo.
+
+Con response_model, FastAPI valida cada Product de /items e /inventory y lo
+vuelve a serializar en cada respuesta; con 20k productos eso domina la CPU y
+los datos ya los armamos nosotros (getProds, _filter_products). render() toma
+el payload y escribe los bytes JSON directamente:
+
+  - los campos de primer nivel son los del modelo (con sus valores por
+    defecto), en el mismo orden que model_dump_json;
+  - cada producto se reduce a los campos de Product y se normalizan precio
+    (float) y stock (int), que es lo que hacía la validación (un precio no
+    numérico, como el "" de WooCommerce, sale como null);
+  - se codifica con orjson si está instalado, o con json de la biblioteca
+    estándar, corrigiendo lo que json escribe distinto (notación científica
+    como 1e+20 o 1e-05, y NaN/Infinity, que no son JSON válido) para que los
+    bytes sean los mismos que con orjson y pydantic.
+
+El esquema OpenAPI no cambia: los endpoints conservan su response_model.
+RESPONSE_VALIDATION_STRICT=1 vuelve a validar todo con pydantic (depuración:
+un payload mal formado falla con el error de validación en lugar de salir
+tal cual).
+"""
+import os
+import re
+import json
+import typing
+import datetime
+from decimal import Decimal, InvalidOperation
+from schemas import Product
+
+try:
+    import orjson
+except ImportError:  # opcional: más rápido que json
+    orjson = None
+
+STRICT = os.getenv("RESPONSE_VALIDATION_STRICT", "0") == "1"
+
+PRODUCT_FIELDS = tuple(Product.model_fields)
+
+
+def _default(value):
+    # Mismo formato que pydantic para tipos fuera de JSON (campos Any)
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(value) -> bytes:
+        return orjson.dumps(value, default=_default, option=_OPTIONS)
+else:
+    # repr escribe en notación científica fuera de [1e-4, 1e16) y con exponente de dos
+    # cifras (1e+20, 1e-07); orjson y pydantic (ryu), desde 1e-5 y sin relleno (1e20,
+    # 1e-7, 0.00001). NaN/Infinity van como null. Las cadenas se dejan igual.
+    _TOKENS = re.compile(rb'"(?:[^"\\]|\\.)*"|(?<![\d.])(-?)(\d)(?:\.(\d+))?e([+-])0*(\d+)|-?Infinity|NaN')
+    _NEEDS_FIX = re.compile(rb"\de[+-]|NaN|Infinity")
+
+    def _fix(match):
+        token = match.group(0)
+        if token[:1] == b'"':
+            return token
+        if match.group(2) is None:
+            return b"null"
+        sign, digit, fraction, exp_sign, exponent = match.groups(b"")
+        if exp_sign == b"-" and exponent == b"5":
+            return sign + b"0.0000" + digit + fraction
+        return (sign + digit + (b"." + fraction if fraction else b"")
+                + b"e" + (b"-" if exp_sign == b"-" else b"") + exponent)
+
+    def dumps(value) -> bytes:
+        out = json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+        return _TOKENS.sub(_fix, out) if _NEEDS_FIX.search(out) else out
+
+
+def _number(value, kind):
+    try:
+        return kind(Decimal(str(value))) if kind is int else kind(value)
+    except (TypeError, ValueError, InvalidOperation):
+        # WooCommerce devuelve "" como precio sin valor
+        return None
+
+
+def shape_products(items: list) -> list:
+    """Productos reducidos a los campos de Product, con precio y stock numéricos.
+
+    Escrito a mano (sin recorrer PRODUCT_FIELDS por ítem) porque es el bucle
+    caliente de las respuestas grandes.
+    """
+    out = []
+    append = out.append
+    for item in items:
+        get = item.get
+        sku = get("sku")
+        if sku is None:
+            raise ValueError("Producto sin sku")
+        precio = get("precio")
+        if precio is not None and precio.__class__ is not float:
+            precio = _number(precio, float)
+        stock = get("stock")
+        if stock is not None and stock.__class__ is not int:
+            stock = _number(stock, int)
+        append({
+            "sku": sku,
+            "nombre": get("nombre"),
+            "precio": precio,
+            "stock": stock,
+            "categoria": get("categoria"),
+            "categoriaWpId": get("categoriaWpId"),
+            "image": get("image"),
+            "imageName": get("imageName"),
+        })
+    return out
+
+
+# shape_products debe seguir a Product si se le agregan campos
+assert PRODUCT_FIELDS == ("sku", "nombre", "precio", "stock", "categoria", "categoriaWpId", "image", "imageName")
+
+
+def _product_lists(model) -> tuple:
+    """Campos del modelo declarados como List[Product]."""
+    return tuple(
+        name for name, field in model.model_fields.items()
+        if typing.get_origin(field.annotation) is list and typing.get_args(field.annotation) == (Product,)
+    )
+
+
+_lists_cache = {}
+
+
+def render(model, payload: dict, exclude: tuple = ()) -> bytes:
+    """Bytes JSON de `payload` con la forma de `model`, sin validar salvo en modo estricto."""
+    if STRICT:
+        return model.model_validate(payload).model_dump_json(exclude=set(exclude)).encode()
+    lists = _lists_cache.get(model)
+    if lists is None:
+        lists = _lists_cache[model] = _product_lists(model)
+    data = {}
+    for name, field in model.model_fields.items():
+        if name in exclude:
+            continue
+        value = payload.get(name) if field.is_required() else payload.get(name, field.get_default())
+        if name in lists and value is not None:
+            value = shape_products(value)
+        data[name] = value
+    return dumps(data)
+
+
+def product_lines(items: list) -> bytes:
+    """Bloque NDJSON con un producto por línea."""
+    if STRICT:
+        lines = [Product.model_validate(item).model_dump_json().encode() for item in items]
+    else:
+        lines = [dumps(record) for record in shape_products(items)]
+    return b"\n".join(lines) + b"\n" if lines else b""
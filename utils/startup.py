@@ -0,0 +1,46 @@
+"""Tiempos de arranque del worker: importaciones y warm-up.
+
+Las dependencias pesadas de un solo tipo de proveedor (zeep, lxml y requests
+para SOAP) se importan con lazy_import() la primera vez que se usan, así un
+worker que solo atiende clientes DB no las carga. Cada importación diferida
+registra su duración; main registra la de sus propias importaciones y
+services.warmup la de cada paso del warm-up. stats() lo reúne para
+/startup/stats.
+"""
+import sys
+import time
+import importlib
+
+# módulo -> segundos que tardó su importación
+_imports = {}
+_warmup = {"status": "disabled", "steps": []}
+
+
+def record_import(name: str, seconds: float):
+    _imports[name] = seconds
+
+
+def lazy_import(name: str):
+    """Importa `name` la primera vez que se pide y registra cuánto tardó."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _imports.setdefault(name, time.perf_counter() - start)
+    return module
+
+
+def set_warmup(status: str, steps: list = None, elapsed: float = None):
+    _warmup["status"] = status
+    if steps is not None:
+        _warmup["steps"] = steps
+    if elapsed is not None:
+        _warmup["elapsed"] = elapsed
+
+
+def stats() -> dict:
+    return {
+        "imports": {name: round(seconds, 4) for name, seconds in _imports.items()},
+        "warmup": dict(_warmup),
+    }
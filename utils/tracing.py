@@ -0,0 +1,229 @@
+"""Trazas ligeras por trabajo: spans anidados sobre contextvars, exportables en formato Chrome.
+
+Uso:
+
+    async with tracing.record(trace_id, "sync cliente"):
+        with tracing.span("fetch_remote"):
+            ...
+
+Los spans heredan la traza activa a través de contextvars, por lo que funcionan
+en tareas asyncio hijas y en hilos lanzados con asyncio.to_thread. Cada span
+lleva en sus args su id (spanId) y el del span que lo contiene (parentId), así
+la jerarquía se conserva aunque el hijo corra en otra tarea u otro hilo. Fuera
+de una traza, span() no registra nada y su costo es una lectura de contextvar.
+Cada traza se guarda como JSON en TRACE_DIR y puede abrirse en chrome://tracing
+o en https://ui.perfetto.dev.
+
+Desactivado por defecto, como el resto de los diagnósticos: TRACING_ENABLED=1
+lo activa.
+"""
+import os
+import json
+import time
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import asynccontextmanager
+from utils.logs import get_logger
+
+ENABLED = os.getenv("TRACING_ENABLED", "0") == "1"
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+# Límite de spans por traza para acotar memoria en corridas enormes
+MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "50000"))
+# Trazas conservadas en disco
+KEEP = int(os.getenv("TRACE_KEEP", "200"))
+
+log = get_logger("tracing")
+
+_trace = contextvars.ContextVar("trace", default=None)
+# Span abierto en el contexto actual (padre de los spans que se abran dentro)
+_span = contextvars.ContextVar("span", default=None)
+
+
+class Trace:
+    def __init__(self, trace_id: str, name: str, meta: dict = None):
+        self.trace_id = trace_id
+        self.name = name
+        self.meta = meta or {}
+        self.t0 = time.perf_counter()
+        self.wall_start = time.time()
+        self.events = []
+        self.dropped = 0
+        self._tids = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _tid(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            key, label = id(task), task.get_name()
+        else:
+            key, label = threading.get_ident(), threading.current_thread().name
+        tid = self._tids.get(key)
+        if tid is None:
+            with self._lock:
+                tid = self._tids.setdefault(key, len(self._tids) + 1)
+                self.events.append({
+                    "name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": label},
+                })
+        return tid
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def add(self, name: str, cat: str, start: float, end: float, args: dict):
+        if len(self.events) >= MAX_SPANS:
+            self.dropped += 1
+            return
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": round((start - self.t0) * 1e6, 1),
+            "dur": round((end - start) * 1e6, 1),
+            "pid": 1,
+            "tid": self._tid(),
+        }
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def to_chrome(self) -> dict:
+        return {
+            "traceEvents": [
+                {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": self.name}},
+                *self.events,
+            ],
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "traceId": self.trace_id,
+                "startedAt": self.wall_start,
+                "droppedSpans": self.dropped,
+                **self.meta,
+            },
+        }
+
+
+class span:
+    """Span anidado; se usa como `with` o `async with`."""
+
+    __slots__ = ("name", "cat", "args", "span_id", "_trace", "_token", "_start")
+
+    def __init__(self, name: str, cat: str = "app", **args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.span_id = None
+        self._trace = None
+
+    def __enter__(self):
+        trace = _trace.get()
+        if trace is not None:
+            self._trace = trace
+            self.span_id = trace.next_id()
+            self.args["spanId"] = self.span_id
+            parent = _span.get()
+            if parent is not None and parent._trace is trace:
+                self.args["parentId"] = parent.span_id
+            self._token = _span.set(self)
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        trace = self._trace
+        if trace is not None:
+            if exc_type is not None:
+                self.args["error"] = exc_type.__name__
+            trace.add(self.name, self.cat, self._start, time.perf_counter(), self.args)
+            _span.reset(self._token)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def add(name: str, cat: str, start: float, end: float, **args):
+    """Registra un span ya medido (perf_counter) en la traza activa, si la hay."""
+    trace = _trace.get()
+    if trace is not None:
+        parent = _span.get()
+        if parent is not None and parent._trace is trace:
+            args["parentId"] = parent.span_id
+        trace.add(name, cat, start, end, args)
+
+
+def active() -> bool:
+    return _trace.get() is not None
+
+
+def current_trace():
+    return _trace.get()
+
+
+def _prune():
+    files = sorted(
+        (os.path.join(TRACE_DIR, f) for f in os.listdir(TRACE_DIR) if f.endswith(".json")),
+        key=os.path.getmtime,
+    )
+    for path in files[:-KEEP] if KEEP > 0 else []:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _save(trace: Trace):
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    path = trace_path(trace.trace_id)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(trace.to_chrome(), f, ensure_ascii=False, separators=(",", ":"), default=str)
+    os.replace(tmp, path)
+    _prune()
+
+
+def trace_path(trace_id: str) -> str:
+    safe = "".join(c for c in trace_id if c.isalnum() or c in "-_.")
+    return os.path.join(TRACE_DIR, f"{safe}.json")
+
+
+@asynccontextmanager
+async def record(trace_id: str, name: str, **meta):
+    """Abre una traza para el bloque y la guarda en disco al terminar."""
+    if not ENABLED or _trace.get() is not None:
+        yield None
+        return
+    trace = Trace(trace_id, name, meta)
+    token = _trace.set(trace)
+    try:
+        with span(name, cat="job"):
+            yield trace
+    finally:
+        _trace.reset(token)
+        try:
+            await asyncio.to_thread(_save, trace)
+        except Exception as e:
+            log.error("No se pudo guardar la traza", extra={"traceId": trace_id, "error": str(e)})
+
+
+def list_traces(limit: int = 50) -> list:
+    if not os.path.isdir(TRACE_DIR):
+        return []
+    entries = []
+    for f in os.listdir(TRACE_DIR):
+        if f.endswith(".json"):
+            path = os.path.join(TRACE_DIR, f)
+            entries.append({
+                "traceId": f[:-5],
+                "modifiedAt": os.path.getmtime(path),
+                "bytes": os.path.getsize(path),
+            })
+    entries.sort(key=lambda e: e["modifiedAt"], reverse=True)
+    return entries[:limit]
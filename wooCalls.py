@@ -2,6 +2,33 @@
 import asyncio
 import httpx
 from typing import Optional
+from urllib.parse import urlparse
+from utils.metrics import InstrumentedTransport
+
+# Clientes httpx compartidos por (tienda, timeout, event loop): las conexiones y
+# el TLS se reutilizan entre llamadas y el warm-up puede dejarlas abiertas
+_shared_clients = {}
+
+
+class _Borrowed:
+    """Contexto que entrega un cliente compartido sin cerrarlo al salir."""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+
+    async def __aenter__(self) -> httpx.AsyncClient:
+        return self.client
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+async def close_clients():
+    """Cierra los clientes compartidos del event loop actual (apagado de la API)."""
+    loop = asyncio.get_running_loop()
+    for key in [k for k in _shared_clients if k[2] is loop]:
+        await _shared_clients.pop(key).aclose()
+
 
 class WooCommerceAPI:
 
@@ -16,6 +43,27 @@ class WooCommerceAPI:
         self.base_url = url.rstrip("/")
         self.auth = (consumer_key, consumer_secret)
         self.timeout = timeout
+        self.store = urlparse(self.base_url).netloc or self.base_url
+
+    def _client(self) -> _Borrowed:
+        """Cliente httpx compartido de la tienda, con métricas por tienda y endpoint."""
+        loop = asyncio.get_running_loop()
+        key = (self.store, self.timeout, loop)
+        client = _shared_clients.get(key)
+        if client is None or client.is_closed:
+            # Descartar los de loops ya cerrados (asyncio.run sucesivos en scripts)
+            for stale in [k for k in _shared_clients if k[2].is_closed()]:
+                del _shared_clients[stale]
+            client = _shared_clients[key] = httpx.AsyncClient(
+                timeout=self.timeout, transport=InstrumentedTransport(self.store))
+        return _Borrowed(client)
+
+    async def ping(self):
+        """Petición mínima autenticada: abre (y deja en el pool) la conexión con la tienda."""
+        url = f"{self.base_url}/wp-json/wc/v3/products"
+        async with self._client() as client:
+            response = await client.get(url, auth=self.auth, params={"per_page": 1, "_fields": "id"})
+            response.raise_for_status()
 
     async def _fetch_with_retries(self, client, url, auth, params, retries=3, delay=1):
         for attempt in range(retries):
@@ -30,27 +78,45 @@ class WooCommerceAPI:
 
     async def get_all_products(self, per_page: int = 50, delay: float = 0.3, max_pages: Optional[int] = None) -> list:
         """Recupera productos paginadamente con retries y sleep opcional."""
-        url = f"{self.base_url}/wp-json/wc/v3/products"
         filtered_data = []
+        async for products in self.iter_product_pages(per_page, delay, max_pages):
+            filtered_data.extend(products)
+        return filtered_data
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            first_page = await self._fetch_with_retries(client, url, self.auth, {"page": 1, "per_page": per_page})
-            raw_data = first_page.json()
-            filtered_data.extend(self._filter_products(raw_data))
+    async def get_all_pages_raw(self, per_page: int = 50, delay: float = 0.3, max_pages: Optional[int] = None) -> list:
+        """Como get_all_products, pero con el cuerpo JSON de cada página sin parsear (para services.catalog_diff)."""
+        return [page async for page in self.iter_product_pages(per_page, delay, max_pages, raw=True)]
+
+    async def iter_product_pages(self, per_page: int = 50, delay: float = 0.3, max_pages: Optional[int] = None,
+                                 raw: bool = False):
+        """Igual que get_all_products, pero entrega cada página filtrada apenas llega (o sus bytes, con raw)."""
+        url = f"{self.base_url}/wp-json/wc/v3/products"
 
+        async with self._client() as client:
+            first_page = await self._fetch_with_retries(client, url, self.auth, {"page": 1, "per_page": per_page})
             total_pages = int(first_page.headers.get("X-WP-TotalPages", 1))
             if max_pages:
                 total_pages = min(total_pages, max_pages)
+            yield first_page.content if raw else self._filter_products(first_page.json())
 
             for page in range(2, total_pages + 1):
                 await asyncio.sleep(delay)
                 resp = await self._fetch_with_retries(client, url, self.auth, {"page": page, "per_page": per_page})
-                raw_data = resp.json()
-                filtered_data.extend(self._filter_products(raw_data))
+                yield resp.content if raw else self._filter_products(resp.json())
 
-        return filtered_data
+    async def get_products_page(self, page: int, per_page: int = 100, params: Optional[dict] = None) -> tuple:
+        """Una página de productos con filtros de la API (category, stock_status, modified_after...).
+
+        Devuelve (productos filtrados, total de páginas).
+        """
+        url = f"{self.base_url}/wp-json/wc/v3/products"
+        query = {"page": page, "per_page": per_page, "orderby": "id", "order": "asc", **(params or {})}
+        async with self._client() as client:
+            resp = await self._fetch_with_retries(client, url, self.auth, query)
+        return self._filter_products(resp.json()), int(resp.headers.get("X-WP-TotalPages", 1))
 
-    def _filter_products(self, raw_data):
+    @staticmethod
+    def _filter_products(raw_data):
         products = []
         for product in raw_data:
             categoria = (
@@ -80,9 +146,20 @@ class WooCommerceAPI:
             })
         return products
 
+    async def find_by_sku(self, sku: str) -> list:
+        """Busca productos por SKU exacto."""
+        async with self._client() as client:
+            resp = await client.get(
+                f"{self.base_url}/wp-json/wc/v3/products",
+                auth=self.auth,
+                params={"sku": sku}
+            )
+            resp.raise_for_status()
+            return resp.json() or []
+
     async def update_product(self, product_sku: int, data: dict) -> dict:
         """Actualiza un producto existente por su ID."""
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+        async with self._client() as client:
             resp = await client.put(
                 f"{self.base_url}/wp-json/wc/v3/products/{product_sku}",
                 auth=self.auth,
@@ -93,7 +170,7 @@ class WooCommerceAPI:
 
     async def create_product(self, data: dict) -> dict:
         """Crea un nuevo producto."""
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+        async with self._client() as client:
             resp = await client.post(
                 f"{self.base_url}/wp-json/wc/v3/products",
                 auth=self.auth,
@@ -104,7 +181,7 @@ class WooCommerceAPI:
 
     async def get_or_create_category(self, category_name: str, parent: int = None) -> int:
         """Obtiene el ID de una categoría por nombre, o la crea si no existe."""
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+        async with self._client() as client:
             # Buscar categorías existentes por nombre (puede devolver varias)
             resp = await client.get(
                 f"{self.base_url}/wp-json/wc/v3/products/categories",
@@ -126,3 +203,18 @@ class WooCommerceAPI:
             )
             resp.raise_for_status()
             return resp.json().get("id")
+
+    async def upload_media(self, content: bytes, filename: str, content_type: str, auth: tuple) -> dict:
+        """Sube un archivo a la biblioteca de medios de WordPress (requiere usuario y application password)."""
+        async with self._client() as client:
+            resp = await client.post(
+                f"{self.base_url}/wp-json/wp/v2/media",
+                auth=auth,
+                content=content,
+                headers={
+                    "Content-Disposition": f'attachment; filename="{filename}"',
+                    "Content-Type": content_type,
+                }
+            )
+            resp.raise_for_status()
+            return resp.json()